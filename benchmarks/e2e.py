@@ -0,0 +1,136 @@
+"""Run every command end to end against the local stand-ins and report the wall time and the requests served."""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks import synthetic
+from lib import daemon, rate_limit
+from lib.report import FORMATS, open_report, plain_row, read_report
+from benchmarks.standin import Faults, StandinServer
+
+AREA = '41,1,42,2'
+REGEX_RULES = [{'find': '^Plaza ', 'replace': 'Plaça '}, {'find': '^Avenida (.+)$', 'replace': 'Avinguda \\1'},
+               {'find': '^Calle (.+)$', 'replace': 'Carrer \\1'}, {'find': '^Calle ', 'replace': 'Carrièra ', 'lang': 'oc'}]
+
+
+def command_runs(workdir: str, report_format='csv') -> list:
+    passwordfile = os.path.join(workdir, 'passwordfile')
+    report = os.path.join(workdir, 'report.' + report_format)
+    login = ['--passwordfile', passwordfile]
+    memory = ['--memory', os.path.join(workdir, 'memory.sqlite')]
+    osc_file = os.path.join(workdir, 'edits.osc')
+    return [
+        ('write_osm_objects_report', ['name:oc', '--area', AREA, '--lang', 'ca', '--output', report, '--output-format', report_format,
+                                      '--metrics', os.path.join(workdir, 'metrics.json')]),
+        ('update_osm_objects_from_report', ['name:oc', '--input-file', report, '--input-format', report_format, '--confirmed-edits', '--no-interaction'] + login),
+        ('fill_empty_name', ['--area', AREA, '--lang', 'ca'] + login),
+        ('fill_empty_name', ['--area', AREA, '--lang', 'ca', '--export-osc', osc_file]),
+        ('upload_osc', [osc_file, '--batch', '20', '--no-interaction'] + login),
+        ('fill_empty_name_lang', ['--area', AREA, '--lang', 'ca'] + login),
+        ('regex_name_lang', ['--area', AREA, '--lang', 'ca', '--find', '^Calle ', '--replace', 'Carrer '] + login),
+        ('regex_name_lang', ['--area', AREA, '--lang', 'ca', '--rules', os.path.join(workdir, 'regex_rules.json')] + login),
+        ('translate_with_wikidata', ['--area', AREA, '--lang', 'ca', '--remember-answers', '--metrics', os.path.join(workdir, 'metrics.prom')]
+         + memory + login),
+        ('translate_with_wikidata', ['--area', AREA, '--lang', 'ca', '--remember-answers', '--streaming', '--tiles', '4'] + memory + login),
+        ('fill_wikidata_from_wikipedia', ['--area', AREA] + login),
+        ('fill_wikidata_from_name', ['--area', AREA, '--lang', 'es', '--cache', os.path.join(workdir, 'reconcile.json')] + login),
+        ('fill_wikipedia_from_wikidata', ['--area', AREA, '--lang', 'ca'] + login),
+        ('coverage_stats', ['--area', AREA, '--area', '41,1,41.5,1.5', '--area', 'Le Canigou', '--lang', 'ca', '--tiles', '4',
+                            '--cache', os.path.join(workdir, 'coverage.json'), '--output', os.path.join(workdir, 'coverage.tsv')]),
+    ]
+
+
+def edit_report(file: str, report_format: str):
+    """Fill «name:oc» in every second row of the report, as a user would do before update_osm_objects_from_report."""
+    data = read_report(file, file_format=report_format)
+    data['name:oc'] = data['name:oc'].astype(object)
+    data.loc[data.index % 2 == 0, 'name:oc'] = data['name:ca']
+    with open_report(file, file_format=report_format, header=list(data.columns), table_name='Edited by e2e') as writer:
+        for row in data.itertuples(index=False, name=None):
+            writer.writerow(plain_row(row, header=list(data.columns), file_format=report_format))
+
+
+def load_command(name: str):
+    module = __import__('src.' + name, fromlist=[name + 'command'])
+    return getattr(module, name + 'command')
+
+
+def run_commands(server: StandinServer, runs: list, objects: int, report_format: str, commands: list, verbose: int):
+    from click.testing import CliRunner
+
+    for name, args in runs:
+        if commands and name not in commands:
+            continue
+        server.dataset = synthetic.Dataset(objects)  # every command starts from the same data
+        if name == 'update_osm_objects_from_report':
+            edit_report(args[args.index('--input-file') + 1], report_format)
+        served = dict(server.requests)
+        start = time.perf_counter()
+        result = CliRunner().invoke(load_command(name), args, input='\n' * (objects * 4))
+        elapsed = time.perf_counter() - start
+        served = {k: v - served[k] for k, v in server.requests.items() if v - served[k]}
+        print(f'{name:<32}{result.exit_code:>6}{elapsed:>10.2f}  {served}')
+        if verbose or result.exception and not isinstance(result.exception, SystemExit):
+            print(result.output[-2000:])
+            if result.exception and not isinstance(result.exception, SystemExit):
+                print(repr(result.exception))
+
+
+@contextlib.contextmanager
+def local_daemon(server: StandinServer, workdir: str, rate_limits: str):
+    """Run a LangToolsOSM daemon pointed to the stand-ins in another process and use it from this one."""
+    socket_path = os.path.join(workdir, 'daemon.sock')
+    env = dict(os.environ, **server.endpoints())
+    process = subprocess.Popen([sys.executable, '-m', 'src.cli', 'daemon', 'start', '--socket', socket_path,
+                                '--rate-limits', rate_limits], env=env, stdout=subprocess.DEVNULL)
+    default_socket, daemon.SOCKET = daemon.SOCKET, socket_path
+    try:
+        for _ in range(100):
+            if daemon.call('ping', timeout=1):
+                break
+            time.sleep(0.05)
+        yield
+    finally:
+        daemon.call('shutdown', timeout=1)
+        process.wait(timeout=10)
+        daemon.SOCKET = default_socket
+
+
+@click.command()
+@click.option('--objects', default=1000, type=int, help='Number of synthetic OSM objects.')
+@click.option('--latency', default=0.0, type=float, help='Seconds added to every response.')
+@click.option('--rate-limit-ratio', default=0.0, type=float, help='Ratio of responses replaced by "429 Too Many Requests".')
+@click.option('--timeout-ratio', default=0.0, type=float, help='Ratio of responses replaced by "504 Gateway Timeout".')
+@click.option('--rate-limits', default='127.0.0.1=0', type=str, help='Rate limits for the stand-ins. Default to no limits.')
+@click.option('--report-format', default='csv', type=click.Choice(FORMATS), help='Format of the report written and updated.')
+@click.option('--command', 'commands', multiple=True, help='Run only these commands. Default to all of them.')
+@click.option('--daemon', 'use_daemon', default=False, is_flag=True, help='Run the commands through a local daemon (see "langtoolsosm daemon").')
+@click.option('--repeat', default=1, type=int, help='Run the commands this number of times (eg. to compare cold and warm runs with --daemon).')
+@click.option('--verbose', '-v', count=True, help='Print the output of the commands.')
+def e2ecommand(objects, latency, rate_limit_ratio, timeout_ratio, rate_limits, report_format, commands, use_daemon, repeat, verbose):
+    """Benchmark the commands end to end against local stand-ins of all the remote services."""
+    faults = {'*': Faults(latency=latency, rate_limit_ratio=rate_limit_ratio, timeout_ratio=timeout_ratio, timeout=1)}
+    with tempfile.TemporaryDirectory() as workdir, StandinServer(synthetic.Dataset(objects), faults=faults) as server:
+        server.configure_lib()
+        rate_limit.configure(rate_limits)
+        with open(os.path.join(workdir, 'passwordfile'), 'w') as f:
+            f.write('standin:password\n')
+        with open(os.path.join(workdir, 'regex_rules.json'), 'w') as f:
+            json.dump(REGEX_RULES, f)
+        stack = contextlib.ExitStack()
+        if use_daemon:
+            stack.enter_context(local_daemon(server, workdir, rate_limits))
+        print(f'{"command":<32}{"exit":>6}{"seconds":>10}  requests')
+        with stack:
+            run_commands(server, command_runs(workdir, report_format=report_format) * repeat, objects=objects,
+                         report_format=report_format, commands=commands, verbose=verbose)
+
+
+if __name__ == '__main__':
+    e2ecommand()
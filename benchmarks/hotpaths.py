@@ -0,0 +1,191 @@
+"""Micro-benchmarks of the library hot paths on synthetic data, with time and peak memory compared to stored baselines."""
+import contextlib
+import csv
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+from benchmarks import synthetic
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+LANG = 'ca'
+
+
+def overpy_result(n: int):
+    import overpy
+    return overpy.Result.from_json(synthetic.overpass_json(n, lang=LANG))
+
+
+def entities(n: int) -> dict:
+    ids = [f'Q{synthetic.FIRST_QID + i}' for i in range(n)]
+    return synthetic.wbgetentities_json(ids, langs=[LANG], props=('labels', 'aliases', 'sitelinks'))['entities']
+
+
+def translations_db(n: int) -> dict:
+    import lib.wikimedia as wikimedia
+    db = wikimedia.translations_from_entities(entities(n), lang=LANG)
+    for i, (key, value) in enumerate(db.items()):
+        value.update({'objects': [{'name': synthetic.entity_name(i), 'type': synthetic.TYPES[i % 3], 'id': i, 'modified': False}],
+                      'answer': {'value': None, 'committed': False}})
+    return db
+
+
+def bench_translations_from_entities(n: int, workdir: str):
+    import lib.wikimedia as wikimedia
+    data = entities(n)
+    return lambda: wikimedia.translations_from_entities(data, lang=LANG)
+
+
+def bench_list_translations(n: int, workdir: str):
+    import lib.wikimedia as wikimedia
+    db = translations_db(n)
+    return lambda: [wikimedia.list_translations(x['translations']) for x in db.values()]
+
+
+def bench_db_item_row(n: int, workdir: str):
+    from src.translate_with_wikidata import db_item_row
+    db = translations_db(n)
+    return lambda: [db_item_row(key, value) for key, value in db.items()]
+
+
+def bench_write_db_csv(n: int, workdir: str):
+    from src.translate_with_wikidata import write_db
+    db = translations_db(n)
+    return lambda: write_db(db, file=os.path.join(workdir, 'db.tsv'), file_format='csv')
+
+
+def bench_write_db_mediawiki(n: int, workdir: str):
+    from src.translate_with_wikidata import write_db
+    db = translations_db(n)
+    return lambda: write_db(db, file=os.path.join(workdir, 'db.mediawiki'), file_format='mediawiki')
+
+
+def bench_report_row(n: int, workdir: str):
+    import lib.wikimedia as wikimedia
+    from src.write_osm_objects_report import report_row
+    result = overpy_result(n)
+    objects = result.nodes + result.ways + result.relations
+    db = wikimedia.translations_from_entities(synthetic.wbgetentities_json(synthetic.wikidata_ids(
+        synthetic.osm_elements(n, lang=LANG)), langs=[LANG])['entities'], lang=LANG)
+    return lambda: [report_row(x, langs=[LANG], output_format='csv', extra_tags=('wikipedia',),
+                               db_wikidata_translations={LANG: db}) for x in objects]
+
+
+def bench_write_report_mediawiki(n: int, workdir: str):
+    from lib.report import open_report
+    header = ['OSMobject', 'typeOSM', 'idOSM', 'name', 'name:' + LANG, 'translations', f'{LANG}.wikipedia_page',
+              'wikidata_id', 'multilang_names', 'all_tags']
+    rows = [['{{' + row[0] + '|' + str(row[1]) + '}}'] + row for row in synthetic.report_rows(n, lang=LANG)]
+
+    def run():
+        with open_report(os.path.join(workdir, 'report.mediawiki'), file_format='mediawiki', header=header) as writer:
+            for row in rows:
+                writer.writerow(row)
+    return run
+
+
+def report_file(n: int, workdir: str) -> str:
+    file = os.path.join(workdir, 'report.tsv')
+    if not os.path.exists(file):
+        with open(file, 'w', newline='') as f:
+            writer = csv.writer(f, dialect='unix', delimiter='\t')
+            writer.writerow(['# synthetic report'])
+            writer.writerow(['typeOSM', 'idOSM', 'name', 'name:' + LANG, 'translations', f'{LANG}.wikipedia_page',
+                             'wikidata_id', 'multilang_names', 'all_tags'])
+            writer.writerows(synthetic.report_rows(n, lang=LANG))
+    return file
+
+
+def bench_read_report(n: int, workdir: str):
+    from lib.report import read_report
+    file = report_file(n, workdir)
+    return lambda: read_report(file, file_format='csv')
+
+
+def bench_iter_report_rows(n: int, workdir: str):
+    from lib.report import iter_report_rows
+    file = report_file(n, workdir)
+    return lambda: sum(1 for row in iter_report_rows(file, file_format='csv', columns=['typeOSM', 'idOSM', 'name:' + LANG],
+                                                     chunk_size=1000))
+
+
+def bench_prediff_report(n: int, workdir: str):
+    from lib.report import prediff_report
+    file = report_file(n, workdir)
+    return lambda: prediff_report(file, file_format='csv', upload_tags=['name:' + LANG], chunk_size=1000)
+
+
+def bench_print_osm_object(n: int, workdir: str):
+    import lib.osm_utils as lt
+    result = overpy_result(n)
+    objects = result.nodes + result.ways + result.relations
+
+    def run():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for osm_object in objects:
+                lt.print_osm_object(osm_object, verbose=1)
+    return run
+
+
+CASES = {name[len('bench_'):]: function for name, function in globals().items() if name.startswith('bench_')}
+
+
+def measure(function, repeat: int) -> dict:
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': round(min(times), 4), 'peak_mb': round(peak / 2 ** 20, 2)}
+
+
+@click.command()
+@click.option('--case', 'cases', multiple=True, type=click.Choice(list(CASES.keys())), help='Run only these cases. Default to all of them.')
+@click.option('--repeat', default=3, type=int, help='Number of timed runs. The best one is reported.')
+@click.option('--save-baseline', default=False, is_flag=True, help='Store the results as the new baselines.')
+@click.option('--size', default=10000, type=int, help='Number of synthetic objects or wikidata entities (up to 1M).')
+@click.option('--tolerance', default=1.25, type=float, help='Maximum ratio to the baseline before reporting a regression.')
+def hotpathscommand(cases, repeat, save_baseline, size, tolerance):
+    """Benchmark the library hot paths and compare them with the stored baselines."""
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    regressions = []
+    print(f'{"case":<28}{"seconds":>10}{"peak MB":>10}{"vs baseline":>24}')
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in cases or CASES.keys():
+            results = measure(CASES[name](size, workdir), repeat=repeat)
+            baseline = baselines.get(name, {}).get(str(size))
+            comparison = ''
+            if baseline:
+                time_ratio = results['seconds'] / baseline['seconds'] if baseline['seconds'] else 1
+                memory_ratio = results['peak_mb'] / baseline['peak_mb'] if baseline['peak_mb'] else 1
+                comparison = f'x{time_ratio:.2f} time, x{memory_ratio:.2f} mem'
+                if time_ratio > tolerance or memory_ratio > tolerance:
+                    regressions.append(name)
+                    comparison = comparison + ' !'
+            print(f'{name:<28}{results["seconds"]:>10}{results["peak_mb"]:>10}{comparison:>24}')
+            baselines.setdefault(name, {})[str(size)] = results
+    if save_baseline:
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if regressions:
+        print(f'Regressions over x{tolerance}: {", ".join(regressions)}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    hotpathscommand()
@@ -0,0 +1,348 @@
+"""Local stand-ins for the Overpass, Wikidata, Wikipedia and OSM 0.6 APIs serving synthetic data.
+
+Start a server and point LangToolsOSM to it with the LANGTOOLSOSM_* environment variables printed by
+``python -m benchmarks.standin`` or, in process, with ``StandinServer.configure_lib()``.
+"""
+import json
+import random
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import quoteattr
+
+import click
+
+from benchmarks import synthetic
+
+SERVICES = ['overpass', 'wikidata', 'wikipedia', 'osm']
+
+
+class Faults:
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit_ratio=0.0, timeout_ratio=0.0, timeout=30.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.timeout_ratio = timeout_ratio
+        self.timeout = timeout
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            roll = self._rng.random()
+        if roll < self.rate_limit_ratio:
+            return delay, 429
+        if roll < self.rate_limit_ratio + self.timeout_ratio:
+            return delay + self.timeout, 504
+        return delay, None
+
+
+def osm_xml(elements, versions) -> str:
+    out = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="LangToolsOSM standin">']
+    for element in elements:
+        key = (element['type'], element['id'])
+        attrs = (f'id="{element["id"]}" visible="true" version="{versions[key]}" changeset="1"'
+                 f' timestamp="2020-01-01T00:00:00Z" user="standin" uid="1"')
+        if element['type'] == 'node':
+            attrs = attrs + f' lat="{element["lat"]}" lon="{element["lon"]}"'
+        out.append(f'<{element["type"]} {attrs}>')
+        if element['type'] == 'way':
+            out.extend(f'<nd ref="{element["id"] * 10 + i}"/>' for i in range(2))
+        elif element['type'] == 'relation':
+            out.append(f'<member type="way" ref="{element["id"] * 10}" role="outer"/>')
+        out.extend(f'<tag k={quoteattr(k)} v={quoteattr(v)}/>' for k, v in element['tags'].items())
+        out.append(f'</{element["type"]}>')
+    out.append('</osm>')
+    return '\n'.join(out)
+
+
+def overpass_meta(elements, versions) -> list:
+    """Overpass JSON «elements» as returned with "out meta": the version of the OSM API stand-in and the geometry of
+    osm_xml."""
+    out = []
+    for element in elements:
+        element = dict(element, version=versions[(element['type'], element['id'])], changeset=1,
+                       timestamp='2020-01-01T00:00:00Z', user='standin', uid=1)
+        if element['type'] == 'way':
+            element['nodes'] = [element['id'] * 10 + i for i in range(2)]
+        elif element['type'] == 'relation':
+            element['members'] = [{'type': 'way', 'ref': element['id'] * 10, 'role': 'outer'}]
+        out.append(element)
+    return out
+
+
+_TOKEN = r"""(?:'([^']*)'|"([^"]*)"|([^\[\]~=!'"]+))"""
+_CLAUSE = re.compile(r'\[(!?)(~?)' + _TOKEN + r'(?:(~|=|!=)' + _TOKEN + r')?\]')
+
+
+def overpass_filter(query: str):
+    """Predicate on the tags for the tag filters of the first statement of an Overpass query (eg. "nwr['name'][!'name:ca']")."""
+    match = re.search(r'(?:nwr|node|way|relation)(\[.*?)\(', query)
+    clauses = []
+    for clause in _CLAUSE.findall(match.group(1) if match else ''):
+        negate, key_regex, operator = clause[0], clause[1], clause[5]
+        clauses.append((negate, key_regex, ''.join(clause[2:5]), operator, ''.join(clause[6:9])))
+
+    def predicate(tags: dict) -> bool:
+        for negate, key_regex, key, operator, value in clauses:
+            if key_regex:
+                found = any(re.search(key, k) and re.search(value, v) for k, v in tags.items())
+            elif operator == '~':
+                found = key in tags and re.search(value, tags[key]) is not None
+            elif operator == '=':
+                found = tags.get(key) == value
+            elif operator == '!=':
+                found = tags.get(key) != value
+            else:
+                found = key in tags
+            if found == bool(negate):
+                return False
+        return True
+    return predicate
+
+
+def overpass_bbox(query: str):
+    """Predicate on the coordinates of the elements for the bounding box of an Overpass query (eg. "(41,1,41.5,1.5)")."""
+    match = re.search(r'\(([0-9.-]+),([0-9.-]+),([0-9.-]+),([0-9.-]+)\)', query)
+    if not match:
+        return lambda element: True
+    south, west, north, east = [float(x) for x in match.groups()]
+
+    def predicate(element: dict) -> bool:
+        coords = element.get('center', element)
+        return south <= coords['lat'] <= north and west <= coords['lon'] <= east
+    return predicate
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server_version = 'LangToolsOSMStandin/0.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _service(self, path: str) -> str:
+        if path.endswith('/interpreter'):
+            return 'overpass'
+        if path.startswith('/api/0.6/'):
+            return 'osm'
+        if path == '/w/api.php':
+            return 'wikidata'
+        return 'wikipedia'
+
+    def _reply(self, status: int, body='', content_type='text/plain; charset=utf-8'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            content_type = 'application/json'
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = b''
+        if 'Content-Length' in self.headers:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+        service = self._service(url.path)
+        self.server.count(service)
+        delay, status = self.server.faults.get(service, self.server.faults['*']).draw()
+        if delay:
+            time.sleep(delay)
+        if status:
+            return self._reply(status, 'Injected failure')
+        try:
+            handler = getattr(self, 'handle_' + service)
+            return handler(method, url.path, params, body)
+        except KeyError as error:
+            return self._reply(404, f'Not found: {error}')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def handle_overpass(self, method, path, params, body):
+        query = params.get('data') or body.decode('utf-8')
+        if 'out count;' in query:  # one count element per statement
+            elements = []
+            for n, statement in enumerate(query.split('out count;')[:-1]):
+                tags, bbox = overpass_filter(statement), overpass_bbox(statement)
+                found = self.server.dataset.overpass_json(lambda element: tags(element['tags']) and bbox(element))['elements']
+                counts = {x + 's': sum(1 for element in found if element['type'] == x) for x in synthetic.TYPES}
+                counts.update({'areas': 0, 'total': len(found)})
+                elements.append({'type': 'count', 'id': n, 'tags': {k: str(v) for k, v in counts.items()}})
+            return self._reply(200, {'version': 0.6, 'generator': 'LangToolsOSM synthetic', 'elements': elements})
+        tags, bbox = overpass_filter(query), overpass_bbox(query)
+        data = self.server.dataset.overpass_json(lambda element: tags(element['tags']) and bbox(element))
+        if 'out meta' in query:
+            data['elements'] = overpass_meta(data['elements'], self.server.dataset.versions)
+        return self._reply(200, data)
+
+    def handle_wikidata(self, method, path, params, body):
+        if params.get('action') == 'wbsearchentities':
+            return self._reply(200, synthetic.wbsearchentities_json(params['search'], limit=int(params.get('limit', 7))))
+        if params.get('action') != 'wbgetentities':
+            return self._reply(200, {'error': {'code': 'badvalue', 'info': 'Unsupported action in the stand-in.'}})
+        props = params.get('props', 'labels|aliases|sitelinks|claims').split('|')
+        langs = params['languages'].split('|') if 'languages' in params else None
+        return self._reply(200, synthetic.wbgetentities_json(params['ids'].split('|'), langs=langs, props=props))
+
+    def handle_wikipedia(self, method, path, params, body):
+        pages = {}
+        for i, title in enumerate(params.get('titles', '').split('|')):
+            match = re.search(r'Lloc ([0-9]+)$', title)
+            if match:
+                pages[str(i + 1)] = {'pageid': i + 1, 'title': title, 'pageprops': {'wikibase_item': 'Q' + match.group(1)}}
+            else:
+                pages[str(-i - 1)] = {'title': title, 'missing': ''}
+        return self._reply(200, {'batchcomplete': '', 'query': {'pages': pages}})
+
+    def handle_osm(self, method, path, params, body):
+        with self.server.dataset_lock:
+            return self._handle_osm(method, path, params, body)
+
+    def _handle_osm(self, method, path, params, body):
+        dataset = self.server.dataset
+        parts = path[len('/api/0.6/'):].strip('/').split('/')
+        if parts[0] in ['nodes', 'ways', 'relations'] and method == 'GET':
+            osm_type = parts[0][:-1]
+            keys = [(osm_type, int(x)) for x in params[parts[0]].split(',')]
+            return self._reply(200, osm_xml([dataset.elements[k] for k in keys], dataset.versions), 'text/xml')
+        if parts[0] == 'changeset':
+            if parts[1] == 'create':
+                changeset = len(dataset.changesets) + 1
+                dataset.changesets[changeset] = 'open'
+                return self._reply(200, str(changeset))
+            changeset = int(parts[1])
+            if len(parts) > 2 and parts[2] == 'close':
+                dataset.changesets[changeset] = 'closed'
+                return self._reply(200)
+            if len(parts) > 2 and parts[2] == 'upload':
+                return self._upload(ET.fromstring(body))
+        if parts[0] in synthetic.TYPES:
+            key = (parts[0], int(parts[1]))
+            element = dataset.elements[key]
+            if method == 'GET':
+                return self._reply(200, osm_xml([element], dataset.versions), 'text/xml')
+            return self._modify(ET.fromstring(body).find(parts[0]))
+        return self._reply(404, 'Not found')
+
+    def _modify(self, node):
+        dataset = self.server.dataset
+        key = (node.tag, int(node.get('id')))
+        if int(node.get('version')) != dataset.versions[key]:
+            return self._reply(409, f'Version mismatch: Provided {node.get("version")}, server had: {dataset.versions[key]}'
+                                    f' of {node.tag} {key[1]}')
+        dataset.elements[key]['tags'] = {tag.get('k'): tag.get('v') for tag in node.findall('tag')}
+        dataset.versions[key] = dataset.versions[key] + 1
+        return self._reply(200, str(dataset.versions[key]))
+
+    def _upload(self, osm_change):
+        dataset = self.server.dataset
+        out = ['<?xml version="1.0" encoding="UTF-8"?>', '<diffResult version="0.6">']
+        for action in osm_change:
+            for node in action:
+                key = (node.tag, int(node.get('id')))
+                if action.tag != 'modify' or int(node.get('version')) != dataset.versions[key]:
+                    return self._reply(409, f'Version mismatch or unsupported action {action.tag} for {node.tag} {key[1]}')
+                dataset.elements[key]['tags'] = {tag.get('k'): tag.get('v') for tag in node.findall('tag')}
+                dataset.versions[key] = dataset.versions[key] + 1
+                out.append(f'<{node.tag} old_id="{key[1]}" new_id="{key[1]}" new_version="{dataset.versions[key]}"/>')
+        out.append('</diffResult>')
+        return self._reply(200, '\n'.join(out), 'text/xml')
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, dataset: synthetic.Dataset = None, faults: dict = None, host='127.0.0.1', port=0, verbose=False):
+        super().__init__((host, port), StandinHandler)
+        self.dataset = dataset or synthetic.Dataset()
+        self.faults = {'*': Faults()}
+        self.faults.update(faults or {})
+        self.verbose = verbose
+        self.requests = dict.fromkeys(SERVICES, 0)
+        self._counter_lock = threading.Lock()
+        self.dataset_lock = threading.Lock()
+        self._thread = None
+
+    def count(self, service: str):
+        with self._counter_lock:
+            self.requests[service] += 1
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def endpoints(self) -> dict:
+        return {'LANGTOOLSOSM_OVERPASS_API': self.url + '/api/interpreter',
+                'LANGTOOLSOSM_WIKIDATA_API': self.url + '/w/api.php',
+                'LANGTOOLSOSM_WIKIPEDIA_API': self.url + '/{lang}/w/api.php',
+                'LANGTOOLSOSM_OSM_API': self.url}
+
+    def configure_lib(self):
+        """Point an already imported lib to this server."""
+        import lib.osm_utils
+        import lib.wikimedia
+        endpoints = self.endpoints()
+        lib.osm_utils.OVERPASS_API = endpoints['LANGTOOLSOSM_OVERPASS_API']
+        lib.osm_utils.OSM_API = endpoints['LANGTOOLSOSM_OSM_API']
+        lib.wikimedia.WIKIDATA_API = endpoints['LANGTOOLSOSM_WIKIDATA_API']
+        lib.wikimedia.WIKIPEDIA_API = endpoints['LANGTOOLSOSM_WIKIPEDIA_API']
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+@click.command()
+@click.option('--objects', default=1000, type=int, help='Number of synthetic OSM objects.')
+@click.option('--latency', default=0.0, type=float, help='Seconds added to every response.')
+@click.option('--jitter', default=0.0, type=float, help='Maximum random seconds added to the latency.')
+@click.option('--rate-limit-ratio', default=0.0, type=float, help='Ratio of responses replaced by "429 Too Many Requests".')
+@click.option('--timeout-ratio', default=0.0, type=float, help='Ratio of responses delayed by --timeout seconds and replaced by "504 Gateway Timeout".')
+@click.option('--timeout', default=30.0, type=float, help='Delay of the injected timeouts.')
+@click.option('--port', default=8000, type=int, help='Port to listen at.')
+@click.option('--wikidata-groups', default=None, type=int, help='Number of different wikidata values (default one per object).')
+@click.option('--verbose', '-v', count=True, help='Log every request.')
+def standincommand(objects, latency, jitter, rate_limit_ratio, timeout_ratio, timeout, port, wikidata_groups, verbose):
+    """Serve synthetic Overpass, Wikidata, Wikipedia and OSM API responses until Ctrl+c."""
+    faults = {'*': Faults(latency=latency, jitter=jitter, rate_limit_ratio=rate_limit_ratio,
+                          timeout_ratio=timeout_ratio, timeout=timeout)}
+    server = StandinServer(synthetic.Dataset(objects, n_wikidata=wikidata_groups), faults=faults, port=port, verbose=verbose)
+    for key, value in server.endpoints().items():
+        print(f"export {key}='{value}'")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f'Requests served: {server.requests}')
+        server.server_close()
+
+
+if __name__ == '__main__':
+    standincommand()
@@ -0,0 +1,53 @@
+"""Time "--help" of the command group and every command in a new interpreter and check that the heavy dependencies are
+not imported before they are needed."""
+import subprocess
+import sys
+import time
+
+import click
+
+from src.cli import COMMANDS
+
+HEAVY_MODULES = ['osmapi', 'overpy', 'pandas', 'pyarrow', 'requests']
+CHECK = """import sys, time
+start = time.perf_counter()
+from click.testing import CliRunner
+from src.cli import cli
+result = CliRunner().invoke(cli, {args!r})
+elapsed = time.perf_counter() - start
+assert result.exit_code == 0, result.output
+print(elapsed, ' '.join(x for x in {heavy!r} if x in sys.modules))
+"""
+
+
+def startup(args: list) -> tuple:
+    """Return the wall time of a new interpreter running «langtoolsosm ARGS», the time spent inside the interpreter
+    and the heavy modules imported."""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHECK.format(args=args, heavy=HEAVY_MODULES)], check=True,
+                            capture_output=True, text=True).stdout.split(' ', 1)
+    wall = time.perf_counter() - start
+    return wall, float(output[0]), output[1].split()
+
+
+@click.command()
+@click.option('--budget', default=0.5, type=float, help='Maximum seconds for "--help" in a new interpreter.')
+@click.option('--repeat', default=3, type=int, help='Runs per command. The best one is reported.')
+def startupcommand(budget, repeat):
+    """Fails if any "--help" takes longer than BUDGET seconds or imports a heavy module."""
+    failed = []
+    print(f'{"command":<52}{"wall":>8}{"import":>8}  heavy modules')
+    for args in [['--help']] + [[x, '--help'] for x in COMMANDS]:
+        runs = [startup(args) for _ in range(repeat)]
+        wall, inside, heavy = min(runs)
+        name = ' '.join(['langtoolsosm'] + args)
+        print(f'{name:<52}{wall:>8.3f}{inside:>8.3f}  {" ".join(heavy)}')
+        if wall > budget or heavy:
+            failed.append(name)
+    if failed:
+        print(f'Over the {budget} s budget or importing heavy modules: {failed}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    startupcommand()
@@ -0,0 +1,151 @@
+import random
+import re
+import zlib
+
+LANGS = ['ca', 'es', 'en', 'fr', 'oc', 'de']
+PREFIXES = {'ca': 'Carrer', 'es': 'Calle', 'en': 'Street', 'fr': 'Rue', 'oc': 'Carrièra', 'de': 'Straße'}
+# P31 classes of the synthetic entities and their english labels
+CLASSES = {'Q79007': 'street', 'Q174782': 'square', 'Q5': 'human', 'Q16970': 'church building', 'Q3914': 'school'}
+FIRST_QID = 1000000
+TYPES = ['node', 'way', 'relation']
+
+
+def _seed(*values) -> int:
+    return zlib.crc32('|'.join(str(x) for x in values).encode())
+
+
+def qid_number(qid: str) -> int:
+    return int(qid.lstrip('Qq'))
+
+
+def entity_name(n: int) -> str:
+    return f'Lloc {n}'
+
+
+def wikipedia_title(n: int, lang: str) -> str:
+    return f'{PREFIXES.get(lang, lang)} {entity_name(n)}'
+
+
+def wikidata_entity(qid: str, langs=None, props=('labels', 'aliases', 'sitelinks', 'claims')) -> dict:
+    """Deterministic synthetic entity for any QID, in the wbgetentities response structure."""
+    if qid in CLASSES:
+        return {'id': qid, 'type': 'item', 'labels': {'en': {'language': 'en', 'value': CLASSES[qid]}}}
+    n = qid_number(qid)
+    rng = random.Random(_seed(qid))
+    langs = langs or LANGS
+    entity = {'id': qid, 'type': 'item'}
+    if 'labels' in props:
+        entity['labels'] = {}
+        for lang in langs:
+            if rng.random() < 0.8:
+                entity['labels'][lang] = {'language': lang, 'value': wikipedia_title(n, lang)}
+    if 'aliases' in props:
+        entity['aliases'] = {}
+        for lang in langs:
+            if rng.random() < 0.3:
+                entity['aliases'][lang] = [{'language': lang, 'value': f'{entity_name(n)} ({lang})'},
+                                           {'language': lang, 'value': entity_name(n).lower()}]
+    if 'sitelinks' in props:
+        entity['sitelinks'] = {}
+        for lang in langs:
+            if rng.random() < 0.5:
+                entity['sitelinks'][lang + 'wiki'] = {'site': lang + 'wiki', 'title': wikipedia_title(n, lang), 'badges': []}
+        entity['sitelinks']['commonswiki'] = {'site': 'commonswiki', 'title': f'Category:{entity_name(n)}', 'badges': []}
+    if 'claims' in props:
+        p31 = rng.choices(list(CLASSES.keys()), weights=[70, 10, 10, 5, 5])[0]
+        lat, lon = osm_location(n - FIRST_QID)  # close to the object with this wikidata (and name)
+        entity['claims'] = {
+            'P31': [{'mainsnak': {'snaktype': 'value', 'property': 'P31',
+                                  'datavalue': {'value': {'entity-type': 'item', 'id': p31}, 'type': 'wikibase-entityid'}}}],
+            'P625': [{'mainsnak': {'snaktype': 'value', 'property': 'P625',
+                                   'datavalue': {'value': {'latitude': lat + rng.uniform(-0.01, 0.01),
+                                                           'longitude': lon + rng.uniform(-0.01, 0.01)},
+                                                 'type': 'globecoordinate'}}}],
+        }
+    return entity
+
+
+def osm_location(i: int, seed=0) -> tuple:
+    rng = random.Random(_seed('location', seed, i))
+    return 41 + rng.random(), 1 + rng.random()
+
+
+def osm_element(i: int, seed=0, lang='ca', wikidata_ratio=0.6, wikipedia_ratio=0.3, n_wikidata=None) -> dict:
+    """Synthetic OSM object number «i» in the Overpass JSON structure with a center (or lat/lon for nodes)."""
+    rng = random.Random(_seed(seed, i))
+    osm_type = TYPES[i % 3]
+    # Several objects share the same wikidata (eg. a street split in many ways) when n_wikidata < number of objects
+    n = FIRST_QID + (rng.randrange(n_wikidata) if n_wikidata else i)
+    tags = {'name': wikipedia_title(n, 'es'), 'highway': 'residential'}  # name in spanish to be translated
+    if rng.random() < wikidata_ratio:
+        tags['wikidata'] = f'Q{n}'
+    if rng.random() < wikipedia_ratio:
+        tags['wikipedia'] = f'{lang}:{wikipedia_title(n, lang)}'
+    if rng.random() < 0.5:
+        tags['name:es'] = tags['name']
+    if rng.random() < 0.3:
+        tags['name:' + lang] = wikipedia_title(n, lang)
+        if rng.random() < 0.1:
+            del tags['name']
+    element = {'type': osm_type, 'id': i + 1, 'tags': tags}
+    lat, lon = osm_location(i, seed=seed)
+    if osm_type == 'node':
+        element.update({'lat': lat, 'lon': lon})
+    else:
+        element['center'] = {'lat': lat, 'lon': lon}
+    return element
+
+
+def osm_elements(n_objects: int, **kwargs):
+    for i in range(n_objects):
+        yield osm_element(i, **kwargs)
+
+
+def overpass_json(n_objects: int, **kwargs) -> dict:
+    return {'version': 0.6, 'generator': 'LangToolsOSM synthetic', 'osm3s': {'copyright': 'synthetic data'},
+            'elements': list(osm_elements(n_objects, **kwargs))}
+
+
+def wikidata_ids(elements) -> list:
+    return list(dict.fromkeys(x['tags']['wikidata'] for x in elements if 'wikidata' in x['tags']))
+
+
+def wbsearchentities_json(search: str, limit=7) -> dict:
+    """The entity of the name and the next one, as a homonym."""
+    match = re.search(r'Lloc ([0-9]+)', search)
+    ids = [f'Q{int(match.group(1)) + x}' for x in range(2)] if match else []
+    return {'searchinfo': {'search': search}, 'search': [{'id': x} for x in ids[:limit]], 'success': 1}
+
+
+def wbgetentities_json(ids, langs=None, props=('labels', 'aliases', 'sitelinks', 'claims')) -> dict:
+    return {'entities': {qid: wikidata_entity(qid, langs=langs, props=props) for qid in ids}, 'success': 1}
+
+
+def report_rows(n_rows: int, lang='ca', **kwargs):
+    """Rows of a write_osm_objects_report csv file with name:LANG edited in about 10% of them."""
+    for element in osm_elements(n_rows, lang=lang, **kwargs):
+        tags = element['tags']
+        rng = random.Random(_seed('report', element['id']))
+        name_lang = tags.get('name:' + lang, '')
+        if rng.random() < 0.1:
+            name_lang = name_lang + ' edited' if name_lang else tags.get('name', '')
+        yield [element['type'], element['id'], tags.get('name', ''), name_lang, '', tags.get('wikipedia', ''),
+               tags.get('wikidata', ''), ', '.join(k + '=' + v for k, v in tags.items() if k.startswith('name:')),
+               str(tags)]
+
+
+class Dataset:
+    """Synthetic OSM objects with versions, as stored by the OSM API stand-in."""
+
+    def __init__(self, n_objects=1000, **kwargs):
+        self.elements = {}
+        self.versions = {}
+        for element in osm_elements(n_objects, **kwargs):
+            key = (element['type'], element['id'])
+            self.elements[key] = element
+            self.versions[key] = 1
+        self.changesets = {}
+
+    def overpass_json(self, predicate=None) -> dict:
+        return {'version': 0.6, 'generator': 'LangToolsOSM synthetic', 'osm3s': {'copyright': 'synthetic data'},
+                'elements': [x for x in self.elements.values() if predicate is None or predicate(x)]}
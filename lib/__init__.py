@@ -1,6 +1,32 @@
-from . import osm_utils
-from .osm_utils import *
-from . import wikimedia
-from .wikimedia import *
-from pkg_resources import require  # part of setuptools
-__version__ = require('LangToolsOSM')[0].version  # defined in setup.py
+import importlib
+from importlib.metadata import PackageNotFoundError, version
+
+try:
+    __version__ = version('LangToolsOSM')  # defined in setup.py
+except PackageNotFoundError:
+    __version__ = 'unknown'
+
+# Submodules and the functions of osm_utils and wikimedia are loaded on first access to keep the startup fast
+_SUBMODULES = ['api', 'batch', 'coverage', 'daemon', 'memory', 'metrics', 'object_index', 'osc', 'osm_utils', 'pipeline', 'profiling', 'rate_limit', 'reconcile', 'regex_rules', 'report', 'rules', 'transport', 'wikimedia']
+_NAMES = {'ObjectIndex': 'object_index'}
+_NAMES.update({x: 'osm_utils' for x in ['OSM_API', 'OVERPASS_API', 'login_osm', 'get_overpass_result', 'print_osm_object',
+                                        'update_osm_object', 'update_osm_objects', 'confirm_osm_objects',
+                                        'commit_osm_objects', 'upload_tags', 'print_changeset_status']})
+_NAMES.update({x: 'wikimedia' for x in ['WIKIDATA_API', 'WIKIPEDIA_API', 'get_entities', 'get_translations',
+                                        'get_translations_multilang', 'translations_from_entities', 'list_translations',
+                                        'search_entities', 'get_wikidata_from_wikipedia', 'get_wikidata_from_langwikipedia',
+                                        'get_wikipedia_from_wikidata', 'get_instance_type_from_wikidata']})
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in _NAMES:
+        value = getattr(importlib.import_module('.' + _NAMES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + _SUBMODULES + list(_NAMES))
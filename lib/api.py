@@ -0,0 +1,223 @@
+"""Non-interactive API to embed LangToolsOSM in other programs: fetch the objects, generate the candidate values, decide
+with a callable, diff and commit. Objects, proposals and edits are plain dicts and nothing is printed or asked.
+
+    import lib.api as la
+    objects = la.fetch(area='41.38,2.15,41.40,2.18', filters="nwr['name']['wikidata'][!'name:ca']")
+    proposals = la.translation_proposals(objects, lang='ca')
+    edits = la.decide_edits(proposals, decide=la.first_candidate)
+    for edit in la.commit(la.osm_api(passwordfile='passwordfile'), edits, changeset_tags={'comment': '...'}):
+        print(edit['type'], edit['id'], edit['status'])
+"""
+from typing import TYPE_CHECKING
+
+from . import osm_utils, pipeline, reconcile, wikimedia
+from .regex_rules import Dispatcher
+
+if TYPE_CHECKING:
+    import osmapi
+
+
+def osm_api(username: str = None, password: str = None, passwordfile: str = None) -> 'osmapi.OsmApi':
+    """osmapi.OsmApi through the shared transport. Without credentials it can only read (eg. for dry runs)."""
+    if passwordfile:
+        return osm_utils.new_osm_api(passwordfile=passwordfile)
+    return osm_utils.new_osm_api(username=username, password=password)
+
+
+def object_data(osm_object) -> dict:
+    """{'type', 'id', 'tags', 'lat', 'lon'} for an overpy element. lat and lon are the center for ways and relations."""
+    if osm_object._type_value == 'node':
+        lat, lon = osm_object.lat, osm_object.lon
+    else:
+        lat, lon = osm_object.center_lat, osm_object.center_lon
+    return {'type': osm_object._type_value, 'id': osm_object.id, 'tags': dict(osm_object.tags),
+            'lat': float(lat) if lat is not None else None, 'lon': float(lon) if lon is not None else None}
+
+
+def fetch(area: str = None, filters: str = "nwr['name']", query: str = None, coords=False) -> list:
+    """Objects matching «filters» in «area» or the result of «query» from Overpass. Raises the overpy exceptions
+    (eg. OverpassTooManyRequests when the retries are exhausted)."""
+    result = osm_utils.query_overpass(area=area, filters=filters, query=query, coords=coords)
+    return [object_data(x) for x in result.nodes + result.ways + result.relations]
+
+
+def fetch_stream(area: str = None, filters: str = "nwr['name']", query: str = None, coords=False, tiles=1, maxsize=2):
+    """Yield the objects tile by tile while the next tiles are downloaded in background."""
+    for objects in pipeline.background(pipeline.source(area=area, filters=filters, query=query, coords=coords,
+                                                       tiles=tiles, fetch=osm_utils.query_overpass), maxsize=maxsize):
+        for osm_object in objects:
+            yield object_data(osm_object)
+
+
+def translation_candidates(translations: dict, name: str = None, name_as_option=False) -> list:
+    """Candidate values ({'value', 'source'}) from the translations of a wikidata item in the order offered by
+    translate_with_wikidata: wikipedia title, name (with «name_as_option»), extra, label and aliases."""
+    if not translations:
+        return []
+    candidates = []
+    if translations['wikipedia'] and translations['wikipedia']['title']:
+        candidates.append({'value': translations['wikipedia']['title'], 'source': 'wikipedia'})
+    if name_as_option and name:
+        candidates.append({'value': name, 'source': 'name'})
+    for alias in translations.get('extra') or []:
+        candidates.append({'value': alias['value'], 'source': 'extra'})
+    if translations['label'] and translations['label']['value']:
+        candidates.append({'value': translations['label']['value'], 'source': 'label'})
+    for alias in translations['aliases'] or []:
+        candidates.append({'value': alias['value'], 'source': 'alias'})
+    return candidates
+
+
+def translation_proposals(objects, lang: str, translations: dict = None, name_as_option=False, batch_size=50):
+    """Yield a proposal ({'object', 'key', 'candidates', 'wikidata'}) for «name:lang» of every object with wikidata.
+    The translations are fetched in batches as the objects arrive, unless they are passed as «translations»
+    (eg. from wikimedia.get_translations)."""
+    db = {} if translations is None else translations
+    objects = iter(objects)
+    while True:
+        batch = [x for _, x in zip(range(batch_size), objects)]
+        if not batch:
+            return
+        if translations is None:
+            ids = list(dict.fromkeys(x['tags']['wikidata'] for x in batch if x['tags'].get('wikidata')))
+            db.update(wikimedia.get_translations([x for x in ids if x not in db], lang=lang))
+        for osm_object in batch:
+            wikidata = osm_object['tags'].get('wikidata')
+            if not wikidata or not db.get(wikidata, {}).get('translations'):
+                continue
+            candidates = translation_candidates(db[wikidata]['translations'], name=osm_object['tags'].get('name'),
+                                                name_as_option=name_as_option)
+            yield {'object': osm_object, 'key': 'name:' + lang, 'candidates': candidates, 'wikidata': wikidata}
+
+
+def copy_proposals(objects, source_key: str, target_key: str):
+    """Yield a proposal to copy «source_key» to an empty «target_key» (eg. name to name:ca as fill_empty_name_lang)."""
+    for osm_object in objects:
+        value = osm_object['tags'].get(source_key)
+        if value and not osm_object['tags'].get(target_key):
+            yield {'object': osm_object, 'key': target_key, 'candidates': [{'value': value, 'source': source_key}]}
+
+
+def regex_proposals(objects, rules: list):
+    """Yield a proposal for the first rule of «rules» (lib.regex_rules.RegexRule) matching the name of every object."""
+    dispatcher = Dispatcher(rules)
+    for osm_object in objects:
+        name = osm_object['tags'].get('name')
+        if not name:
+            continue
+        rule, value = dispatcher.match(name)
+        if rule is not None and rule.key not in osm_object['tags']:
+            rule.hits = rule.hits + 1
+            yield {'object': osm_object, 'key': rule.key, 'candidates': [{'value': value, 'source': rule.name}]}
+
+
+def wikidata_proposals(objects, lang: str, area: str = None, cache=None, workers=4, max_distance=reconcile.MAX_DISTANCE,
+                       batch_size=200):
+    """Yield a proposal for «wikidata» of every object with name and without wikidata. The names are searched in
+    Wikidata in «lang» in batches of «batch_size» objects and the candidates ranked by reconcile.rank (the objects need
+    lat and lon, see fetch with coords=True). «cache» is a reconcile.SearchCache."""
+    objects = iter(objects)
+    while True:
+        batch = [x for _, x in zip(range(batch_size), objects)]
+        if not batch:
+            return
+        batch = [x for x in batch if x['tags'].get('name') and not x['tags'].get('wikidata')]
+        found = reconcile.search_candidates([x['tags']['name'] for x in batch], lang=lang, area=area, cache=cache,
+                                            workers=workers)
+        for osm_object in batch:
+            ranked = reconcile.rank(found[osm_object['tags']['name']], osm_object['tags'], osm_object.get('lat'),
+                                    osm_object.get('lon'), max_distance=max_distance)
+            if ranked:
+                candidates = [dict(x, value=x['id'], source='search') for x in ranked]
+                yield {'object': osm_object, 'key': 'wikidata', 'candidates': candidates}
+
+
+def first_candidate(proposal: dict):
+    """Decision that accepts the first candidate."""
+    return proposal['candidates'][0]['value'] if proposal['candidates'] else None
+
+
+def diff_tags(tags: dict, new_tags: dict) -> dict:
+    """{'added': {key: value}, 'modified': {key: [old, new]}, 'unchanged': {key: value}} of applying «new_tags»."""
+    diff = {'added': {}, 'modified': {}, 'unchanged': {}}
+    for key, value in new_tags.items():
+        if key not in tags:
+            diff['added'][key] = value
+        elif tags[key] != value:
+            diff['modified'][key] = [tags[key], value]
+        else:
+            diff['unchanged'][key] = value
+    return diff
+
+
+def decide_edits(proposals, decide):
+    """Yield an edit ({'type', 'id', 'tags', 'diff', 'proposal', 'status'}) for every proposal. «decide» receives the
+    proposal and returns the value for its key, a dict of tags or None to skip. The status is 'pending', 'skipped'
+    or 'unchanged'."""
+    for proposal in proposals:
+        decision = decide(proposal)
+        osm_object = proposal['object']
+        if decision is None:
+            tags = {}
+        elif isinstance(decision, dict):
+            tags = decision
+        else:
+            tags = {proposal['key']: decision}
+        diff = diff_tags(osm_object['tags'], tags)
+        changed = dict(diff['added'], **{key: values[1] for key, values in diff['modified'].items()})
+        if decision is None:
+            status = 'skipped'
+        elif not changed:
+            status = 'unchanged'
+        else:
+            status = 'pending'
+        yield {'type': osm_object['type'], 'id': osm_object['id'], 'tags': changed, 'diff': diff,
+               'proposal': proposal, 'status': status}
+
+
+def commit(api: 'osmapi.OsmApi', edits, changeset_tags: dict, batch: int = None, chunk_size=100, dry_run=False):
+    """Upload the pending «edits» in chunks of «chunk_size» objects and yield every edit with the status 'committed',
+    'failed' (not in the upload result) or 'dry-run'. A new changeset is opened every «batch» edits. Other edits are
+    yielded as they come."""
+    changeset = None
+    n_edits = 0
+    pending = []
+
+    def upload():
+        nonlocal changeset, n_edits
+        if changeset is None:
+            changeset = api.ChangesetCreate(changeset_tags)
+        object_updates = {}
+        for edit in pending:
+            object_updates.setdefault(edit['type'], {})[edit['id']] = edit['tags']
+        result = osm_utils.upload_tags(api, object_updates, chunk_size=chunk_size)
+        done = set((x['type'], int(element['id'])) for x in result for element in x['data'])
+        for edit in pending:
+            edit['status'] = 'committed' if (edit['type'], edit['id']) in done else 'failed'
+            edit['changeset'] = changeset
+        n_edits = n_edits + len(done)
+        if batch and n_edits >= batch:
+            api.ChangesetClose()
+            changeset = None
+            n_edits = 0
+        return pending
+
+    try:
+        for edit in edits:
+            if edit['status'] != 'pending':
+                yield edit
+                continue
+            if dry_run:
+                edit['status'] = 'dry-run'
+                yield edit
+                continue
+            pending.append(edit)
+            if len(pending) >= (min(chunk_size, batch - n_edits) if batch else chunk_size):  # no changeset over «batch»
+                yield from upload()
+                pending = []
+        if pending:
+            yield from upload()
+            pending = []
+    finally:
+        if changeset is not None:
+            api.ChangesetClose()
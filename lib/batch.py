@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from . import api, rate_limit, reconcile
+
+# Run a command without prompts once per area in its own process, several areas in parallel. For the interactive
+# commands of REVIEW, the workers download the objects of every area and generate their proposals (see lib.api) and the
+# proposals are reviewed in the main process one area after another, while the next areas are prepared. A JSON manifest
+# records every prepared and finished area, so a restarted batch skips them.
+NON_INTERACTIVE = ['coverage_stats', 'write_osm_objects_report']
+
+
+def area_slug(area: str) -> str:
+    """Name for the files of «area» (eg. "reports/{area}.csv"). A short hash of the area keeps apart the areas with the
+    same name once cleaned (eg. "Sant Pere" and "Sant_Pere") also in case-insensitive file systems."""
+    return (re.sub(r'[^\w.-]+', '_', area).strip('_.') or 'area') + '-' + hashlib.sha1(area.encode('utf-8')).hexdigest()[:8]
+
+
+def read_areas(file: str) -> list:
+    with open(file, encoding='utf-8') as f:
+        areas = [x.strip() for x in f if x.strip() and not x.startswith('#')]
+    return list(dict.fromkeys(areas))
+
+
+def command_line(command: str, area: str, args: list, rate_limits: str = None) -> list:
+    """Arguments to run «command» for «area». "{area}" in «args» is replaced by the slug of the area."""
+    line = [sys.executable, '-m', 'src.cli', command, '--area', area]
+    line = line + [x.replace('{area}', area_slug(area)) for x in args]
+    if rate_limits:
+        line = line + ['--rate-limits', rate_limits]  # the last value wins over one in «args»
+    return line
+
+
+class Manifest:
+    """{area: {'status', 'returncode', 'seconds', 'log', 'time'}} in a JSON file, saved after every area."""
+
+    def __init__(self, path: str, command: str, args: list):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'command': command, 'args': args, 'areas': {}}
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('command') != command or data.get('args') != args:
+                raise ValueError(f'Manifest {path} is from another batch: {data.get("command")} {data.get("args")}. '
+                                 'Use another --manifest file or delete it.')
+            self.data = data
+
+    def status(self, area: str) -> str:
+        return self.data['areas'].get(area, {}).get('status')
+
+    def update(self, area: str, **values):
+        with self.lock:
+            self.data['areas'][area] = dict(values, time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            self.save()
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.path)  # a killed batch never leaves a truncated manifest
+
+    def counts(self) -> dict:
+        counts = {}
+        for values in self.data['areas'].values():
+            counts[values['status']] = counts.get(values['status'], 0) + 1
+        return counts
+
+
+def run_area(command: str, area: str, args: list, rate_limits: str = None, log: str = None) -> dict:
+    """Run «command» for «area», with the output to the file «log» and without input, or in the terminal."""
+    line = command_line(command, area, args, rate_limits=rate_limits)
+    start = time.perf_counter()
+    if log:
+        with open(log, 'w', encoding='utf-8') as f:
+            returncode = subprocess.run(line, stdin=subprocess.DEVNULL, stdout=f, stderr=subprocess.STDOUT).returncode
+    else:
+        returncode = subprocess.run(line).returncode
+    return {'status': 'done' if returncode == 0 else 'failed', 'returncode': returncode,
+            'seconds': round(time.perf_counter() - start, 1), 'log': log}
+
+
+def _fill_empty_name(area: str, options: dict):
+    lang = options['lang']
+    objects = api.fetch(area=area, filters=options.get('filters') or f"nwr['name:{lang}'][!'name']")
+    return api.copy_proposals(objects, 'name:' + lang, 'name')
+
+
+def _fill_empty_name_lang(area: str, options: dict):
+    lang = options['lang']
+    objects = api.fetch(area=area, filters=options.get('filters') or f"nwr['name'][~'name:[a-z]+'~'.'][!'name:{lang}']")
+    return api.copy_proposals(objects, 'name', 'name:' + lang)
+
+
+def _fill_wikidata_from_name(area: str, options: dict):
+    objects = api.fetch(area=area, filters=options.get('filters') or "nwr['name'][!'wikidata']", coords=True)
+    return api.wikidata_proposals(objects, lang=options['lang'], area=area, workers=options.get('workers') or 4,
+                                  max_distance=options.get('max_distance') or reconcile.MAX_DISTANCE)
+
+
+def _translate_with_wikidata(area: str, options: dict):
+    lang = options['lang']
+    objects = api.fetch(area=area, filters=options.get('filters') or f"nwr['name'][~'name:[a-z]+'~'.']['wikidata'][!'name:{lang}']")
+    return api.translation_proposals(objects, lang=lang, name_as_option=options.get('name_as_option', False))
+
+
+# Proposals of the interactive commands and the default comment and source of their changesets
+REVIEW = {
+    'fill_empty_name': (_fill_empty_name, 'Fill empty name tags with name:{lang} in {area}', 'name:{lang} tag'),
+    'fill_empty_name_lang': (_fill_empty_name_lang, 'Fill empty name:{lang} tags with name in {area}', None),
+    'fill_wikidata_from_name': (_fill_wikidata_from_name, 'Fill empty wikidata tags searching the name in wikidata in {area}', 'wikidata'),
+    'translate_with_wikidata': (_translate_with_wikidata, 'Fill empty name:{lang} tags translations from wikidata in {area}', 'wikidata'),
+}
+
+
+def prepare_area(command: str, area: str, options: dict, rate_limits: str = None, path: str = None) -> dict:
+    """Download the objects of «area» and save the proposals of «command» to the JSON file «path». «options» are the
+    parameters of the command (eg. lang and filters). Run in the workers of the batch."""
+    rate_limit.configure(rate_limits)
+    start = time.perf_counter()
+    try:
+        proposals = list(REVIEW[command][0](area, options))
+    except Exception as error:  # eg. the Overpass errors after the retries
+        return {'status': 'failed', 'error': repr(error), 'seconds': round(time.perf_counter() - start, 1)}
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(proposals, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return {'status': 'prepared', 'proposals': len(proposals), 'file': path, 'seconds': round(time.perf_counter() - start, 1)}
+
+
+def read_proposals(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def changeset_tags(command: str, area: str, options: dict, version: str) -> dict:
+    """Tags of the changeset of «area» with the comment, hashtags and source of the «options» of «command»."""
+    _, comment, source = REVIEW[command]
+    tags = {'comment': options.get('changeset_comment') or comment.format(lang=options.get('lang'), area=area),
+            'created_by': f'LangToolsOSM {version}'}
+    source = options.get('changeset_source') or source
+    if source:
+        tags['source'] = source.format(lang=options.get('lang'))
+    if options.get('changeset_hashtags'):
+        tags['hashtags'] = options['changeset_hashtags']
+    return tags
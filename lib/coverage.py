@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from . import osm_utils, profiling, transport
+
+# Counts of the objects matching the filters in every area and of the objects missing every tag, with "out count"
+# statements, so no object data is downloaded. Several areas are counted in a single Overpass query.
+DEFAULT_TAGS = ['name:{lang}', 'wikidata', 'wikipedia']
+
+
+def area_selector(area: str, n: int) -> tuple:
+    """Return the statement defining the area number «n» (can be empty) and the filter to search inside it."""
+    if re.search('([0-9.-]+,){3}[0-9.-]+', area):
+        south, west, north, east = re.sub(r'[\[\]()]', '', area).split(',')[:4]
+        return '', f'({south},{west},{north},{east})'
+    if re.search(r'^\[.+\]$', area):
+        return f'area{area}->.a{n};', f'(area.a{n})'
+    return f'area[name="{area}"]->.a{n};', f'(area.a{n})'
+
+
+def count_query(areas: list, filters: str, tags: list) -> str:
+    """Overpass query with a count of «filters» and a count of «filters» without every tag for every area."""
+    lines = ['[out:json][timeout:1000];']
+    for n, area in enumerate(areas):
+        statement, selector = area_selector(area, n)
+        if statement:
+            lines.append(statement)
+        lines.append(f'{filters}{selector};out count;')
+        lines.extend(f"{filters}[!'{tag}']{selector};out count;" for tag in tags)
+    return '\n'.join(lines)
+
+
+def parse_counts(data: dict, areas: list, tags: list) -> dict:
+    """{area: {'objects': n, tag: n_with_tag, ...}} from the "count" elements of the response, in query order."""
+    counts = [int(x['tags']['total']) for x in data.get('elements', []) if x.get('type') == 'count']
+    if len(counts) != len(areas) * (len(tags) + 1):
+        raise ValueError(f'Expected {len(areas) * (len(tags) + 1)} counts from Overpass and got {len(counts)}.')
+    result = {}
+    for n, area in enumerate(areas):
+        values = counts[n * (len(tags) + 1):(n + 1) * (len(tags) + 1)]
+        result[area] = {'objects': values[0]}
+        result[area].update({tag: values[0] - missing for tag, missing in zip(tags, values[1:])})
+    return result
+
+
+def overpass_counts(query: str, retry=2, sleep_retry=10) -> dict:
+    policy = transport.RetryPolicy(retries=retry, statuses=(429, 504), backoff=sleep_retry, factor=1)
+    with profiling.phase('query'):
+        response = transport.post(osm_utils.OVERPASS_API, data=query.encode('utf-8'), policy=policy,
+                                  timeout=osm_utils.OVERPASS_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+class CountCache:
+    """Counts by area and filters in a JSON file, so the areas already counted aren't queried again when the list of
+    areas changes. Entries older than «max_age» seconds are ignored."""
+
+    def __init__(self, path: str = None, max_age: float = None):
+        self.path = path
+        self.max_age = max_age
+        self.entries = {}
+        self.hits = 0
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(area: str, filters: str) -> str:
+        return hashlib.sha1(json.dumps([area, filters]).encode('utf-8')).hexdigest()
+
+    def get(self, area: str, filters: str, tags: list):
+        """Counts of «area» with every tag of «tags» or None."""
+        entry = self.entries.get(self.key(area, filters))
+        if entry is None or (self.max_age is not None and time.time() - entry['time'] > self.max_age):
+            return None
+        if any(tag not in entry['counts'] for tag in tags):
+            return None
+        self.hits = self.hits + 1
+        return {key: entry['counts'][key] for key in ['objects'] + tags}
+
+    def set(self, area: str, filters: str, counts: dict):
+        self.entries[self.key(area, filters)] = {'time': time.time(), 'counts': counts}
+
+    def save(self):
+        if self.path:
+            with open(self.path, 'w') as f:
+                json.dump(self.entries, f)
+
+
+def get_counts(areas: list, filters: str, tags: list, cache: CountCache = None) -> dict:
+    """Counts of every area, with a query for the areas missing in the cache."""
+    counts = {x: cache.get(x, filters, tags) for x in areas} if cache else {x: None for x in areas}
+    missing = [x for x in areas if counts[x] is None]
+    if missing:
+        query = count_query(missing, filters=filters, tags=tags)
+        for area, area_counts in parse_counts(overpass_counts(query), areas=missing, tags=tags).items():
+            counts[area] = area_counts
+            if cache:
+                cache.set(area, filters, area_counts)
+    return counts
+
+
+def add_counts(total: dict, counts: dict) -> dict:
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def coverage_row(area: str, counts: dict, tags: list) -> list:
+    """[area, objects, objects with tag, objects without tag, % with tag, ...] for every tag."""
+    row = [area, counts['objects']]
+    for tag in tags:
+        percent = round(counts[tag] / counts['objects'] * 100, 1) if counts['objects'] else None
+        row = row + [counts[tag], counts['objects'] - counts[tag], percent]
+    return row
+
+
+def coverage_header(tags: list) -> list:
+    header = ['area', 'objects.count']
+    for tag in tags:
+        header = header + [tag + '.count', tag + '.missing', tag + '.%']
+    return header
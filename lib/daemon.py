@@ -0,0 +1,201 @@
+import datetime
+import decimal
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from . import profiling
+
+# Optional local daemon that keeps the Overpass results and the wikidata entities of the last runs in memory. The
+# commands use it when its socket exists and query the services directly otherwise. Start it with
+# "langtoolsosm daemon start".
+SOCKET = os.environ.get('LANGTOOLSOSM_DAEMON_SOCKET',
+                        os.path.join(os.path.expanduser('~'), '.cache', 'LangToolsOSM', 'daemon.sock'))
+
+_serving = False  # True inside the daemon, to query the services instead of itself
+TIMEOUT = 30  # seconds for an answer of the daemon
+OVERPASS_TIMEOUT = 1100  # as osm_utils.OVERPASS_TIMEOUT, the daemon may be querying Overpass for us
+
+
+def call(method: str, timeout=TIMEOUT, parse_float=None, **params):
+    """Send a request to the daemon and return its result. None if the daemon is not running, doesn't answer in
+    «timeout» seconds or fails, so the callers query the services directly."""
+    if _serving or not os.path.exists(SOCKET):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(SOCKET)
+            client.sendall(json.dumps({'method': method, 'params': params}).encode('utf-8') + b'\n')
+            with client.makefile('rb') as f:
+                line = f.readline()
+        response = json.loads(line, parse_float=parse_float) if line else {}
+    except (OSError, ValueError):  # also socket.timeout and an incomplete answer
+        return None
+    return response.get('result')  # None with an 'error' of the daemon
+
+
+def overpass(query: str):
+    """Overpass JSON of «query» from the daemon or None."""
+    with profiling.phase('query'):
+        # a stuck daemon doesn't answer the ping, a busy one waits for Overpass as a direct query would
+        if call('ping', timeout=1) is None:
+            return None
+        return call('overpass', timeout=OVERPASS_TIMEOUT, parse_float=decimal.Decimal, query=query)  # as overpy
+
+
+def entities(ids: list, languages: list, props: str):
+    """wbgetentities entities from the daemon or None."""
+    with profiling.phase('wikidata'):
+        return call('entities', ids=ids, languages=languages, props=props)
+
+
+def notify_edit():
+    """Drop the cached Overpass results after an edit, because they don't include it."""
+    call('invalidate', timeout=1)
+
+
+def result_json(result) -> dict:
+    """Overpass JSON for an overpy.Result with the attributes used by the commands and the metadata of "out meta"."""
+    elements = []
+    for node in result.nodes:
+        elements.append({**node.attributes, 'type': 'node', 'id': node.id, 'lat': node.lat, 'lon': node.lon, 'tags': node.tags})
+    for way in result.ways:
+        element = {**way.attributes, 'type': 'way', 'id': way.id, 'nodes': way._node_ids, 'tags': way.tags}
+        if way.center_lat is not None:
+            element['center'] = {'lat': way.center_lat, 'lon': way.center_lon}
+        elements.append(element)
+    for relation in result.relations:
+        element = {**relation.attributes, 'type': 'relation', 'id': relation.id, 'tags': relation.tags,
+                   'members': [{'type': x._type_value, 'ref': x.ref, 'role': x.role} for x in relation.members]}
+        if relation.center_lat is not None:
+            element['center'] = {'lat': relation.center_lat, 'lon': relation.center_lon}
+        elements.append(element)
+    return {'version': 0.6, 'generator': 'LangToolsOSM daemon', 'elements': elements}
+
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):  # timestamp of "out meta", as overpy parses it
+        return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class Cache:
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+                self.misses = self.misses + 1
+                return None
+            self.hits = self.hits + 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+    def stats(self) -> dict:
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            result = getattr(self.server, 'do_' + request['method'])(**request.get('params', {}))
+            response = {'result': result}
+        except BaseException as error:  # also SystemExit from the retries of get_overpass_result
+            response = {'error': repr(error)}
+        self.wfile.write(json.dumps(response, default=_default).encode('utf-8') + b'\n')
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str = SOCKET, overpass_ttl: float = 600, wikidata_ttl: float = 86400, verbose=0):
+        global _serving
+        _serving = True
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, Handler)
+        os.chmod(path, 0o600)  # only for the user
+        self.path = path
+        self.start = time.time()
+        self.verbose = verbose
+        self.overpass = Cache(ttl=overpass_ttl)
+        self.entities = Cache(ttl=wikidata_ttl)
+
+    def log(self, message: str):
+        if self.verbose:
+            print(time.strftime('%H:%M:%S ') + message, flush=True)
+
+    def do_ping(self) -> str:
+        return 'pong'
+
+    def do_overpass(self, query: str) -> dict:
+        from . import osm_utils
+        data = self.overpass.get(query)
+        if data is None:
+            self.log(f'Overpass query: {query!r}')
+            data = result_json(osm_utils.get_overpass_result(area=None, filters=None, query=query))
+            self.overpass.set(query, data)
+        return data
+
+    def do_entities(self, ids: list, languages: list, props: str) -> dict:
+        from . import wikimedia
+        key = '|'.join(languages) + '#' + props + '#'
+        data = {}
+        missing = []
+        for qid in ids:
+            entity = self.entities.get(key + qid)
+            if entity is None:
+                missing.append(qid)
+            else:
+                data[qid] = entity
+        if missing:
+            self.log(f'wikidata entities: {len(missing)} of {len(ids)} not cached')
+            fetched = wikimedia.get_entities(missing, languages=languages, props=props)
+            for qid, entity in fetched.items():
+                self.entities.set(key + qid, entity)
+            data.update(fetched)
+        return data
+
+    def do_invalidate(self) -> int:
+        n = len(self.overpass.entries)
+        self.overpass.clear()
+        self.log(f'Edit notified: {n} Overpass results dropped')
+        return n
+
+    def do_stats(self) -> dict:
+        from . import rate_limit
+        return {'pid': os.getpid(), 'uptime': round(time.time() - self.start), 'overpass': self.overpass.stats(),
+                'entities': self.entities.stats(), 'rate_limits': rate_limit.stats()}
+
+    def do_shutdown(self) -> str:
+        threading.Thread(target=self.shutdown).start()
+        return 'stopping'
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,73 @@
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    source TEXT NOT NULL,  -- 'wikidata' or 'name'
+    key TEXT NOT NULL,  -- QID or name value
+    lang TEXT NOT NULL,
+    value TEXT,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    committed INTEGER NOT NULL DEFAULT 0,
+    uses INTEGER NOT NULL DEFAULT 1,
+    updated REAL NOT NULL,
+    PRIMARY KEY (source, key, lang)
+)
+"""
+
+
+class TranslationMemory:
+    """Answers of the user stored in a SQLite file by (wikidata, lang) and by (name, lang) to reuse them in the next
+    runs. Every answer is saved at once, so they are kept if the command is interrupted."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.hits = 0
+
+    def lookup(self, lang: str, wikidata: str = None, name: str = None):
+        """Return the answer for «wikidata» or, if unknown, for «name» as a dict with value, skipped, committed and
+        source keys. None if both are unknown."""
+        for source, key in [('wikidata', wikidata), ('name', name)]:
+            if not key:
+                continue
+            row = self.connection.execute('SELECT value, skipped, committed FROM answers WHERE source = ? AND key = ? AND lang = ?',
+                                          (source, key, lang)).fetchone()
+            if row:
+                self.hits = self.hits + 1
+                return {'value': row[0], 'skipped': bool(row[1]), 'committed': bool(row[2]), 'source': source}
+        return None
+
+    def record(self, lang: str, value: str = None, wikidata: str = None, name: str = None, skipped=False):
+        """Save the answer for «wikidata» and «name». A skip doesn't replace a committed value."""
+        with self.connection:
+            for source, key in [('wikidata', wikidata), ('name', name)]:
+                if not key:
+                    continue
+                if skipped:
+                    self.connection.execute(
+                        'INSERT INTO answers (source, key, lang, value, skipped, updated) VALUES (?, ?, ?, NULL, 1, ?) '
+                        'ON CONFLICT (source, key, lang) DO UPDATE SET uses = uses + 1, updated = excluded.updated, '
+                        'skipped = NOT committed',
+                        (source, key, lang, time.time()))
+                else:
+                    self.connection.execute(
+                        'INSERT INTO answers (source, key, lang, value, updated) VALUES (?, ?, ?, ?, ?) '
+                        'ON CONFLICT (source, key, lang) DO UPDATE SET skipped = 0, uses = uses + 1, '
+                        'committed = committed AND value = excluded.value, value = excluded.value, updated = excluded.updated',
+                        (source, key, lang, value, time.time()))
+
+    def mark_committed(self, lang: str, wikidata: str = None, name: str = None):
+        with self.connection:
+            for source, key in [('wikidata', wikidata), ('name', name)]:
+                if key:
+                    self.connection.execute('UPDATE answers SET committed = 1 WHERE source = ? AND key = ? AND lang = ?',
+                                            (source, key, lang))
+
+    def count(self) -> int:
+        return self.connection.execute('SELECT count(*) FROM answers').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
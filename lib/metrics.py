@@ -0,0 +1,195 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+# Counters and latency histograms of a run: HTTP requests by endpoint, phases, reviewer prompts and decisions and
+# edits. Written at exit and every INTERVAL seconds to a Prometheus textfile (eg. for the textfile collector of
+# node_exporter) if the path ends with ".prom" or to a JSON summary otherwise.
+PREFIX = 'langtoolsosm_'
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+INTERVAL = 30
+HELP = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint and status.'),
+    'http_response_bytes_total': ('counter', 'Bytes of the HTTP responses by endpoint.'),
+    'http_request_seconds': ('histogram', 'Latency of the HTTP requests by endpoint.'),
+    'phase_seconds': ('histogram', 'Duration of the phases (query, wikidata, commit, ...).'),
+    'prompt_seconds': ('histogram', 'Time of the user answering a prompt.'),
+    'decisions_total': ('counter', 'Reviewer decisions by type.'),
+    'edits_total': ('counter', 'Objects modified in OSM by type.'),
+    'exports_total': ('counter', 'Objects written to an osmChange file with --export-osc by type.'),
+}
+
+_metrics = None
+
+
+def endpoint(url: str) -> tuple:
+    """(host, path) of «url» with the ids replaced by {id} and the MediaWiki action, to group the requests."""
+    split = urlsplit(url)
+    path = re.sub(r'/[0-9]+(?=/|$)', '/{id}', split.path)
+    action = parse_qs(split.query).get('action')
+    if action:
+        path = path + '?action=' + action[0]
+    return split.hostname, path
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # cumulative, as the Prometheus buckets
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count = self.count + 1
+        self.sum = self.sum + value
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[i] = self.counts[i] + 1
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket of the «q» quantile (None if it is over the last bucket)."""
+        for bucket, count in zip(self.buckets, self.counts):
+            if count >= q * self.count:
+                return bucket
+        return None
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for k, v in labels.items()}
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped.items()) + '}'
+
+
+class Metrics:
+    def __init__(self, path: str, labels: dict = None, interval: float = INTERVAL):
+        self.path = path
+        self.labels = labels or {}
+        self.start_time = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+            self._thread.start()
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def total(self, name: str, **labels) -> float:
+        with self._lock:
+            return sum(v for (k, key_labels), v in self.counters.items()
+                       if k == name and set(labels.items()).issubset(key_labels))
+
+    def summary(self) -> dict:
+        duration = time.time() - self.start_time
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{'name': name, 'labels': dict(labels), 'count': h.count, 'sum': round(h.sum, 4),
+                           'p50': h.quantile(0.5), 'p95': h.quantile(0.95),
+                           'buckets': dict(zip([str(x) for x in h.buckets], h.counts))}
+                          for (name, labels), h in sorted(self.histograms.items())]
+        requests = self.total('http_requests_total')
+        errors = requests - sum(x['value'] for x in counters if x['name'] == 'http_requests_total'
+                                and str(x['labels'].get('status', '')).startswith(('2', '3')))
+        rates = {'edits_per_hour': round(self.total('edits_total') / duration * 3600, 2) if duration else None,
+                 'decisions_per_minute': round(self.total('decisions_total') / duration * 60, 2) if duration else None,
+                 'http_error_rate': round(errors / requests, 4) if requests else None}
+        return {'labels': self.labels, 'start': self.start_time, 'duration': round(duration, 3), 'rates': rates,
+                'counters': counters, 'histograms': histograms}
+
+    def prometheus(self) -> str:
+        lines = [f'# TYPE {PREFIX}run_start_timestamp_seconds gauge',
+                 f'{PREFIX}run_start_timestamp_seconds{_labels(self.labels)} {self.start_time}',
+                 f'# TYPE {PREFIX}run_duration_seconds gauge',
+                 f'{PREFIX}run_duration_seconds{_labels(self.labels)} {round(time.time() - self.start_time, 3)}']
+        with self._lock:
+            for name, (metric_type, description) in HELP.items():
+                lines.append(f'# HELP {PREFIX}{name} {description}')
+                lines.append(f'# TYPE {PREFIX}{name} {metric_type}')
+                for (key, labels), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append(f'{PREFIX}{name}{_labels(dict(self.labels, **dict(labels)))} {value}')
+                for (key, labels), h in sorted(self.histograms.items()):
+                    if key != name:
+                        continue
+                    labels = dict(self.labels, **dict(labels))
+                    for bucket, count in zip(h.buckets, h.counts):
+                        lines.append(f'{PREFIX}{name}_bucket{_labels(dict(labels, le=bucket))} {count}')
+                    lines.append(f'{PREFIX}{name}_bucket{_labels(dict(labels, le="+Inf"))} {h.count}')
+                    lines.append(f'{PREFIX}{name}_sum{_labels(labels)} {round(h.sum, 6)}')
+                    lines.append(f'{PREFIX}{name}_count{_labels(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        if self.path.endswith('.prom'):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.summary(), indent=1)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, self.path)  # the collectors never read a partial file
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.write()
+
+    def finish(self):
+        self._stop.set()
+        self.write()
+
+
+def start(path: str = None, command: str = None, interval: float = INTERVAL):
+    """Collect the metrics of the run to «path» (nothing if None), written every «interval» seconds and at exit."""
+    global _metrics
+    finish()  # eg. several commands run in the same process
+    if not path:
+        return
+    _metrics = Metrics(path, labels={'command': command} if command else None, interval=interval)
+    atexit.register(finish)
+
+
+def finish():
+    global _metrics
+    if _metrics:
+        _metrics.finish()
+        _metrics = None
+
+
+def enabled() -> bool:
+    return _metrics is not None
+
+
+def count(name: str, value: float = 1, **labels):
+    if _metrics:
+        _metrics.count(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    if _metrics:
+        _metrics.observe(name, value, **labels)
+
+
+def record_request(method: str, url: str, status, size, latency: float):
+    if _metrics:
+        host, path = endpoint(url)
+        _metrics.count('http_requests_total', host=host, method=method, endpoint=path, status=status)
+        _metrics.count('http_response_bytes_total', size or 0, host=host, endpoint=path)
+        _metrics.observe('http_request_seconds', latency, host=host, method=method, endpoint=path)
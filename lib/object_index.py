@@ -0,0 +1,42 @@
+class ObjectIndex:
+    """Objects of an Overpass result indexed by wikidata, wikipedia, name and (type, id), built in a single pass."""
+
+    def __init__(self, result):
+        self.n_nodes = len(result.nodes)
+        self.n_ways = len(result.ways)
+        self.n_relations = len(result.relations)
+        self.objects = result.nodes + result.ways + result.relations
+        self.by_key = {}
+        self.by_wikidata = {}
+        self.by_wikipedia = {}
+        self.by_name = {}
+        for osm_object in self.objects:
+            self.by_key[(osm_object._type_value, osm_object.id)] = osm_object
+            tags = osm_object.tags
+            if tags.get('wikidata'):
+                self.by_wikidata.setdefault(tags['wikidata'], []).append(osm_object)
+            if tags.get('wikipedia'):
+                self.by_wikipedia.setdefault(tags['wikipedia'], []).append(osm_object)
+            if tags.get('name'):
+                self.by_name.setdefault(tags['name'], []).append(osm_object)
+        # values in order of appearance, as the dict keys
+        self.wikidata_counts = {key: len(value) for key, value in self.by_wikidata.items()}
+        self.wikipedia_counts = {key: len(value) for key, value in self.by_wikipedia.items()}
+        self.name_counts = {key: len(value) for key, value in self.by_name.items()}
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def get(self, osm_type: str, osm_id: int):
+        return self.by_key.get((osm_type, int(osm_id)))
+
+    def count_objects(self, counts: dict, keys) -> int:
+        """Number of objects with any of the «keys» in «counts» (eg. index.wikidata_counts)."""
+        return sum(counts.get(key, 0) for key in keys)
+
+    def summary(self) -> str:
+        return (f'{len(self)} objects found ({self.n_nodes} nodes, {self.n_ways}'
+                f' ways and {self.n_relations} relations).')
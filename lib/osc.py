@@ -0,0 +1,192 @@
+import json
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+from typing import TYPE_CHECKING
+
+from . import __version__, osm_utils
+
+if TYPE_CHECKING:
+    import osmapi
+
+# Edits exported to an osmChange file (https://wiki.openstreetmap.org/wiki/OsmChange) to review without login and
+# upload later with upload_osc. The file has a <modify> with the complete element for every edited object, with the
+# version the reviewer saw, and the tags of the changeset in a comment.
+TYPES = ['node', 'way', 'relation']
+CHANGESET_COMMENT = ' changeset: '
+OSC_END = b'  </modify>\n</osmChange>\n'
+
+
+def element_data(osm_object) -> dict:
+    """osmapi structure of an overpy element from an Overpass query with "out meta"."""
+    version = osm_object.attributes.get('version')
+    if version is None:
+        raise ValueError(f'{osm_object._type_value} {osm_object.id} without version. The Overpass query must use'
+                         ' "out meta" to export the edits.')
+    data = {'id': osm_object.id, 'tag': dict(osm_object.tags), 'version': int(version)}
+    if osm_object._type_value == 'node':
+        data.update({'lat': osm_object.lat, 'lon': osm_object.lon})
+    elif osm_object._type_value == 'way':
+        data['nd'] = list(osm_object._node_ids)
+    else:
+        data['member'] = [{'type': x._type_value, 'ref': x.ref, 'role': x.role} for x in osm_object.members]
+    return data
+
+
+class OscWriter:
+    """Stand-in of osmapi.OsmApi for the commands that appends every edit to the osmChange file «path» as soon as it is
+    accepted, without requests to the OSM API. The file is valid after every edit, so an interrupted review keeps the
+    edits accepted until then. An object edited again is appended again with all its tags and read_osc keeps the last
+    one."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.changeset_tags = None
+        self.n_changesets = 0
+        self.elements = {}  # {(osm_type, osm_id): data} with the base version
+        self.file = None
+
+    def ChangesetCreate(self, changeset_tags: dict) -> int:
+        if self.changeset_tags is None:  # upload_osc splits the changesets
+            self.changeset_tags = dict(changeset_tags)
+        self.n_changesets = self.n_changesets + 1
+        return self.n_changesets
+
+    def ChangesetClose(self) -> int:
+        return self.n_changesets
+
+    def _add(self, osm_object, tags: dict) -> tuple:
+        key = (osm_object._type_value, osm_object.id)
+        if key not in self.elements:
+            self.elements[key] = element_data(osm_object)
+        self.elements[key]['tag'].update(tags)
+        return key
+
+    def add(self, osm_object, tags: dict) -> dict:
+        """Add «tags» to the overpy element «osm_object», at the version returned by Overpass."""
+        self._write([self._add(osm_object, tags)])
+        return {'id': osm_object.id, 'tag': dict(tags)}
+
+    def add_all(self, osm_objects: list, object_updates: dict) -> list:
+        """As add for the objects of «object_updates» ({osm_type: {osm_id: tags}}). Returns the results as
+        osmapi.ChangesetUpload."""
+        keys = []
+        results = {}
+        for osm_object in osm_objects:
+            tags = object_updates.get(osm_object._type_value, {}).get(osm_object.id)
+            if tags:
+                keys.append(self._add(osm_object, tags))
+                results.setdefault(osm_object._type_value, []).append({'id': osm_object.id, 'tag': dict(tags)})
+        self._write(keys)
+        return [{'type': osm_type, 'action': 'modify', 'data': data} for osm_type, data in results.items()]
+
+    def _update(self, osm_type: str, data: dict) -> dict:
+        data = {key: data[key] for key in osm_utils.ELEMENT_KEYS[osm_type]}
+        key = (osm_type, int(data['id']))
+        self.elements[key] = dict(data, tag=dict(data['tag']))
+        self._write([key])
+        return data
+
+    def NodeUpdate(self, data: dict) -> dict:
+        return self._update('node', data)
+
+    def WayUpdate(self, data: dict) -> dict:
+        return self._update('way', data)
+
+    def RelationUpdate(self, data: dict) -> dict:
+        return self._update('relation', data)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def _write(self, keys: list):
+        if self.file is None:
+            self.file = open(self.path, 'wb')
+            self.file.write(osc_header(self.changeset_tags))
+        for key in keys:
+            self.file.write(element_xml(key[0], self.elements[key]))
+        # the end of the document is overwritten by the next elements
+        end = self.file.tell()
+        self.file.write(OSC_END)
+        self.file.flush()
+        self.file.seek(end)
+
+    def close(self) -> int:
+        """Number of objects in the file."""
+        if self.file is None:
+            self._write([])
+        self.file.close()
+        return len(self.elements)
+
+
+def osc_header(changeset_tags: dict = None) -> bytes:
+    """Start of an osmChange file, up to the <modify>, with the «changeset_tags» in a comment."""
+    header = ("<?xml version='1.0' encoding='utf-8'?>\n"
+              f'<osmChange version="0.6" generator={quoteattr(f"LangToolsOSM {__version__}")}>\n')
+    if changeset_tags:
+        # "--" is not allowed in XML comments
+        comment = ET.Comment(CHANGESET_COMMENT + json.dumps(changeset_tags, ensure_ascii=False).replace('--', '-\\u002d') + ' ')
+        header = header + '  ' + ET.tostring(comment, encoding='unicode') + '\n'
+    return (header + '  <modify>\n').encode('utf-8')
+
+
+def element_xml(osm_type: str, data: dict) -> bytes:
+    """<node>, <way> or <relation> of «data», in the osmapi structure, indented inside the <modify>."""
+    element = ET.Element(osm_type, id=str(data['id']), version=str(data['version']))
+    if osm_type == 'node':
+        element.set('lat', str(data['lat']))
+        element.set('lon', str(data['lon']))
+    elif osm_type == 'way':
+        for ref in data['nd']:
+            ET.SubElement(element, 'nd', ref=str(ref))
+    elif osm_type == 'relation':
+        for member in data['member']:
+            ET.SubElement(element, 'member', type=member['type'], ref=str(member['ref']), role=member['role'])
+    for key, value in sorted(data['tag'].items()):
+        ET.SubElement(element, 'tag', k=key, v=str(value))
+    ET.indent(element, level=2)
+    return ('    ' + ET.tostring(element, encoding='unicode') + '\n').encode('utf-8')
+
+
+def read_osc(path: str) -> tuple:
+    """(changeset_tags, [(osm_type, data)]) of an osmChange file with modifications only. An object modified several
+    times is returned once, with its last modification."""
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    root = ET.parse(path, parser=parser).getroot()
+    if root.tag != 'osmChange':
+        raise ValueError(f'{path} is not an osmChange file')
+    changeset_tags = {}
+    elements = {}
+    for action in root:
+        if action.tag is ET.Comment:
+            if action.text.startswith(CHANGESET_COMMENT):
+                changeset_tags = json.loads(action.text[len(CHANGESET_COMMENT):])
+            continue
+        if action.tag != 'modify':
+            raise ValueError(f'Unsupported action <{action.tag}> in {path}. Only <modify> is supported.')
+        for element in action:
+            data = {'id': int(element.get('id')), 'version': int(element.get('version')),
+                    'tag': {tag.get('k'): tag.get('v') for tag in element.findall('tag')}}
+            if element.tag == 'node':
+                data.update({'lat': float(element.get('lat')), 'lon': float(element.get('lon'))})
+            elif element.tag == 'way':
+                data['nd'] = [int(nd.get('ref')) for nd in element.findall('nd')]
+            elif element.tag == 'relation':
+                data['member'] = [{'type': member.get('type'), 'ref': int(member.get('ref')), 'role': member.get('role')}
+                                  for member in element.findall('member')]
+            else:
+                raise ValueError(f'Unknown element <{element.tag}> in {path}')
+            elements[(element.tag, data['id'])] = data  # the last one of an object edited again
+    return changeset_tags, [(osm_type, data) for (osm_type, _), data in elements.items()]
+
+
+def conflicts(api: 'osmapi.OsmApi', elements: list) -> list:
+    """(osm_type, data, current_version) of the «elements» modified in OSM after their version, with bulk downloads."""
+    found = []
+    for osm_type in TYPES:
+        data = {x['id']: x for t, x in elements if t == osm_type}
+        current = osm_utils.get_elements(api, osm_type, list(data.keys()))
+        for osm_id, element in data.items():
+            version = current[osm_id]['version'] if osm_id in current else None
+            if version != element['version']:
+                found.append((osm_type, element, version))
+    return found
@@ -1,73 +1,116 @@
 import getpass
-import osmapi
-import overpy
+import os
 import re
 import sys
-import time
+from typing import TYPE_CHECKING
 from colorama import Fore, Style
 
+from . import daemon, metrics, osc, profiling, transport
 
-def login_osm(username=None, passwordfile=None) -> osmapi.OsmApi:
+if TYPE_CHECKING:
+    import osmapi
+    import overpy
+    import requests
+
+# Endpoints can point to other instances or to local stand-ins (see benchmarks/standin.py)
+OVERPASS_API = os.environ.get('LANGTOOLSOSM_OVERPASS_API', 'https://overpass-api.de/api/interpreter')
+OSM_API = os.environ.get('LANGTOOLSOSM_OSM_API', 'https://www.openstreetmap.org')
+OVERPASS_TIMEOUT = (10, 1100)  # the queries ask for [timeout:1000]
+ELEMENT_KEYS = {'node': ['id', 'lat', 'lon', 'tag', 'version'], 'way': ['id', 'nd', 'tag', 'version'],
+                'relation': ['id', 'member', 'tag', 'version']}
+
+
+def new_osm_api(**credentials) -> 'osmapi.OsmApi':
+    """osmapi.OsmApi for OSM_API through the shared transport, with the retries of transport.OSM_RETRY."""
+    import osmapi
+    return osmapi.OsmApi(api=OSM_API, session=transport.new_session(transport.OSM_RETRY),
+                         created_by=transport.USER_AGENT, **credentials)
+
+
+def login_osm(username=None, passwordfile=None) -> 'osmapi.OsmApi':
     if passwordfile:
-        return osmapi.OsmApi(passwordfile=passwordfile)
+        return new_osm_api(passwordfile=passwordfile)
     if not username:
-        username = input('User: ')
+        username = profiling.user_input('User: ')
     password = getpass.getpass('Password: ')
-    return osmapi.OsmApi(username=username, password=password)
+    return new_osm_api(username=username, password=password)
+
 
+def overpass_result(response: 'requests.Response', query: str) -> 'overpy.Result':
+    """Parse an Overpass response as overpy.Overpass.query, with its exceptions for the error status codes."""
+    import overpy
+    if response.status_code == 200:
+        content_type = response.headers.get('Content-Type', '').split(';')[0]
+        if content_type == 'application/json':
+            return overpy.Overpass().parse_json(response.content)
+        if content_type == 'application/osm3s+xml':
+            return overpy.Overpass().parse_xml(response.content)
+        raise overpy.exception.OverpassUnknownContentType(content_type)
+    if response.status_code == 400:
+        raise overpy.exception.OverpassBadRequest(query, msgs=[response.text])
+    if response.status_code == 429:
+        raise overpy.exception.OverpassTooManyRequests()
+    if response.status_code == 504:
+        raise overpy.exception.OverpassGatewayTimeout()
+    raise overpy.exception.OverpassUnknownHTTPStatusCode(response.status_code)
 
-def get_overpass_result(area: str, filters: str, query: str = None, coords=False, retry=2, sleep_retry=10) -> overpy.Result:
-    overpass_api = overpy.Overpass()
+
+def overpass_query(area: str, filters: str, coords=False, meta=False) -> str:
+    """Overpass query for the objects matching «filters» in «area» (a bounding box, an area filter or a name). With
+    «meta», the objects have their version and geometry to export the edits without downloads (see osc.OscWriter)."""
     # filters = "nwr['name']['wikidata'][~'name:[a-z]+'~'.']"
+    query = '[timeout:1000];\n'
+    if re.search('([0-9.-]+,){3}[0-9.-]+', area):
+        area = area.replace('[', '').replace(']', '').replace('(', '').replace(')', '')
+        south = area.split(',')[0]
+        west = area.split(',')[1]
+        north = area.split(',')[2]
+        east = area.split(',')[3]
+
+        query = query + ('(\n'
+                         f"""   {filters}({south},{west},{north},{east});"""
+                         '\n);')
+    elif re.search(r'^\[.+\]$', area):
+        query = query + (f"""area{area}->.searchArea;"""
+                         '\n(\n'
+                         f"""    {filters}(area.searchArea);"""
+                         '\n);')
+    else:
+        query = query + (f"""area[name="{area}"]->.searchArea;"""
+                         '\n(\n'
+                         f"""    {filters}(area.searchArea);"""
+                         '\n);')
+
+    query = query + '\nout ' + ('meta' if meta else 'tags') + (' center' if coords else '') + ' qt;'
+    return query
+
+
+def query_overpass(area: str, filters: str, query: str = None, coords=False, meta=False, retry=2, sleep_retry=10) -> 'overpy.Result':
+    """As get_overpass_result, but raises the overpy exceptions (eg. OverpassTooManyRequests after the retries)
+    instead of printing them and exiting."""
+    import overpy
     if query is None:
-        query = '[timeout:1000];\n'
-        if re.search('([0-9.-]+,){3}[0-9.-]+', area):
-            area = area.replace('[', '').replace(']', '').replace('(', '').replace(')', '')
-            south = area.split(',')[0]
-            west = area.split(',')[1]
-            north = area.split(',')[2]
-            east = area.split(',')[3]
-
-            query = query + ('(\n'
-                             f"""   {filters}({south},{west},{north},{east});"""
-                             '\n);')
-        elif re.search(r'^\[.+\]$', area):
-            query = query + (f"""area{area}->.searchArea;"""
-                             '\n(\n'
-                             f"""    {filters}(area.searchArea);"""
-                             '\n);')
-        else:
-            query = query + (f"""area[name="{area}"]->.searchArea;"""
-                             '\n(\n'
-                             f"""    {filters}(area.searchArea);"""
-                             '\n);')
+        query = overpass_query(area, filters, coords=coords, meta=meta)
+    data = daemon.overpass(query)
+    if data is not None:
+        return overpy.Result.from_json(data)
+    policy = transport.RetryPolicy(retries=retry, statuses=(429, 504), backoff=sleep_retry, factor=1)
+    with profiling.phase('query'):
+        response = transport.post(OVERPASS_API, data=query.encode('utf-8'), policy=policy, timeout=OVERPASS_TIMEOUT)
+    return overpass_result(response, query)
 
-        if coords:
-            query = query + '\nout tags center qt;'
-        else:
-            query = query + '\nout tags qt;'
 
+def get_overpass_result(area: str, filters: str, query: str = None, coords=False, meta=False, retry=2, sleep_retry=10) -> 'overpy.Result':
+    import overpy
     try:
-        result = overpass_api.query(query=query)
+        return query_overpass(area, filters, query=query, coords=coords, meta=meta, retry=retry, sleep_retry=sleep_retry)
     except (overpy.exception.OverpassTooManyRequests, overpy.exception.OverpassGatewayTimeout) as error:
-        result = None
-        for t in range(1, retry + 1):
-            print('Overpass response: ', str(error).removeprefix("<class 'overpy.exception.").removesuffix("'>"), ' Retry ' + str(t) + ' of ' + str(retry))
-            time.sleep(sleep_retry)
-            if result is None:
-                try:
-                    overpass_api.query(query=query)
-                except (overpy.exception.OverpassTooManyRequests, overpy.exception.OverpassGatewayTimeout) as error0:
-                    pass
-            else:
-                return result
-        if result is None:
-            print(Fore.RED + 'No overpass results after ' + str(retry) + ' retries. ' + repr(error) + Style.RESET_ALL)
-            sys.exit(1)
-    return result
+        print(Fore.RED + 'No overpass results after ' + str(retry) + ' retries. ' + repr(error) + Style.RESET_ALL)
+        sys.exit(1)
 
 
 def print_osm_object(osm_object, remark='name', verbose=False):
+    import overpy
     if isinstance(osm_object, overpy.Element):  # overpy object
         tags = osm_object.tags
         osm_id = osm_object.id
@@ -99,7 +142,8 @@ def print_osm_object(osm_object, remark='name', verbose=False):
     print("------------------------------------------------------")
 
 
-def update_osm_object(osm_object, tags: dict, api: osmapi.OsmApi) -> dict:
+def update_osm_object(osm_object, tags: dict, api: 'osmapi.OsmApi', confirm=True) -> dict:
+    import overpy
     if isinstance(osm_object, overpy.Element):
         object_tags = osm_object.tags
     elif isinstance(osm_object, dict):
@@ -117,39 +161,130 @@ def update_osm_object(osm_object, tags: dict, api: osmapi.OsmApi) -> dict:
         if len(overwrite_tags) > 0:
             print(Fore.RED + Style.BRIGHT + '- ' + str(overwrite_tags) + Style.RESET_ALL)
     print(Fore.GREEN + Style.BRIGHT + '+ ' + str(tags) + Style.RESET_ALL)
-    allow_update = input('Add tags [Y/n]: ').lower()
+    allow_update = profiling.user_input('Add tags [Y/n]: ').lower() if confirm else 'yes'
+    if confirm:
+        metrics.count('decisions_total', decision='confirm' if allow_update in ['y', 'yes', ''] else 'reject')
     if allow_update in ['y', 'yes', '']:
-        if isinstance(osm_object, overpy.Node):
-            node = api.NodeGet(osm_object.id)
-            node_data = {
-                'id': node['id'],
-                'lat': node['lat'],
-                'lon': node['lon'],
-                'tag': node['tag'],
-                'version': node['version'],
-            }
-            node_data['tag'].update(tags)
-            return api.NodeUpdate(node_data)
-        elif isinstance(osm_object, overpy.Way):
-            way = api.WayGet(osm_object.id)
-            way_data = {
-                'id': way['id'],
-                'nd': way['nd'],
-                'tag': way['tag'],
-                'version': way['version'],
-            }
-            way_data['tag'].update(tags)
-            return api.WayUpdate(way_data)
-        elif isinstance(osm_object, overpy.Relation):
-            rel = api.RelationGet(osm_object.id)
-            rel_data = {
-                'id': rel['id'],
-                'member': rel['member'],
-                'tag': rel['tag'],
-                'version': rel['version'],
-            }
-            rel_data['tag'].update(tags)
-            return api.RelationUpdate(rel_data)
+        with profiling.phase('commit'):
+            updated = None
+            if isinstance(api, osc.OscWriter):  # exported to an osmChange file at the version of the query
+                updated = api.add(osm_object, tags)
+                if updated:
+                    metrics.count('exports_total', type=osm_object._type_value)
+                return updated
+            daemon.notify_edit()
+            if isinstance(osm_object, overpy.Node):
+                node = api.NodeGet(osm_object.id)
+                node_data = {
+                    'id': node['id'],
+                    'lat': node['lat'],
+                    'lon': node['lon'],
+                    'tag': node['tag'],
+                    'version': node['version'],
+                }
+                node_data['tag'].update(tags)
+                updated = api.NodeUpdate(node_data)
+            elif isinstance(osm_object, overpy.Way):
+                way = api.WayGet(osm_object.id)
+                way_data = {
+                    'id': way['id'],
+                    'nd': way['nd'],
+                    'tag': way['tag'],
+                    'version': way['version'],
+                }
+                way_data['tag'].update(tags)
+                updated = api.WayUpdate(way_data)
+            elif isinstance(osm_object, overpy.Relation):
+                rel = api.RelationGet(osm_object.id)
+                rel_data = {
+                    'id': rel['id'],
+                    'member': rel['member'],
+                    'tag': rel['tag'],
+                    'version': rel['version'],
+                }
+                rel_data['tag'].update(tags)
+                updated = api.RelationUpdate(rel_data)
+            if updated:
+                metrics.count('edits_total', type=osm_object._type_value)
+            return updated
+
+
+def confirm_osm_objects(osm_objects: list, tags: dict, confirm=True) -> list:
+    """Show the same tags to add to several objects and ask one confirmation. Returns the (osm_object, tags) to update,
+    with the tags that change every object, or an empty list."""
+    updates = []
+    overwrite_tags = {}
+    for osm_object in osm_objects:
+        object_tags = {key: value for key, value in tags.items() if osm_object.tags.get(key) != value}
+        for key in object_tags.keys():
+            if key in osm_object.tags.keys():
+                overwrite_tags.setdefault(key, set()).add(osm_object.tags[key])
+        if object_tags:
+            updates.append((osm_object, object_tags))
+    if not updates:
+        print(Fore.BLUE + 'SKIP: No tag updates.' + Style.RESET_ALL)
+        return []
+    if overwrite_tags:
+        print(Fore.RED + Style.BRIGHT + '- ' + str({key: sorted(values) for key, values in sorted(overwrite_tags.items())}) + Style.RESET_ALL)
+    print(Fore.GREEN + Style.BRIGHT + f'+ {tags} in {len(updates)} objects' + Style.RESET_ALL)
+    allow_update = profiling.user_input(f'Add tags to {len(updates)} objects [Y/n]: ').lower() if confirm else 'yes'
+    if confirm:
+        metrics.count('decisions_total', decision='confirm' if allow_update in ['y', 'yes', ''] else 'reject')
+    if allow_update not in ['y', 'yes', '']:
+        return []
+    return updates
+
+
+def commit_osm_objects(updates: list, api: 'osmapi.OsmApi', chunk_size=500) -> list:
+    """Upload the (osm_object, tags) «updates» to the open changeset with bulk downloads and diff uploads. Returns the
+    results of osmapi.ChangesetUpload."""
+    object_updates = {}
+    for osm_object, object_tags in updates:
+        object_updates.setdefault(osm_object._type_value, {})[osm_object.id] = object_tags
+    with profiling.phase('commit'):
+        if isinstance(api, osc.OscWriter):  # exported to an osmChange file at the version of the query
+            committed = api.add_all([osm_object for osm_object, _ in updates], object_updates)
+            for result in committed:
+                metrics.count('exports_total', len(result['data']), type=result['type'])
+            return committed
+        return upload_tags(api, object_updates, chunk_size=chunk_size)
+
+
+def update_osm_objects(osm_objects: list, tags: dict, api: 'osmapi.OsmApi', confirm=True, chunk_size=500) -> list:
+    """Add the same tags to several objects with one confirmation, bulk downloads and diff uploads to the open changeset."""
+    updates = confirm_osm_objects(osm_objects, tags, confirm=confirm)
+    if not updates:
+        return []
+    return commit_osm_objects(updates, api, chunk_size=chunk_size)
+
+
+def get_elements(api: 'osmapi.OsmApi', osm_type: str, ids: list) -> dict:
+    """Current data of the «ids» elements of «osm_type» ({osm_id: data}) with the keys to update them, downloaded in
+    groups of 100 elements."""
+    get_functions = {'node': api.NodesGet, 'way': api.WaysGet, 'relation': api.RelationsGet}
+    elements = {}
+    for ndx in range(0, len(ids), 100):  # keep the URL of the multi fetch short
+        for osm_id, data in get_functions[osm_type](ids[ndx:ndx + 100]).items():
+            elements[int(osm_id)] = {key: data[key] for key in ELEMENT_KEYS[osm_type]}
+    return elements
+
+
+def upload_tags(api: 'osmapi.OsmApi', object_updates: dict, chunk_size=500) -> list:
+    """Add the tags of «object_updates» ({osm_type: {osm_id: tags}}) to the current version of the objects with bulk
+    downloads and diff uploads to the open changeset. Returns the results of osmapi.ChangesetUpload."""
+    daemon.notify_edit()
+    committed = []
+    for osm_type, updates in object_updates.items():
+        elements = []
+        for osm_id, data in get_elements(api, osm_type, list(updates.keys())).items():
+            data['tag'].update(updates[osm_id])
+            elements.append(data)
+        # One change per upload: osmapi matches the diff result with the elements of each change from the start
+        for ndx in range(0, len(elements), chunk_size):
+            result = api.ChangesetUpload([{'type': osm_type, 'action': 'modify', 'data': elements[ndx:ndx + chunk_size]}])
+            metrics.count('edits_total', sum(len(x['data']) for x in result), type=osm_type)
+            committed = committed + result
+    return committed
 
 
 def print_changeset_status(changeset: dict, n_edits: int, n_changeset: int, verbose: int):
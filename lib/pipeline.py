@@ -0,0 +1,112 @@
+import math
+import queue
+import re
+import threading
+
+from . import osm_utils
+
+# Stages are generators. background() runs a stage in a thread and hands its items to the next stage through a bounded
+# queue, so the objects can be reviewed while the next tiles and wikidata batches are downloaded:
+#   stream = background(enrich(background(source(area, filters, tiles=4)), fetch=...), maxsize=100)
+#   for osm_object in stream:  # review and commit in the main thread
+_DONE = object()
+
+
+class _Error:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def background(stage, maxsize=1):
+    """Start iterating «stage» in a thread and return a generator with its items. At most «maxsize» items wait in the
+    queue. Exceptions of the stage are raised by the generator and closing the generator stops the thread."""
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in stage:
+                if not put(item):
+                    return
+        except BaseException as error:  # also SystemExit from the retries of get_overpass_result
+            put(_Error(error))
+        else:
+            put(_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    def consume():
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Error):
+                    raise item.error
+                yield item
+        finally:
+            stop.set()
+
+    return consume()
+
+
+def tile_areas(area: str, tiles: int) -> list:
+    """Split a bounding box area ("south,west,north,east") in a grid of about «tiles» cells. Other areas can't be split."""
+    if tiles <= 1 or not area or not re.search('([0-9.-]+,){3}[0-9.-]+', area):
+        return [area]
+    south, west, north, east = [float(x) for x in re.sub(r'[\[\]()]', '', area).split(',')]
+    rows = max(1, round(math.sqrt(tiles)))
+    cols = math.ceil(tiles / rows)
+    height = (north - south) / rows
+    width = (east - west) / cols
+    return [f'{south + height * i},{west + width * j},{south + height * (i + 1)},{west + width * (j + 1)}'
+            for i in range(rows) for j in range(cols)]
+
+
+def source(area: str, filters: str, query: str = None, coords=False, meta=False, tiles=1, fetch=None):
+    """Query Overpass tile by tile and yield the list of objects of every tile. Objects on the border of two tiles are
+    yielded once. «fetch» queries a tile, default to osm_utils.get_overpass_result."""
+    fetch = fetch or osm_utils.get_overpass_result
+    seen = set()
+    for tile in tile_areas(area, tiles) if not query else [None]:
+        result = fetch(area=tile, filters=filters, query=query, coords=coords, meta=meta)
+        objects = []
+        for osm_object in result.nodes + result.ways + result.relations:
+            key = (osm_object._type_value, osm_object.id)
+            if key not in seen:
+                seen.add(key)
+                objects.append(osm_object)
+        yield objects
+
+
+def enrich(chunks, fetch, batch_size=50):
+    """Yield the objects of «chunks» after calling «fetch» with their wikidata ids not fetched before. «fetch» is called
+    with at most «batch_size» ids and stores the results for the next stages (eg. the translations of the ids)."""
+    fetched = set()
+    for objects in chunks:
+        pending = []
+        ids = []
+        for osm_object in objects:
+            wikidata = osm_object.tags.get('wikidata')
+            if wikidata and wikidata not in fetched:
+                fetched.add(wikidata)
+                ids.append(wikidata)
+            pending.append(osm_object)
+            if len(ids) >= batch_size:
+                fetch(ids)
+                yield from pending
+                pending = []
+                ids = []
+        if ids:
+            fetch(ids)
+        yield from pending
@@ -0,0 +1,188 @@
+import atexit
+import contextlib
+import cProfile
+import json
+import sys
+import threading
+import time
+
+from . import metrics
+
+_profiler = None
+
+
+class Profiler:
+    def __init__(self, path: str, cpu=False):
+        self.path = path
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.events = []
+        self.requests = []
+        self.thinking = 0.0
+        self.prompts = 0
+        self.cpu = cProfile.Profile() if cpu else None
+        self.finished = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self.cpu:
+            self.cpu.enable()
+
+    @property
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = [['setup', time.perf_counter(), 0.0]]
+        return self._local.stack
+
+    def _close(self, name: str, start: float, children: float) -> float:
+        duration = time.perf_counter() - start
+        with self._lock:
+            phase = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            phase['calls'] += 1
+            phase['seconds'] += duration - children  # exclusive time
+            self.events.append({'type': 'phase', 'name': name, 'start': round(start - self.start, 4),
+                                'duration': round(duration, 4)})
+        return duration
+
+    def push(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def pop(self):
+        name, start, children = self._stack.pop()
+        duration = self._close(name, start, children)
+        if self._stack:
+            self._stack[-1][2] += duration
+
+    def switch(self, name: str):
+        stack = self._stack
+        self._close(*stack[0])
+        stack[0] = [name, time.perf_counter(), 0.0]
+
+    def record_request(self, method: str, url: str, status, size, latency: float):
+        host, endpoint = metrics.endpoint(url)  # group the requests by object type
+        with self._lock:
+            self.requests.append({'method': method, 'host': host, 'endpoint': endpoint, 'status': status,
+                                  'bytes': size, 'latency': round(latency, 4),
+                                  'start': round(time.perf_counter() - latency - self.start, 4)})
+
+    def user_input(self, prompt: str) -> str:
+        if self.cpu:
+            self.cpu.disable()
+        self.push('user')
+        try:
+            return input(prompt)
+        finally:
+            name, start, children = self._stack.pop()
+            duration = time.perf_counter() - start
+            self.thinking += duration
+            self.prompts += 1
+            self.events.append({'type': 'prompt', 'prompt': prompt, 'start': round(start - self.start, 4),
+                                'duration': round(duration, 4)})
+            if self._stack:
+                self._stack[-1][2] += duration
+            if self.cpu:
+                self.cpu.enable()
+
+    def trace(self) -> dict:
+        wall_time = time.perf_counter() - self.start
+        interactive = sum(v['seconds'] for k, v in self.phases.items() if k in ['review', 'commit'])
+        return {'argv': sys.argv, 'start': self.start_time, 'wall_time': round(wall_time, 4),
+                'phases': {k: {'calls': v['calls'], 'seconds': round(v['seconds'], 4)} for k, v in self.phases.items()},
+                'user': {'prompts': self.prompts, 'thinking': round(self.thinking, 4), 'waiting': round(interactive, 4)},
+                'requests': self.requests, 'events': self.events}
+
+    def summary(self) -> str:
+        trace = self.trace()
+        lines = ['######################################################',
+                 f'PROFILE: {trace["wall_time"]} s wall time. Trace written to {self.path}',
+                 f'{"phase":<24}{"calls":>8}{"seconds":>12}']
+        for name, phase in sorted(trace['phases'].items(), key=lambda x: -x[1]['seconds']):
+            lines.append(f'{name:<24}{phase["calls"]:>8}{phase["seconds"]:>12.3f}')
+        lines.append(f'{"user thinking":<24}{trace["user"]["prompts"]:>8}{trace["user"]["thinking"]:>12.3f}')
+        lines.append(f'{"user waiting":<24}{"":>8}{trace["user"]["waiting"]:>12.3f}')
+        hosts = {}
+        for request in self.requests:
+            key = (request['host'], request['method'], request['endpoint'])
+            values = hosts.setdefault(key, {'calls': 0, 'errors': 0, 'bytes': 0, 'latency': 0.0})
+            values['calls'] += 1
+            values['errors'] += request['status'] != 200
+            values['bytes'] += request['bytes'] or 0
+            values['latency'] += request['latency']
+        if hosts:
+            lines.append(f'{"HTTP request":<56}{"calls":>8}{"errors":>8}{"KiB":>10}{"seconds":>10}')
+            for (host, method, endpoint), values in sorted(hosts.items(), key=lambda x: -x[1]['latency']):
+                name = f'{method} {host}{endpoint}'
+                lines.append(f'{name[:55]:<56}{values["calls"]:>8}{values["errors"]:>8}'
+                             f'{values["bytes"] / 1024:>10.1f}{values["latency"]:>10.3f}')
+        lines.append('######################################################')
+        return '\n'.join(lines)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.cpu:
+            self.cpu.disable()
+            self.cpu.dump_stats(self.path + '.pstats')
+        stack = self._stack
+        while len(stack) > 1:
+            self.pop()
+        self._close(*stack[0])
+        with open(self.path, 'w') as f:
+            json.dump(self.trace(), f, indent=1)
+        print(self.summary())
+
+
+def start(path: str = None, cpu=False):
+    """Start profiling to the JSON trace at «path» (nothing if None). The summary is printed at exit."""
+    global _profiler
+    if not path:
+        return
+    _profiler = Profiler(path, cpu=cpu)
+    atexit.register(finish)
+
+
+def finish():
+    global _profiler
+    if _profiler:
+        _profiler.finish()
+        _profiler = None
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    if not _profiler and not metrics.enabled():
+        yield
+        return
+    if _profiler:
+        _profiler.push(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe('phase_seconds', time.perf_counter() - start, phase=name)
+        if _profiler:
+            _profiler.pop()
+
+
+def switch(name: str):
+    """Change the top level phase (eg. from the initial setup to the review of the objects)."""
+    if _profiler:
+        _profiler.switch(name)
+
+
+def record_request(method: str, url: str, status, size, latency: float):
+    metrics.record_request(method, url, status, size, latency)
+    if _profiler:
+        _profiler.record_request(method, url, status, size, latency)
+
+
+def user_input(prompt: str) -> str:
+    """input() that accounts the time as user thinking while profiling."""
+    start = time.perf_counter()
+    try:
+        if _profiler:
+            return _profiler.user_input(prompt)
+        return input(prompt)
+    finally:
+        metrics.observe('prompt_seconds', time.perf_counter() - start)
@@ -0,0 +1,141 @@
+import configparser
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from . import profiling
+
+# requests per second and burst size for each host. Keys match the host or any of its subdomains.
+DEFAULT_BUDGETS = {
+    'overpass-api.de': (0.5, 2),
+    'www.wikidata.org': (5, 10),
+    'wikipedia.org': (5, 10),
+    'openstreetmap.org': (2, 5),
+    '*': (10, 10),
+}
+
+_budgets = dict(DEFAULT_BUDGETS)
+_buckets = {}
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_time = 0.0
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        # Reserve the tokens while holding the lock and sleep outside it, so concurrent callers queue up in order.
+        with self._lock:
+            self.requests += 1
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens = self._tokens - tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait > 0:
+                self.throttled += 1
+                self.throttled_time += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def _budget_for(host: str) -> tuple:
+    for key, budget in _budgets.items():
+        if key != '*' and (host == key or host.endswith('.' + key)):
+            return budget
+    return _budgets['*']
+
+
+def get_bucket(host: str) -> TokenBucket:
+    with _lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(*_budget_for(host))
+        return _buckets[host]
+
+
+def set_budget(host: str, rate: float, burst: float = 1):
+    with _lock:
+        _budgets[host] = (rate, burst)
+        for bucket_host, bucket in _buckets.items():
+            if bucket_host == host or bucket_host.endswith('.' + host) or host == '*':
+                bucket.rate, bucket.burst = _budget_for(bucket_host)
+
+
+def parse_budget(value: str) -> tuple:
+    rate, _, burst = value.strip().partition('/')
+    return float(rate), float(burst) if burst else 1
+
+
+def parse_rate_limits(rate_limits: str = None) -> dict:
+    """{host: (rate, burst)} from an INI file with a [rate_limits] section or from a "host=rate[/burst],..." string."""
+    if not rate_limits:
+        return {}
+    if os.path.isfile(rate_limits):
+        config = configparser.ConfigParser()
+        config.read(rate_limits)
+        items = config.items('rate_limits') if config.has_section('rate_limits') else []
+    else:
+        items = [item.split('=', 1) for item in rate_limits.split(',') if item.strip()]
+    return {host.strip(): parse_budget(value) for host, value in items}
+
+
+def configure(rate_limits: str = None):
+    """Set per host budgets from an INI file with a [rate_limits] section or from a "host=rate[/burst],..." string."""
+    for host, budget in parse_rate_limits(rate_limits).items():
+        set_budget(host, *budget)
+
+
+def divide(rate_limits: str = None, n: int = 1) -> str:
+    """"host=rate/burst,..." with the budgets (the defaults updated by «rate_limits») split between «n» processes."""
+    budgets = dict(DEFAULT_BUDGETS)
+    budgets.update(parse_rate_limits(rate_limits))
+    return ','.join(f'{host}={rate / n:g}/{max(burst / n, 1):g}' for host, (rate, burst) in budgets.items())
+
+
+def acquire(url: str) -> float:
+    return get_bucket(urlsplit(url).hostname or '').acquire()
+
+
+def stats() -> dict:
+    with _lock:
+        return {host: {'requests': bucket.requests, 'throttled': bucket.throttled,
+                       'throttled_time': round(bucket.throttled_time, 3)} for host, bucket in _buckets.items()}
+
+
+def print_stats():
+    for host, values in stats().items():
+        print(f"{host}: {values['requests']} requests, {values['throttled']} throttled"
+              f" ({values['throttled_time']} s waiting)")
+
+
+def _session_class():
+    import requests
+
+    class Session(requests.Session):
+        """requests.Session that waits for the host budget and accounts every request. Used by osmapi.OsmApi."""
+
+        def request(self, method, url, *args, **kwargs):
+            acquire(url)
+            start = time.perf_counter()
+            response = super().request(method, url, *args, **kwargs)
+            profiling.record_request(method, url, response.status_code, len(response.content), time.perf_counter() - start)
+            return response
+    return Session
+
+
+def __getattr__(name: str):
+    if name == 'Session':  # defined on first use to keep requests out of the startup time
+        globals()['Session'] = _session_class()
+        return globals()['Session']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
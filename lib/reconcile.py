@@ -0,0 +1,144 @@
+import concurrent.futures
+import json
+import math
+import os
+import time
+
+from . import wikimedia
+
+# Propose a wikidata for the objects without one. Every name is searched once with wbsearchentities (several names at
+# the same time), the claims of all the results are fetched in batches and the candidates of every object are ranked by
+# the compatibility of their P31 with the OSM tags and by the distance from their P625 to the object.
+# P31 classes compatible with an OSM tag, by key and value ('*' for any value). Only the direct P31 is compared.
+CLASSES = {
+    'highway': {'*': {'Q79007', 'Q34442', 'Q7543083', 'Q54114'}, 'pedestrian': {'Q79007', 'Q174782'},
+                'motorway': {'Q34442', 'Q46622'}},
+    'place': {'city': {'Q515', 'Q15284', 'Q2074737', 'Q484170'}, 'town': {'Q3957', 'Q15284', 'Q2074737', 'Q484170'},
+              'village': {'Q532', 'Q15284', 'Q2074737', 'Q484170'}, 'hamlet': {'Q5084', 'Q532'},
+              'suburb': {'Q188509', 'Q123705'}, 'neighbourhood': {'Q123705'}, 'square': {'Q174782'},
+              'island': {'Q23442'}},
+    'amenity': {'place_of_worship': {'Q16970', 'Q24398318', 'Q2977', 'Q32815', 'Q34627'},
+                'school': {'Q3914', 'Q9842', 'Q159334'}, 'university': {'Q3918'}, 'hospital': {'Q16917'},
+                'library': {'Q7075'}, 'townhall': {'Q25550691'}, 'theatre': {'Q24354'}},
+    'building': {'church': {'Q16970'}, 'cathedral': {'Q2977'}},
+    'tourism': {'museum': {'Q33506'}},
+    'leisure': {'park': {'Q22698'}, 'stadium': {'Q483110'}},
+    'natural': {'peak': {'Q8502', 'Q207326'}, 'water': {'Q23397'}, 'beach': {'Q40080'}},
+    'waterway': {'river': {'Q4022'}, 'stream': {'Q47521'}},
+    'railway': {'station': {'Q55488'}},
+    'historic': {'castle': {'Q23413'}, 'monument': {'Q4989906'}},
+    'man_made': {'bridge': {'Q12280'}},
+}
+# Never the wikidata of a feature: human, disambiguation page, list and category
+EXCLUDED = {'Q5', 'Q4167410', 'Q13406463', 'Q4167836'}
+SEARCH_LIMIT = 7
+MAX_DISTANCE = 20  # km
+DISTANCE_SCALE = 2  # km
+
+
+def expected_classes(tags: dict) -> set:
+    """P31 classes compatible with the OSM «tags» (empty if unknown)."""
+    classes = set()
+    for key, values in CLASSES.items():
+        if key in tags:
+            classes.update(values.get(tags[key], values.get('*', set())))
+    return classes
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance in km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+class SearchCache:
+    """Candidates by (lang, area, name) in a JSON file. Entries older than «max_age» seconds are ignored."""
+
+    def __init__(self, path: str = None, max_age: float = None):
+        self.path = path
+        self.max_age = max_age
+        self.entries = {}
+        self.hits = 0
+        if path and os.path.isfile(path):
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(lang: str, area: str, name: str) -> str:
+        return '|'.join([lang, area or '', name])
+
+    def get(self, lang: str, area: str, name: str):
+        entry = self.entries.get(self.key(lang, area, name))
+        if entry is None or (self.max_age is not None and time.time() - entry['time'] > self.max_age):
+            return None
+        self.hits = self.hits + 1
+        return entry['candidates']
+
+    def set(self, lang: str, area: str, name: str, candidates: list):
+        self.entries[self.key(lang, area, name)] = {'time': time.time(), 'candidates': candidates}
+
+    def save(self):
+        if self.path:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+
+
+def _candidate(entity: dict, lang: str) -> dict:
+    claims = entity.get('claims', {})
+    p31 = [x['mainsnak']['datavalue']['value']['id'] for x in claims.get('P31', []) if 'datavalue' in x['mainsnak']]
+    coordinates = [x['mainsnak']['datavalue']['value'] for x in claims.get('P625', []) if 'datavalue' in x['mainsnak']]
+    return {'id': entity['id'],
+            'label': entity.get('labels', {}).get(lang, {}).get('value'),
+            'description': entity.get('descriptions', {}).get(lang, {}).get('value'),
+            'P31': p31,
+            'P625': [coordinates[0]['latitude'], coordinates[0]['longitude']] if coordinates else None}
+
+
+def search_candidates(names: list, lang: str, area: str = None, cache: SearchCache = None, workers=4,
+                      limit=SEARCH_LIMIT, batch_size=50) -> dict:
+    """Candidates ({'id', 'label', 'description', 'P31', 'P625'}) for every name ({name: [candidates]}) in the order
+    of wbsearchentities. The names missing in «cache» are searched by «workers» at the same time and the claims of
+    their results fetched in batches of «batch_size» items."""
+    out = {}
+    missing = []
+    for name in dict.fromkeys(names):
+        candidates = cache.get(lang, area, name) if cache else None
+        if candidates is None:
+            missing.append(name)
+        else:
+            out[name] = candidates
+    found = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(wikimedia.search_entities, name, lang, limit): name for name in missing}
+        for future in concurrent.futures.as_completed(futures):
+            found[futures[future]] = future.result()
+    ids = list(dict.fromkeys(x for values in found.values() for x in values))
+    entities = wikimedia.get_entities(ids, languages=[lang], props='labels|descriptions|claims', batch_size=batch_size) if ids else {}
+    for name in missing:
+        out[name] = [_candidate(entities[x], lang) for x in found[name] if x in entities and 'missing' not in entities[x]]
+        if cache:
+            cache.set(lang, area, name, out[name])
+    return out
+
+
+def rank(candidates: list, tags: dict, lat: float = None, lon: float = None, max_distance=MAX_DISTANCE) -> list:
+    """Candidates with a 'score' (higher is better), 'class_match' (None if the tags have no known classes) and
+    'distance' (km, None without coordinates), best first. The excluded classes and the candidates farther than
+    «max_distance» are dropped."""
+    classes = expected_classes(tags)
+    ranked = []
+    for order, candidate in enumerate(candidates):
+        if EXCLUDED.intersection(candidate['P31']):
+            continue
+        class_match = bool(classes.intersection(candidate['P31'])) if classes else None
+        km = None
+        if candidate['P625'] and lat is not None and lon is not None:
+            km = distance(lat, lon, *candidate['P625'])
+            if km > max_distance:
+                continue
+        score = {True: 1.0, None: 0.5, False: 0.0}[class_match]
+        score = score + (1 / (1 + km / DISTANCE_SCALE) if km is not None else 0.25)
+        ranked.append((-score, order, dict(candidate, score=round(score, 3), class_match=class_match,
+                                           distance=round(km, 2) if km is not None else None)))
+    return [x for _, _, x in sorted(ranked, key=lambda x: x[:2])]
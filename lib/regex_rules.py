@@ -0,0 +1,88 @@
+import json
+import re
+
+# Example of a regex rules file for regex_name_lang. Rules are tried in order and the first one matching «name» fills
+# «name:LANG» with «name» modified by its replacement. «lang» defaults to the --lang option.
+# [
+#   {"find": "^Calle ", "replace": "Carrer "},
+#   {"name": "squares", "find": "^Plaza (de )?", "replace": "Plaça "},
+#   {"find": "^Avenida (.+)$", "replace": "Avinguda \\1"},
+#   {"find": "^Carrer ", "replace": "Calle ", "lang": "es"}
+# ]
+_META = set('.^$*+?{}[]\\|()')
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def literal_prefix(find: str) -> str:
+    """Literal text that every match of an anchored regex «find» starts with (eg. "Plaza " for "^Plaza (de )?")."""
+    if not find.startswith('^') or '|' in find:  # an alternation can match without the prefix
+        return ''
+    prefix = ''
+    for char in find[1:]:
+        if char in _META:
+            if char in '*?{' and prefix:  # the last character is optional or repeated
+                prefix = prefix[:-1]
+            break
+        prefix = prefix + char
+    return prefix
+
+
+class RegexRule:
+    def __init__(self, rule: dict, n: int, lang: str = None):
+        self.name = rule.get('name', f'rule {n}')
+        if 'find' not in rule or 'replace' not in rule:
+            raise ValueError(f'Rule "{self.name}": "find" and "replace" are required.')
+        self.find = rule['find']
+        self.replace = rule['replace']
+        self.lang = rule.get('lang', lang)
+        if not self.lang:
+            raise ValueError(f'Rule "{self.name}": missing "lang" and no default language.')
+        self.regex = re.compile(self.find)
+        self.prefix = literal_prefix(self.find)
+        self.hits = 0
+
+    @property
+    def key(self) -> str:
+        return 'name:' + self.lang
+
+
+class Dispatcher:
+    """Ordered regex rules applied in one pass. The names without a match of any rule are rejected by a single combined
+    regex and the rules with a literal prefix are only tried on the names starting with it."""
+
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.combined = None
+        if not any(_BACKREFERENCE.search(rule.find) for rule in rules):  # the combined regex renumbers the groups
+            try:
+                self.combined = re.compile('|'.join(f'(?:{rule.find})' for rule in rules))
+            except re.error:  # eg. global flags not at the start
+                pass
+
+    def match(self, name: str) -> tuple:
+        """Return («rule», «value») for the first rule matching «name» or (None, None)."""
+        if self.combined is not None and self.combined.search(name) is None:
+            return None, None
+        for rule in self.rules:
+            if rule.prefix and not name.startswith(rule.prefix):
+                continue
+            if rule.regex.search(name):
+                return rule, rule.regex.sub(rule.replace, name)
+        return None, None
+
+    def langs(self) -> list:
+        return list(dict.fromkeys(rule.lang for rule in self.rules))
+
+    def overpass_regex(self) -> str:
+        if len(self.rules) == 1:
+            return self.rules[0].find
+        return '|'.join(f'({rule.find})' for rule in self.rules)
+
+    def stats(self) -> str:
+        return ', '.join(f'"{rule.name}" {rule.hits}' for rule in self.rules)
+
+
+def load_regex_rules(file: str, lang: str = None) -> list:
+    with open(file) as f:
+        rules = json.load(f)
+    return [RegexRule(rule, n, lang=lang) for n, rule in enumerate(rules)]
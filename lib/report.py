@@ -0,0 +1,450 @@
+import ast
+import contextlib
+import csv
+import json
+import heapq
+import math
+import os
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FORMATS = ['csv', 'jsonl', 'mediawiki', 'parquet']
+TYPED_FORMATS = ['jsonl', 'parquet']  # native numbers and «all_tags» as a mapping instead of its str()
+REPORT_COLUMNS = ['OSMobject', 'typeOSM', 'idOSM', 'translations', 'wikidata_type', 'wikidata_id', 'multilang_names',
+                  'all_tags', 'latitude', 'longitude']  # not tags, besides «LANG.translations» and «LANG.wikipedia_page»
+SHARD_MODES = ['rows', 'grid', 'wikidata']
+
+
+class TsvWriter:
+    """Tab separated table written row by row. The optional title goes in a first row commented with «#»."""
+
+    def __init__(self, file: str, header: list, table_name: str = None):
+        self.f = open(file, mode='w', newline='')
+        self.writer = csv.writer(self.f, dialect='unix', delimiter='\t')
+        if table_name:
+            if not table_name.startswith('#'):
+                table_name = '# ' + table_name
+            self.writer.writerow([table_name] + [''] * (len(header) - 1))
+        self.writer.writerow(header)
+
+    def writerow(self, row: list):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.f.close()
+
+
+class MediaWikiWriter:
+    """MediaWiki table written row by row, in the same markup as pytablewriter.MediaWikiTableWriter."""
+
+    def __init__(self, file: str, header: list, table_name: str = None):
+        self.f = open(file, mode='w', newline='')
+        chunk = '{| class="wikitable"\n'
+        if table_name:
+            chunk = chunk + f'|+{table_name}\n'
+        chunk = chunk + ''.join(f'! {column}\n' for column in header)
+        self.f.write(chunk)
+
+    def writerow(self, row: list):
+        chunk = '|-\n'
+        for value in row:
+            if value is None:
+                chunk = chunk + '| \n'
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                chunk = chunk + f'| style="text-align:right"| {value}\n'
+            else:
+                chunk = chunk + f'| {value}\n'
+        self.f.write(chunk)
+
+    def close(self):
+        self.f.write('|}\n')
+        self.f.close()
+
+
+class JsonlWriter:
+    """One JSON object per row. Empty values are written as null, like the empty cells of a csv. The optional title
+    goes in a first line {"#": title}."""
+
+    def __init__(self, file: str, header: list, table_name: str = None):
+        self.f = open(file, mode='w', encoding='utf-8')
+        self.header = header
+        if table_name:
+            self.f.write(json.dumps({'#': table_name}, ensure_ascii=False) + '\n')
+
+    def writerow(self, row: list):
+        record = {key: None if value == '' else value for key, value in zip(self.header, row)}
+        self.f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.f.close()
+
+
+def arrow_type(column: str):
+    import pyarrow as pa
+    if column == 'idOSM' or column.endswith(('.count', '.missing')):  # counts of coverage_stats
+        return pa.int64()
+    if column in ['latitude', 'longitude'] or column.endswith('.%'):
+        return pa.float64()
+    if column == 'all_tags':
+        return pa.map_(pa.string(), pa.string())
+    return pa.string()
+
+
+class ParquetWriter:
+    """Parquet file with typed columns and «all_tags» as a map, written in row groups of «batch_size» rows."""
+
+    def __init__(self, file: str, header: list, table_name: str = None, batch_size=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Parquet reports require pyarrow. Install it with "pip install LangToolsOSM[parquet]".')
+        self.pa = pa
+        metadata = {'table_name': table_name} if table_name else None
+        self.schema = pa.schema([pa.field(column, arrow_type(column)) for column in header], metadata=metadata)
+        self.writer = pq.ParquetWriter(file, self.schema)
+        self.batch_size = batch_size
+        self.rows = []
+
+    def writerow(self, row: list):
+        self.rows.append([None if value == '' else value for value in row])
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = [self.pa.array([row[i] for row in self.rows], type=field.type) for i, field in enumerate(self.schema)]
+        self.writer.write_batch(self.pa.record_batch(columns, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {'csv': TsvWriter, 'jsonl': JsonlWriter, 'mediawiki': MediaWikiWriter, 'parquet': ParquetWriter}
+
+
+@contextlib.contextmanager
+def open_report(file: str, file_format: str, header: list, table_name: str = None):
+    """Yield a writer with a «writerow» method. The table is closed even if the rows are interrupted (eg. Ctrl+c)."""
+    if file_format not in WRITERS:
+        raise ValueError(f'File format must be one of {FORMATS}.')
+    writer = WRITERS[file_format](file, header=header, table_name=table_name)
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value)) or type(value).__name__ == 'NAType'
+
+
+def _typed(data: 'pd.DataFrame') -> 'pd.DataFrame':
+    import pandas as pd
+    if 'idOSM' in data.columns:
+        data['idOSM'] = pd.to_numeric(data['idOSM'])
+    for column in ['latitude', 'longitude']:
+        if column in data.columns:
+            data[column] = pd.to_numeric(data[column])
+    return data
+
+
+def _mediawiki_cells(line: str) -> list:
+    cells = []
+    for cell in line[1:].split('||'):
+        attributes, separator, value = cell.partition('|')
+        if separator and '=' in attributes and '[' not in attributes and '{' not in attributes:
+            cell = value  # eg. style="text-align:right"| 12
+        cells.append(cell.strip())
+    return cells
+
+
+def read_mediawiki_rows(file: str):
+    """Yield the header and then the rows (lists of str or None) of the last table in a MediaWiki file, line by line."""
+    with open(file) as f:
+        n_tables = sum(1 for line in f if line.startswith('{|'))
+    table = 0
+    header = []
+    row = None
+    with open(file) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith('{|'):
+                table = table + 1
+            elif table < n_tables or line.startswith('|+'):
+                continue
+            elif line.startswith('|}'):
+                break
+            elif line.startswith('|-'):
+                if row is None:
+                    yield header
+                else:
+                    yield [x if x != '' else None for x in row]
+                row = []
+            elif line.startswith('!'):
+                header.extend(x.strip() for x in line[1:].split('!!'))
+            elif line.startswith('|') and row is not None:
+                row.extend(_mediawiki_cells(line))
+            elif row:  # continuation of a multiline cell
+                row[-1] = row[-1] + '\n' + line
+    if row is None:
+        yield header
+    elif row:
+        yield [x if x != '' else None for x in row]
+
+
+def _skip_jsonl_title(f) -> str:
+    line = f.readline()
+    if line.startswith('{"#":'):
+        return json.loads(line)['#']
+    f.seek(0)
+
+
+def report_title(file: str, file_format='csv') -> str:
+    """Title of the report (eg. the parameters of write_osm_objects_report and the shard) or None."""
+    if file_format == 'csv':
+        with open(file, newline='') as f:
+            title = next(csv.reader(f, dialect='unix', delimiter='\t'), [''])[0]
+        return title[2:] if title.startswith('# ') else None
+    if file_format == 'jsonl':
+        with open(file, encoding='utf-8') as f:
+            return _skip_jsonl_title(f)
+    if file_format == 'mediawiki':
+        title = None
+        with open(file) as f:
+            for line in f:
+                if line.startswith('{|'):
+                    title = None
+                elif line.startswith('|+'):
+                    title = line[2:].rstrip('\n')
+        return title
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(file).metadata or {}
+        return metadata[b'table_name'].decode() if b'table_name' in metadata else None
+    raise ValueError(f'File format must be one of {FORMATS}.')
+
+
+def report_columns(file: str, file_format='csv') -> list:
+    if file_format == 'csv':
+        import pandas as pd
+        return list(pd.read_table(file, skiprows=1, nrows=0).columns)
+    if file_format == 'jsonl':
+        with open(file, encoding='utf-8') as f:
+            _skip_jsonl_title(f)
+            return list(json.loads(f.readline()).keys())
+    if file_format == 'mediawiki':
+        return next(read_mediawiki_rows(file))
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(file).names
+    raise ValueError(f'File format must be one of {FORMATS}.')
+
+
+def read_report_chunks(file: str, file_format='csv', columns: list = None, chunk_size=10000):
+    """Yield DataFrames of up to «chunk_size» rows with only the «columns» (default to all of them).
+
+    Cell values are kept as text except «idOSM» and the coordinates. Empty cells are NaN.
+    """
+    import pandas as pd
+    if file_format == 'csv':
+        chunks = pd.read_table(file, skiprows=1, usecols=columns, dtype=str, keep_default_na=False, na_values=[''],
+                               chunksize=chunk_size)
+        for chunk in chunks:
+            yield _typed(chunk)
+    elif file_format == 'jsonl':
+        with open(file, encoding='utf-8') as f:
+            _skip_jsonl_title(f)
+            with pd.read_json(f, lines=True, dtype=False, convert_dates=False, chunksize=chunk_size) as chunks:
+                for chunk in chunks:
+                    yield chunk[columns] if columns else chunk
+    elif file_format == 'mediawiki':
+        rows = read_mediawiki_rows(file)
+        header = next(rows)
+        positions = [header.index(x) for x in columns] if columns else list(range(len(header)))
+        chunk = []
+        for row in rows:
+            chunk.append([row[i] if i < len(row) else None for i in positions])
+            if len(chunk) >= chunk_size:
+                yield _typed(pd.DataFrame(chunk, columns=[header[i] for i in positions], dtype=object))
+                chunk = []
+        if chunk:
+            yield _typed(pd.DataFrame(chunk, columns=[header[i] for i in positions], dtype=object))
+    elif file_format == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size, columns=columns):
+            chunk = batch.to_pandas()
+            if 'all_tags' in chunk.columns:  # map columns are read as lists of (key, value)
+                chunk['all_tags'] = chunk['all_tags'].map(lambda x: dict(x) if x is not None else {})
+            yield chunk
+    else:
+        raise ValueError(f'File format must be one of {FORMATS}.')
+
+
+def read_report(file: str, file_format='csv', columns: list = None) -> 'pd.DataFrame':
+    import pandas as pd
+    return pd.concat(read_report_chunks(file, file_format=file_format, columns=columns), ignore_index=True)
+
+
+def count_report_rows(file, file_format='csv', chunk_size=100000) -> int:
+    """Number of rows of «file» or of all the files of a list."""
+    if not isinstance(file, str):
+        return sum(count_report_rows(x, file_format=file_format, chunk_size=chunk_size) for x in file)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file).metadata.num_rows
+    if file_format == 'jsonl':
+        with open(file, encoding='utf-8') as f:
+            _skip_jsonl_title(f)
+            return sum(1 for line in f if line.strip())
+    return sum(len(chunk) for chunk in read_report_chunks(file, file_format, columns=['idOSM'], chunk_size=chunk_size))
+
+
+def iter_report_rows(file, file_format='csv', columns: list = None, chunk_size=10000):
+    """Yield the rows of the report as dicts without the empty cells, reading «chunk_size» rows at a time. «file» can
+    be a list of files (eg. shards) read as a single report."""
+    for file in [file] if isinstance(file, str) else file:
+        for chunk in read_report_chunks(file, file_format=file_format, columns=columns, chunk_size=chunk_size):
+            keys = list(chunk.columns)
+            for values in chunk.itertuples(index=False, name=None):
+                yield {key: value for key, value in zip(keys, values) if not _is_empty(value)}
+
+
+def parse_tags(value) -> dict:
+    """Tags recorded in the «all_tags» column: a dict in jsonl and parquet, its str() in csv and mediawiki."""
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str):
+        return ast.literal_eval(value)
+    return {}
+
+
+def prediff_chunk(chunk: 'pd.DataFrame', upload_tags: list) -> tuple:
+    """Compare the «upload_tags» columns with the tags recorded in «all_tags».
+
+    Return the rows with any change, with the unchanged upload cells emptied, and the number of tags added and
+    overwritten by key.
+    """
+    import pandas as pd
+    recorded_tags = chunk['all_tags'].map(parse_tags)
+    changed = pd.Series(False, index=chunk.index)
+    added = {}
+    overwritten = {}
+    for key in upload_tags:
+        edited = chunk[key].astype(object)
+        recorded = recorded_tags.map(lambda tags: tags.get(key)).astype(object)
+        diff = edited.notna() & (edited != recorded)
+        added[key] = int((diff & recorded.isna()).sum())
+        overwritten[key] = int((diff & recorded.notna()).sum())
+        chunk[key] = edited.where(diff)
+        changed = changed | diff
+    return chunk.loc[changed, [x for x in chunk.columns if x != 'all_tags']], added, overwritten
+
+
+def prediff_report(file, file_format='csv', upload_tags: list = (), chunk_size=10000) -> tuple:
+    """Return the rows of the report with changes in «upload_tags» as dicts with only the changed tags, and a summary.
+
+    Needs the «all_tags» column written by write_osm_objects_report. Reads «chunk_size» rows at a time and keeps only
+    the changes. «file» can be a list of files read as a single report.
+    """
+    columns = list(dict.fromkeys(['typeOSM', 'idOSM', 'all_tags'] + list(upload_tags)))
+    rows = []
+    summary = {'rows': 0, 'changed': 0, 'added': dict.fromkeys(upload_tags, 0), 'overwritten': dict.fromkeys(upload_tags, 0)}
+    chunks = (chunk for file in ([file] if isinstance(file, str) else file)
+              for chunk in read_report_chunks(file, file_format=file_format, columns=columns, chunk_size=chunk_size))
+    for chunk in chunks:
+        summary['rows'] = summary['rows'] + len(chunk)
+        changes, added, overwritten = prediff_chunk(chunk, upload_tags)
+        for key in upload_tags:
+            summary['added'][key] = summary['added'][key] + added[key]
+            summary['overwritten'][key] = summary['overwritten'][key] + overwritten[key]
+        keys = list(changes.columns)
+        for values in changes.itertuples(index=False, name=None):
+            rows.append({key: value for key, value in zip(keys, values) if not _is_empty(value)})
+    summary['changed'] = len(rows)
+    return rows, summary
+
+
+def tag_columns(columns: list) -> list:
+    return [x for x in columns if x not in REPORT_COLUMNS and not x.endswith(('.translations', '.wikipedia_page'))]
+
+
+def plain_row(values, header: list, file_format='csv') -> list:
+    """Row read from a report ready for a writer of «file_format»: empty cells as None, python scalars and
+    «all_tags» as a dict or its str()."""
+    row = []
+    for column, value in zip(header, values):
+        if column == 'all_tags':
+            value = parse_tags(value)
+            value = value if file_format in TYPED_FORMATS else str(value)
+        elif _is_empty(value):
+            value = None
+        elif hasattr(value, 'item'):  # numpy scalar
+            value = value.item()
+        row.append(value)
+    return row
+
+
+def shard_path(file: str, shard: int, n_shards: int) -> str:
+    """Path of the shard number «shard» (from 0) of «file». Eg. report.tsv -> report.shard1of4.tsv"""
+    root, extension = os.path.splitext(file)
+    return f'{root}.shard{shard + 1}of{n_shards}{extension}'
+
+
+def shard_title(title: str, shard: int, n_shards: int, mode: str) -> str:
+    return f'{title}, shard={shard + 1}/{n_shards} by {mode}'
+
+
+def parse_shard_title(title: str) -> tuple:
+    """Return («title» without the shard, shard number from 0, number of shards) or (title, None, None)."""
+    match = re.search(r', shard=([0-9]+)/([0-9]+) by [a-z]+$', title or '')
+    if not match:
+        return title, None, None
+    return title[:match.start()], int(match.group(1)) - 1, int(match.group(2))
+
+
+def shard_by_rows(n_rows: int, n_shards: int) -> list:
+    size = math.ceil(n_rows / n_shards) if n_rows else 1
+    return [i // size for i in range(n_rows)]
+
+
+def shard_by_grid(coords: list, n_shards: int) -> list:
+    """Split the (lat, lon) points in «n_shards» cells with the same number of points: columns by longitude and then
+    rows by latitude inside every column. Points without coordinates go to the last cells."""
+    n_columns = math.ceil(math.sqrt(n_shards))
+    cells = [n_shards // n_columns + (1 if j < n_shards % n_columns else 0) for j in range(n_columns)]
+    missing = float('inf')
+    by_lon = sorted(range(len(coords)), key=lambda i: coords[i][1] if coords[i][1] is not None else missing)
+    shards = [0] * len(coords)
+    shard = 0
+    start = 0
+    for j, n_cells in enumerate(cells):
+        end = round(len(coords) * sum(cells[:j + 1]) / n_shards)
+        column = sorted(by_lon[start:end], key=lambda i: coords[i][0] if coords[i][0] is not None else missing)
+        for k, i in enumerate(column):
+            shards[i] = shard + k * n_cells // len(column)
+        shard = shard + n_cells
+        start = end
+    return shards
+
+
+def shard_by_group(keys: list, n_shards: int) -> list:
+    """Keep the rows with the same key (eg. wikidata) in the same shard, balancing the number of rows. Rows without
+    key are single row groups."""
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(key if key else ('row', i), []).append(i)
+    loads = [(0, shard) for shard in range(n_shards)]
+    shards = [0] * len(keys)
+    for rows in sorted(groups.values(), key=len, reverse=True):
+        load, shard = heapq.heappop(loads)
+        for i in rows:
+            shards[i] = shard
+        heapq.heappush(loads, (load + len(rows), shard))
+    return shards
@@ -0,0 +1,100 @@
+import json
+import re
+
+# Example of a rules file. Rules are evaluated in order and the first one with all the conditions true decides.
+# [
+#   {"name": "humans", "if": {"P31": ["human"]}, "then": "skip"},
+#   {"name": "same as wikipedia", "if": {"label_equals_wikipedia": true, "aliases": false}, "then": "accept", "value": "label"},
+#   {"name": "single option", "if": {"candidates": 1}, "then": "accept"},
+#   {"name": "streets", "if": {"name_matches": "^Calle ", "candidate_matches": "^Carrer "}, "then": "accept"}
+# ]
+CONDITIONS = ['aliases', 'candidate_matches', 'candidates', 'has_wikipedia', 'label_equals_wikipedia', 'name_matches', 'P31']
+ACTIONS = ['accept', 'skip', 'ask']
+VALUES = ['first', 'label', 'match', 'name', 'wikipedia']
+
+
+class Rule:
+    def __init__(self, rule: dict, n: int):
+        self.name = rule.get('name', f'rule {n}')
+        self.action = rule.get('then')
+        if self.action not in ACTIONS:
+            raise ValueError(f'Rule "{self.name}": "then" must be one of {ACTIONS}.')
+        conditions = rule.get('if', {})
+        unknown = set(conditions.keys()).difference(CONDITIONS)
+        if unknown:
+            raise ValueError(f'Rule "{self.name}": unknown conditions {unknown}. Valid conditions: {CONDITIONS}.')
+        self.value = rule.get('value', 'match' if 'candidate_matches' in conditions else 'first')
+        if self.value not in VALUES:
+            raise ValueError(f'Rule "{self.name}": "value" must be one of {VALUES}.')
+        self.uses_P31 = 'P31' in conditions
+        self.hits = 0
+        self.candidate_regex = None
+        self.predicates = []  # compiled conditions, cheapest first
+        for key in sorted(conditions.keys(), key=CONDITIONS.index):
+            self.predicates.append(self._compile(key, conditions[key]))
+
+    def _compile(self, key: str, expected):
+        if key == 'aliases':
+            return lambda context: bool(context['translations']['aliases']) == expected
+        if key == 'candidates':
+            return lambda context: len(context['options']) == expected
+        if key == 'has_wikipedia':
+            return lambda context: bool(context['translations']['wikipedia']) == expected
+        if key == 'label_equals_wikipedia':
+            return lambda context: (
+                bool(context['translations']['label'] and context['translations']['wikipedia'] and
+                     context['translations']['label']['value'] == context['translations']['wikipedia']['title']) == expected)
+        if key == 'name_matches':
+            regex = re.compile(expected)
+            return lambda context: regex.search(context['name']) is not None
+        if key == 'candidate_matches':
+            self.candidate_regex = re.compile(expected)
+            return lambda context: any(self.candidate_regex.search(x) for x in context['options'])
+        if key == 'P31':
+            expected = set([expected] if isinstance(expected, str) else expected)
+            return lambda context: not expected.isdisjoint(context['P31'])
+
+    def matches(self, context: dict) -> bool:
+        return all(predicate(context) for predicate in self.predicates)
+
+    def select(self, context: dict):
+        """Value to accept from the options or None if the rule can not provide it."""
+        translations = context['translations']
+        if self.value == 'first':
+            return context['options'][0] if context['options'] else None
+        if self.value == 'label':
+            return translations['label']['value'] if translations['label'] else None
+        if self.value == 'wikipedia':
+            return translations['wikipedia']['title'] if translations['wikipedia'] else None
+        if self.value == 'name':
+            return context['name'] or None
+        if self.value == 'match' and self.candidate_regex:
+            return next((x for x in context['options'] if self.candidate_regex.search(x)), None)
+
+
+def load_rules(file: str) -> list:
+    with open(file) as f:
+        rules = json.load(f)
+    return [Rule(rule, n) for n, rule in enumerate(rules)]
+
+
+def uses_P31(rules: list) -> bool:
+    return any(rule.uses_P31 for rule in rules)
+
+
+def decide(rules: list, translations: dict, options: list, name='', P31=()) -> tuple:
+    """Return («action», «value», «rule») for the first matching rule or ('ask', None, None)."""
+    if not translations:
+        return 'ask', None, None
+    context = {'translations': translations, 'options': options, 'name': name or '', 'P31': P31 or ()}
+    for rule in rules:
+        if rule.matches(context):
+            if rule.action == 'accept':
+                value = rule.select(context)
+                if value is None:
+                    continue
+                rule.hits = rule.hits + 1
+                return 'accept', value, rule
+            rule.hits = rule.hits + 1
+            return rule.action, None, rule
+    return 'ask', None, None
@@ -0,0 +1,192 @@
+import collections
+import email.utils
+import functools
+import importlib.util
+import threading
+import time
+from urllib.parse import urlsplit
+from typing import TYPE_CHECKING
+
+from . import __version__, rate_limit
+
+if TYPE_CHECKING:
+    import requests
+
+# HTTP transport shared by the Overpass, Wikidata, Wikipedia and OSM clients: a keep-alive session per host with
+# timeouts, compression, a descriptive User-Agent, revalidation of the GET responses with ETag or Last-Modified and
+# retry policies. All the requests wait for the host budget of rate_limit.
+USER_AGENT = f'LangToolsOSM/{__version__} (+https://github.com/OSM-Catalan/LangToolsOSM)'
+TIMEOUT = (10, 120)  # seconds to connect and between bytes of the response
+
+
+class RetryPolicy:
+    """Retry the responses with a status in «statuses» and the connection errors up to «retries» times. Waits the
+    Retry-After of the response or «backoff» seconds multiplied by «factor» after every retry, up to «max_wait».
+    With «write_statuses», the requests other than GET only retry these statuses (eg. 429, rejected before changing
+    anything) and not the connection errors, because the change could have been applied."""
+
+    def __init__(self, retries=2, statuses=(429, 502, 503, 504), backoff=1.0, factor=2.0, max_wait=300,
+                 write_statuses=None):
+        self.retries = retries
+        self.statuses = statuses
+        self.backoff = backoff
+        self.factor = factor
+        self.max_wait = max_wait
+        self.write_statuses = write_statuses
+
+    def retry(self, method: str, status: int = None) -> bool:
+        """Whether to retry a response with «status» or a connection error (None)."""
+        if method in ['GET', 'HEAD'] or self.write_statuses is None:
+            return status is None or status in self.statuses
+        return status is not None and status in self.write_statuses
+
+    def wait(self, attempt: int, response=None) -> float:
+        wait = self.backoff * self.factor ** attempt
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            if retry_after.isdigit():
+                wait = float(retry_after)
+            else:
+                date = email.utils.parsedate_to_datetime(retry_after)
+                wait = date.timestamp() - time.time() if date else wait
+        return max(0.0, min(wait, self.max_wait))
+
+
+NO_RETRY = RetryPolicy(retries=0)
+WIKIMEDIA_RETRY = RetryPolicy(retries=3, backoff=1, factor=2)
+OSM_RETRY = RetryPolicy(retries=3, backoff=2, factor=2, write_statuses=(429,))
+
+
+class Validators:
+    """Last GET responses with an ETag or Last-Modified header by URL, to revalidate them with a conditional request
+    and reuse the body when the server answers "304 Not Modified"."""
+
+    def __init__(self, size=256):
+        self.size = size
+        self.responses = collections.OrderedDict()
+        self.revalidated = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, url: str) -> tuple:
+        """(conditional headers, cached response) for «url» or ({}, None)."""
+        with self.lock:
+            response = self.responses.get(url)
+            if response is None:
+                return {}, None
+            self.responses.move_to_end(url)
+        headers = {}
+        if response.headers.get('ETag'):
+            headers['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = response.headers['Last-Modified']
+        return headers, response
+
+    def store(self, url: str, response):
+        if not response.headers.get('ETag') and not response.headers.get('Last-Modified'):
+            return
+        response.content  # read the body before the connection returns to the pool
+        with self.lock:
+            self.responses[url] = response
+            self.responses.move_to_end(url)
+            while len(self.responses) > self.size:
+                self.responses.popitem(last=False)
+
+    def hit(self):
+        with self.lock:
+            self.revalidated = self.revalidated + 1
+
+
+validators = Validators()
+_sessions = {}
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _session_class():
+    import requests
+    import requests.adapters
+
+    class Session(rate_limit.Session):
+        """rate_limit.Session with a connection pool, the User-Agent, compression and the retries of «retry_policy» or
+        of the «policy» argument of request."""
+
+        def __init__(self, retry_policy: RetryPolicy = NO_RETRY, pool_size=10):
+            super().__init__()
+            self.retry_policy = retry_policy
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.mount('https://', adapter)
+            self.mount('http://', adapter)
+            encodings = 'gzip, deflate' + (', br' if importlib.util.find_spec('brotli') else '')  # decoded by urllib3
+            self.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': encodings})
+
+        def request(self, method, url, *args, policy: RetryPolicy = None, **kwargs):
+            policy = policy or self.retry_policy
+            for attempt in range(policy.retries + 1):
+                last = attempt == policy.retries
+                try:
+                    response = super().request(method, url, *args, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as error:
+                    if last or not policy.retry(method):
+                        raise
+                    print(f'{urlsplit(url).hostname}: {type(error).__name__}. Retry {attempt + 1} of {policy.retries}')
+                    time.sleep(policy.wait(attempt))
+                    continue
+                if last or not policy.retry(method, response.status_code):
+                    return response
+                print(f'{urlsplit(url).hostname} response: {response.status_code}. '
+                      f'Retry {attempt + 1} of {policy.retries}')
+                time.sleep(policy.wait(attempt, response))
+    return Session
+
+
+def new_session(retry_policy: RetryPolicy = NO_RETRY, pool_size=10) -> 'requests.Session':
+    """Session for the clients that keep their own, like osmapi.OsmApi (pass created_by=USER_AGENT, because it
+    replaces the User-Agent header)."""
+    return _session_class()(retry_policy=retry_policy, pool_size=pool_size)
+
+
+def session(url: str) -> 'requests.Session':
+    """Session shared by all the requests to the host of «url»."""
+    split = urlsplit(url)
+    key = split.scheme + '://' + split.netloc
+    with _lock:
+        if key not in _sessions:
+            _sessions[key] = new_session()
+        return _sessions[key]
+
+
+def request(method: str, url: str, policy: RetryPolicy = NO_RETRY, timeout=TIMEOUT, **kwargs) -> 'requests.Response':
+    """Send the request with the retries of «policy» and return the last response. GET requests are revalidated if a
+    previous response had validators."""
+    cached = None
+    if method == 'GET':
+        conditional, cached = validators.lookup(url)
+        if conditional:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **conditional)
+    response = session(url).request(method, url, policy=policy, timeout=timeout, **kwargs)
+    if response.status_code == 304 and cached is not None:
+        validators.hit()
+        return cached
+    if method == 'GET' and response.status_code == 200:
+        validators.store(url, response)
+    return response
+
+
+def get(url: str, policy: RetryPolicy = NO_RETRY, timeout=TIMEOUT, **kwargs) -> 'requests.Response':
+    return request('GET', url, policy=policy, timeout=timeout, **kwargs)
+
+
+def post(url: str, policy: RetryPolicy = NO_RETRY, timeout=TIMEOUT, **kwargs) -> 'requests.Response':
+    return request('POST', url, policy=policy, timeout=timeout, **kwargs)
+
+
+def stats() -> dict:
+    with _lock:
+        hosts = sorted(_sessions)
+    return {'sessions': hosts, 'revalidated': validators.revalidated}
+
+
+def __getattr__(name: str):
+    if name == 'Session':  # defined on first use to keep requests out of the startup time
+        return _session_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,20 +1,64 @@
+import os
 import re
-import requests
+from urllib.parse import quote
+from typing import TYPE_CHECKING
 
+from . import daemon, profiling, transport
 
-def get_translations(ids: list, lang: str, batch_size=50) -> dict:
+if TYPE_CHECKING:
+    import requests
+
+WIKIDATA_API = os.environ.get('LANGTOOLSOSM_WIKIDATA_API', 'https://www.wikidata.org/w/api.php')
+# {lang} is replaced by the language prefix of the wikipedia site
+WIKIPEDIA_API = os.environ.get('LANGTOOLSOSM_WIKIPEDIA_API', 'https://{lang}.wikipedia.org/w/api.php')
+
+
+def _get(url: str) -> 'requests.Response':
+    with profiling.phase('wikidata' if url.startswith(WIKIDATA_API) else 'wikipedia'):
+        return transport.get(url, policy=transport.WIKIMEDIA_RETRY)
+
+
+def get_entities(ids: list, languages: list, props='labels|aliases|sitelinks', batch_size=50) -> dict:
+    data = daemon.entities(ids, languages=languages, props=props)
+    if data is not None:
+        return data
     data = {}
     for ndx in range(0, len(ids), batch_size):
         batch_ids = ids[ndx:min(ndx + batch_size, len(ids))]
-        query = 'https://www.wikidata.org/w/api.php?action=wbgetentities&ids=' + '|'.join(batch_ids) +\
-                '&props=labels|aliases|sitelinks&languages=' + lang + '&format=json'
-        response = requests.get(query)
+        query = WIKIDATA_API + '?action=wbgetentities&ids=' + '|'.join(batch_ids) +\
+                '&props=' + props + '&languages=' + '|'.join(languages) + '&format=json'
+        response = _get(query)
         batch_data = response.json()
         if 'error' in batch_data.keys():
-            raise Exception('Wrong response from wikidata: ' + batch_data)
+            raise Exception('Wrong response from wikidata: ' + str(batch_data))
         data.update(batch_data['entities'])
     # import json
     # print(json.dumps(data, indent=2))
+    return data
+
+
+def search_entities(search: str, lang: str, limit=7) -> list:
+    """Ids of the items with a label or alias in «lang» matching «search», in the order of wbsearchentities."""
+    query = WIKIDATA_API + '?action=wbsearchentities&type=item&format=json&search=' + quote(search) +\
+            '&language=' + lang + '&uselang=' + lang + '&limit=' + str(limit)
+    data = _get(query).json()
+    if 'error' in data.keys():
+        raise Exception('Wrong response from wikidata: ' + str(data))
+    return [x['id'] for x in data.get('search', [])]
+
+
+def get_translations(ids: list, lang: str, batch_size=50) -> dict:
+    data = get_entities(ids, languages=[lang], batch_size=batch_size)
+    return translations_from_entities(data, lang=lang)
+
+
+def get_translations_multilang(ids: list, langs: list, batch_size=50) -> dict:
+    """Translations by language ({lang: get_translations(ids, lang)}) from a single sweep of wbgetentities."""
+    data = get_entities(ids, languages=langs, batch_size=batch_size)
+    return {lang: translations_from_entities(data, lang=lang) for lang in langs}
+
+
+def translations_from_entities(data: dict, lang: str) -> dict:
     out = {}
     for wikidata_id, value in data.items():
         translations = {'wikipedia': None, 'label': None, 'aliases': None, 'extra': None}
@@ -96,9 +140,9 @@ def get_wikidata_from_langwikipedia(sitelinks: list, lang: str, batch_size=50) -
     data = {}
     for ndx in range(0, len(sitelinks), batch_size):
         batch_sitelinks = sitelinks[ndx:min(ndx + batch_size, len(sitelinks))]
-        query = 'https://' + lang + '.wikipedia.org/w/api.php?action=query&prop=pageprops&ppprop=wikibase_item&' + \
+        query = WIKIPEDIA_API.format(lang=lang) + '?action=query&prop=pageprops&ppprop=wikibase_item&' + \
                 'redirects=1&format=json&utf8=True&titles=' + '|'.join(batch_sitelinks)
-        response = requests.get(query)
+        response = _get(query)
         batch_data = response.json()
         if 'error' in batch_data.keys():
             raise Exception('Wrong response from wikidata: ' + batch_data)
@@ -119,9 +163,9 @@ def get_wikipedia_from_wikidata(wikidata: list, batch_size=50) -> dict:
     data = {}
     for ndx in range(0, len(wikidata), batch_size):
         batch_ids = wikidata[ndx:min(ndx + batch_size, len(wikidata))]
-        query = 'https://www.wikidata.org/w/api.php?action=wbgetentities&ids=' + '|'.join(batch_ids) +\
+        query = WIKIDATA_API + '?action=wbgetentities&ids=' + '|'.join(batch_ids) +\
                 '&props=sitelinks&format=json'
-        response = requests.get(query)
+        response = _get(query)
         batch_data = response.json()
         if 'error' in batch_data.keys():
             raise Exception('Wrong response from wikidata: ' + batch_data)
@@ -144,8 +188,8 @@ def get_instance_type_from_wikidata(wikidata: list, batch_size=50) -> dict:
     id_instance_type = {}  # P31 (instance of) ids of the wikidata elements
     for ndx in range(0, len(wikidata), batch_size):
         batch_ids = wikidata[ndx:min(ndx + batch_size, len(wikidata))]
-        query = 'https://www.wikidata.org/w/api.php?action=wbgetentities&format=json&props=claims&languages=en|ca&ids=' + '|'.join(batch_ids)
-        response = requests.get(query)
+        query = WIKIDATA_API + '?action=wbgetentities&format=json&props=claims&languages=en|ca&ids=' + '|'.join(batch_ids)
+        response = _get(query)
         batch_data = response.json()
         if 'error' in batch_data.keys():
             raise Exception('Wrong response from wikidata: ' + str(batch_data))
@@ -158,8 +202,8 @@ def get_instance_type_from_wikidata(wikidata: list, batch_size=50) -> dict:
     instance_type = {}  # Labels of the P31 ids
     for ndx in range(0, len(id_instance_type_unique), batch_size):
         batch_ids = id_instance_type_unique[ndx:min(ndx + batch_size, len(id_instance_type_unique))]
-        query = 'https://www.wikidata.org/w/api.php?action=wbgetentities&format=json&props=labels&languages=en|ca&ids=' + '|'.join(batch_ids)
-        response = requests.get(query)
+        query = WIKIDATA_API + '?action=wbgetentities&format=json&props=labels&languages=en|ca&ids=' + '|'.join(batch_ids)
+        response = _get(query)
         batch_data = response.json()
         if 'error' in batch_data.keys():
             raise Exception('Wrong response from wikidata: ' + str(batch_data))
@@ -11,8 +11,6 @@ REQUIRES = [
     'osmapi',
     'overpy',
     'pandas',
-    'pytablereader',
-    'pytablewriter',
     'requests',
     'tqdm'
 ]
@@ -27,18 +25,26 @@ setup(
     url='https://github.com/OSM-Catalan/LangToolsOSM',
     keywords=['OpenStreetMap', 'localisation', 'wikidata', 'wikipedia'],
     install_requires=REQUIRES,
-    packages=find_packages(),
+    extras_require={'parquet': ['pyarrow']},
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     package_data={},
     include_package_data=True,
     entry_points={
-        'console_scripts': ['fill_empty_name=src.fill_empty_name:fill_empty_namecommand',
-                            'fill_empty_name_lang=src.fill_empty_name_lang:fill_empty_name_langcommand',
-                            'regex_name_lang=src.regex_name_lang:regex_name_langcommand',
-                            'translate_with_wikidata=src.translate_with_wikidata:translate_with_wikidatacommand',
-                            'update_osm_objects_from_report=src.update_osm_objects_from_report:update_osm_objects_from_reportcommand',
-                            'write_osm_objects_report=src.write_osm_objects_report:write_osm_objects_reportcommand',
-                            'fill_wikidata_from_wikipedia=src.fill_wikidata_from_wikipedia:fill_wikidata_from_wikipediacommand',
-                            'fill_wikipedia_from_wikidata=src.fill_wikipedia_from_wikidata:fill_wikipedia_from_wikidatacommand'
+        'console_scripts': ['langtoolsosm=src.cli:cli',
+                            'fill_empty_name=src.cli:fill_empty_name',
+                            'fill_empty_name_lang=src.cli:fill_empty_name_lang',
+                            'regex_name_lang=src.cli:regex_name_lang',
+                            'translate_with_wikidata=src.cli:translate_with_wikidata',
+                            'update_osm_objects_from_report=src.cli:update_osm_objects_from_report',
+                            'write_osm_objects_report=src.cli:write_osm_objects_report',
+                            'fill_wikidata_from_wikipedia=src.cli:fill_wikidata_from_wikipedia',
+                            'fill_wikidata_from_name=src.cli:fill_wikidata_from_name',
+                            'fill_wikipedia_from_wikidata=src.cli:fill_wikipedia_from_wikidata',
+                            'merge_osm_objects_reports=src.cli:merge_osm_objects_reports',
+                            'coverage_stats=src.cli:coverage_stats',
+                            'langtoolsosm_daemon=src.cli:daemon',
+                            'langtoolsosm_batch=src.cli:batch',
+                            'upload_osc=src.cli:upload_osc'
                             ]},
     long_description='Fill empty wikidata, wikipedia, name:LANG or name tags with translations from wikidata, regex, '
                      'or copy from name to name:LANG or the reverse. See '
@@ -0,0 +1,162 @@
+import click
+import concurrent.futures
+import os
+from colorama import Fore, Style
+
+import lib.api as la
+import lib.batch as lb
+import lib.metrics as lm
+import lib.osm_utils as lt
+from lib import __version__, profiling, rate_limit
+from src.cli import load_command
+
+
+def review(proposals: list, verbose=0):
+    """Yield the edits of the «proposals» of an area as the user selects a candidate for every one."""
+    def decide(proposal):
+        osm_object = proposal['object']
+        print('------------------------------------------------------')
+        print(f'OSM id: {osm_object["id"]}({osm_object["type"]})\t https://osm.org/{osm_object["type"]}/{osm_object["id"]}'
+              + Style.BRIGHT + f'\t{osm_object["tags"].get("name", "")}' + Style.RESET_ALL)
+        if verbose > 0:
+            print(osm_object['tags'])
+        for i, candidate in enumerate(proposal['candidates']):
+            print(f'{i} = {candidate["value"]}' + Fore.LIGHTBLACK_EX + f' ({candidate["source"]})' + Style.RESET_ALL)
+        prompt = f'Select {proposal["key"]} ("-" to skip, "e" to edit): '
+        options = [str(x) for x in range(len(proposal['candidates']))] + ['-', 'e']
+        select = profiling.user_input(prompt) or '0'
+        while select not in options:
+            print('Enter a number from 0 to ' + str(len(proposal['candidates']) - 1))
+            select = profiling.user_input(prompt) or '0'
+        lm.count('decisions_total', decision={'-': 'skip', 'e': 'edit'}.get(select, 'select'))
+        if select == '-':
+            print(Fore.BLUE + 'SKIP.' + Style.RESET_ALL)
+            return None
+        if select == 'e':
+            return profiling.user_input(f'Enter a value for tag "{proposal["key"]}": ')
+        return proposal['candidates'][int(select)]['value']
+
+    return la.decide_edits(proposals, decide)
+
+
+@click.command(context_settings={'ignore_unknown_options': True})
+@click.argument('command', type=click.Choice(lb.NON_INTERACTIVE + list(lb.REVIEW)))
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+@click.option('--areas-file', required=True, type=click.Path(exists=True, dir_okay=False), help='Text file with an area per line (eg. the names of the municipalities of a region).')
+@click.option('--log-dir', type=click.Path(file_okay=False, writable=True), help='Folder for the output or the proposals of every area. Default to MANIFEST.logs.')
+@click.option('--manifest', type=click.Path(dir_okay=False, writable=True), help='JSON file with the progress of the batch. A restarted batch skips the finished areas and reviews the prepared ones without downloading them again. Default to batch_COMMAND.json.')
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host for the whole batch as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section. Split between the workers.')
+@click.option('--verbose', '-v', count=True, help='Print the rate limits of every worker, the command line of every area and the tags of the objects under review.')
+@click.option('--workers', default=4, type=int, help='Number of areas processed (or prepared for the review) at the same time.')
+def batchcommand(command, args, areas_file, log_dir, manifest, rate_limits, verbose, workers):
+    """Run COMMAND for every area of --areas-file in parallel processes sharing the rate limits. ARGS are the options of
+    the command after "--" (eg. "-- --lang ca --output reports/{area}.csv"), with "{area}" replaced by the area name as
+    a file name with a short hash. write_osm_objects_report and coverage_stats run once per area. For fill_empty_name,
+    fill_empty_name_lang, fill_wikidata_from_name and translate_with_wikidata the workers download the objects and
+    their wikidata of every area and the proposals are reviewed here one area after another, each area in its own
+    changesets, while the next areas are prepared."""
+    args = list(args)
+    manifest = manifest or f'batch_{command}.json'
+    try:
+        progress = lb.Manifest(manifest, command=command, args=args)
+    except ValueError as error:
+        print(error)
+        exit()
+    areas = lb.read_areas(areas_file)
+    pending = [x for x in areas if progress.status(x) != 'done']
+    print(f'{len(areas) - len(pending)} of {len(areas)} areas already done according to {manifest}.')
+    if not pending:
+        return
+    for x in args:  # folders of the outputs by area (eg. "reports/{area}.csv")
+        if '{area}' in x and os.path.dirname(x) and '{area}' not in os.path.dirname(x):
+            os.makedirs(os.path.dirname(x), exist_ok=True)
+
+    log_dir = log_dir or manifest + '.logs'
+    os.makedirs(log_dir, exist_ok=True)
+    workers = max(1, min(workers, len(pending)))
+    budgets = rate_limit.divide(rate_limits, workers)
+    if verbose > 0:
+        print(f'Rate limits per worker: {budgets}')
+    if command in lb.REVIEW:
+        review_areas(command, args, pending, progress, log_dir, workers, rate_limits, budgets, verbose)
+    else:
+        if verbose > 0:
+            for x in pending:
+                print(' '.join(lb.command_line(command, x, args, rate_limits=budgets)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:  # a process per area
+            futures = {executor.submit(lb.run_area, command, x, args, rate_limits=budgets,
+                                       log=os.path.join(log_dir, lb.area_slug(x) + '.log')): x for x in pending}
+            try:
+                for n, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                    area = futures[future]
+                    result = future.result()
+                    progress.update(area, **result)
+                    print(f'[{n}/{len(pending)}] {area}: {result["status"]} in {result["seconds"]} s'
+                          + ('' if result['status'] == 'done' else f'. See {result["log"]}'))
+            except KeyboardInterrupt:
+                executor.shutdown(wait=False, cancel_futures=True)
+                print('Interrupted. Run the same batch again to continue.')
+                raise SystemExit(1)
+
+    counts = progress.counts()
+    print(', '.join(f'{value} {key}' for key, value in sorted(counts.items())) + f'. Manifest: {manifest}')
+
+
+def review_areas(command, args, pending, progress, log_dir, workers, rate_limits, budgets, verbose):
+    # The options of the command, asked once for the whole batch (eg. --lang)
+    options = load_command(command).make_context(command, ['--area', 'batch'] + args).params
+    if options.get('query') or options.get('export_osc'):
+        print('--query and --export-osc are not supported in a batch.')
+        exit()
+    rate_limit.configure(rate_limits)
+    api = None
+    if not options.get('dry_run'):
+        api = lt.login_osm(username=options.get('username'), passwordfile=options.get('passwordfile'))
+    paths = {x: os.path.join(log_dir, lb.area_slug(x) + '.json') for x in pending}
+    ready = [x for x in pending if progress.status(x) == 'prepared' and os.path.isfile(paths[x])]
+    print(f'{len(ready)} areas prepared in a previous run. Downloading {len(pending) - len(ready)} areas with {workers} workers.')
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for x in pending:
+            if x not in ready:
+                future = executor.submit(lb.prepare_area, command, x, options, rate_limits=budgets, path=paths[x])
+                # recorded at once, so an interrupted review doesn't download again the areas already prepared
+                future.add_done_callback(lambda done, area=x: progress.update(area, **done.result()))
+                futures[future] = x
+
+        def prepared():
+            yield from ready
+            for future in concurrent.futures.as_completed(futures):
+                area = futures[future]
+                future.result()
+                if progress.status(area) == 'prepared':
+                    yield area
+                else:
+                    print(Fore.RED + f'{area}: {progress.data["areas"][area]["error"]}' + Style.RESET_ALL)
+
+        try:
+            for n, area in enumerate(prepared(), start=1):
+                proposals = lb.read_proposals(paths[area])
+                print('######################################################')
+                print(f'[{n}/{len(pending)}] {area}: {len(proposals)} proposals.')
+                print('######################################################')
+                edits = list(review(proposals, verbose=verbose))  # an interrupted area is reviewed again
+                n_edits = 0
+                changesets = []
+                with profiling.phase('commit'):
+                    for edit in la.commit(api, edits, lb.changeset_tags(command, area, options, __version__),
+                                          batch=options.get('batch'), dry_run=options.get('dry_run')):
+                        if edit['status'] == 'committed':
+                            n_edits = n_edits + 1
+                            if edit['changeset'] not in changesets:
+                                changesets.append(edit['changeset'])
+                        elif edit['status'] == 'failed':
+                            print(Fore.RED + f'FAILED: {edit["type"]} {edit["id"]}' + Style.RESET_ALL)
+                progress.update(area, status='done', proposals=len(proposals), edits=n_edits, file=paths[area])
+                print(f'{area}: {n_edits} objects modified ' + ' '.join(f'https://www.osm.org/changeset/{x}' for x in changesets)
+                      if not options.get('dry_run') else f'{area}: no change send to OSM (--dry-run).')
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            print('Interrupted. Run the same batch again to continue.')
+            raise SystemExit(1)
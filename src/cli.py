@@ -0,0 +1,78 @@
+import importlib
+
+import click
+
+from lib import __version__
+
+# Subcommands are imported when invoked, so "langtoolsosm --help" doesn't load their dependencies
+COMMANDS = {
+    'batch': 'src.batch:batchcommand',
+    'coverage_stats': 'src.coverage_stats:coverage_statscommand',
+    'daemon': 'src.daemon:daemoncommand',
+    'fill_empty_name': 'src.fill_empty_name:fill_empty_namecommand',
+    'fill_empty_name_lang': 'src.fill_empty_name_lang:fill_empty_name_langcommand',
+    'fill_wikidata_from_name': 'src.fill_wikidata_from_name:fill_wikidata_from_namecommand',
+    'fill_wikidata_from_wikipedia': 'src.fill_wikidata_from_wikipedia:fill_wikidata_from_wikipediacommand',
+    'fill_wikipedia_from_wikidata': 'src.fill_wikipedia_from_wikidata:fill_wikipedia_from_wikidatacommand',
+    'merge_osm_objects_reports': 'src.merge_osm_objects_reports:merge_osm_objects_reportscommand',
+    'regex_name_lang': 'src.regex_name_lang:regex_name_langcommand',
+    'translate_with_wikidata': 'src.translate_with_wikidata:translate_with_wikidatacommand',
+    'update_osm_objects_from_report': 'src.update_osm_objects_from_report:update_osm_objects_from_reportcommand',
+    'upload_osc': 'src.upload_osc:upload_osccommand',
+    'write_osm_objects_report': 'src.write_osm_objects_report:write_osm_objects_reportcommand',
+}
+
+
+def load_command(name: str) -> click.Command:
+    module, attr = COMMANDS[name].split(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+class LazyGroup(click.Group):
+    def list_commands(self, ctx):
+        return sorted(COMMANDS)
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in COMMANDS:
+            return None
+        return load_command(cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        # Without loading the commands to read their short help
+        with formatter.section('Commands'):
+            formatter.write_dl([(x, '') for x in self.list_commands(ctx)])
+
+
+@click.group(cls=LazyGroup)
+@click.version_option(__version__, prog_name='LangToolsOSM')
+def cli():
+    """CLI tools to help with the localisation of OpenStreetMap. Run "langtoolsosm COMMAND --help" for the options of
+    every command."""
+
+
+def _shim(name: str):
+    def main():
+        return load_command(name)()
+    main.__name__ = name
+    return main
+
+
+# Entry points of the individual commands
+batch = _shim('batch')
+coverage_stats = _shim('coverage_stats')
+daemon = _shim('daemon')
+fill_empty_name = _shim('fill_empty_name')
+fill_empty_name_lang = _shim('fill_empty_name_lang')
+fill_wikidata_from_name = _shim('fill_wikidata_from_name')
+fill_wikidata_from_wikipedia = _shim('fill_wikidata_from_wikipedia')
+fill_wikipedia_from_wikidata = _shim('fill_wikipedia_from_wikidata')
+merge_osm_objects_reports = _shim('merge_osm_objects_reports')
+regex_name_lang = _shim('regex_name_lang')
+translate_with_wikidata = _shim('translate_with_wikidata')
+update_osm_objects_from_report = _shim('update_osm_objects_from_report')
+upload_osc = _shim('upload_osc')
+write_osm_objects_report = _shim('write_osm_objects_report')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,91 @@
+import click
+import concurrent.futures
+from tqdm import tqdm
+
+import lib.coverage as lc
+import lib.metrics as lm
+from lib import __version__, pipeline, profiling, rate_limit
+from lib.report import FORMATS, open_report
+
+
+@click.command()
+@click.option('--area', type=str, multiple=True, help='Search area (eg. "42.49,2.43,42.52,2.49", "[name_int=Kobane]" or "Le Canigou"). Repeat the option for several areas.')
+@click.option('--areas-file', type=click.Path(exists=True, dir_okay=False), help='Text file with an area per line (eg. the names of the municipalities of a region).')
+@click.option('--batch-size', default=10, type=int, help='Number of areas counted in every Overpass query.')
+@click.option('--cache', type=click.Path(dir_okay=False, writable=True), help='JSON file to keep the counts of every area and reuse them in the next runs.')
+@click.option('--cache-max-age', type=float, help='Hours before the cached counts are queried again. Default to never.')
+@click.option('--filters', default="nwr['name']", type=str, help="""Overpass filters of the counted objects. Default to "nwr['name']".""")
+@click.option('--lang', prompt='Language of the multilingual name key to count (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code. See https://wiki.openstreetmap.org/wiki/Multilingual_names .')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Path of the file to write the table of counts.')
+@click.option('--output-format', type=click.Choice(FORMATS, case_sensitive=False), default='csv', help='Format of the output file.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
+@click.option('--tags', default=','.join(lc.DEFAULT_TAGS), type=str, help='Comma separated tags to count. "{lang}" is replaced by --lang. Default to "name:{lang},wikidata,wikipedia".')
+@click.option('--tiles', default=1, type=int, help='Split every bounding box area in this number of tiles for smaller queries. Objects on the border of two tiles are counted twice.')
+@click.option('--verbose', '-v', count=True, help='Print the Overpass queries.')
+@click.option('--workers', default=2, type=int, help='Number of Overpass queries at the same time. The requests still share the --rate-limits budget.')
+def coverage_statscommand(area, areas_file, batch_size, cache, cache_max_age, filters, lang, metrics, output, output_format, profile, profile_cpu, rate_limits, tags, tiles, verbose, workers):
+    """Count the objects in every area and the ones with and without every tag (name:LANG, wikidata and wikipedia by
+    default) with Overpass "out count" queries, without downloading the objects."""
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='coverage_stats')
+    areas = list(area)
+    if areas_file:
+        with open(areas_file, encoding='utf-8') as f:
+            areas = areas + [x.strip() for x in f if x.strip() and not x.startswith('#')]
+    if not areas:
+        print('Missing "--area" or "--areas-file" option. See "coverage_stats --help" for details.')
+        exit()
+    areas = list(dict.fromkeys(areas))
+    tags = [x.strip().replace('{lang}', lang) for x in tags.split(',') if x.strip()]
+    cache = lc.CountCache(cache, max_age=cache_max_age * 3600 if cache_max_age is not None else None)
+
+    parents = {}
+    for x in areas:
+        for tile in pipeline.tile_areas(x, tiles):
+            parents.setdefault(tile, []).append(x)
+    queries = list(parents.keys())
+    batches = [queries[ndx:ndx + batch_size] for ndx in range(0, len(queries), batch_size)]
+    if verbose > 0:
+        for batch in batches:
+            print(lc.count_query(batch, filters=filters, tags=tags))
+    print(f'Counting {len(areas)} areas in {len(batches)} Overpass queries.')
+
+    counts = {x: {} for x in areas}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(lc.get_counts, batch, filters=filters, tags=tags, cache=cache) for batch in batches]
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+                for tile, tile_counts in future.result().items():
+                    for parent in parents[tile]:
+                        lc.add_counts(counts[parent], tile_counts)
+    finally:
+        cache.save()
+
+    profiling.switch('report')
+    header = lc.coverage_header(tags)
+    total = {}
+    rows = []
+    for x in areas:
+        lc.add_counts(total, counts[x])
+        rows.append(lc.coverage_row(x, counts[x], tags))
+    rows.append(lc.coverage_row('TOTAL', total, tags))
+    print('######################################################')
+    print('\t'.join(header))
+    for row in rows:
+        print('\t'.join('' if x is None else str(x) for x in row))
+    print('######################################################')
+    if cache.hits:
+        print(f'{cache.hits} of {len(queries)} areas from the cache.')
+    if output:
+        table_name = f'Generated by coverage_stats from LangToolsOSM {__version__} with parameters: lang={lang}, ' \
+                     f'filters={filters}, tags={tags}'
+        with open_report(output, file_format=output_format, header=header, table_name=table_name) as writer:
+            for row in rows:
+                writer.writerow(row)
+        print(f'DONE! Coverage table written to {output}.')
+    if verbose > 1:
+        rate_limit.print_stats()
@@ -0,0 +1,41 @@
+import click
+import json
+
+from lib import daemon, rate_limit
+
+
+@click.command()
+@click.argument('action', type=click.Choice(['start', 'status', 'stop'], case_sensitive=False))
+@click.option('--overpass-ttl', default=600, type=float, help='Seconds to keep the Overpass results. Any edit sent by the commands drops them.')
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
+@click.option('--socket', 'socket_path', default=daemon.SOCKET, type=click.Path(dir_okay=False), help=f'Path of the Unix socket. Default to LANGTOOLSOSM_DAEMON_SOCKET or {daemon.SOCKET}.')
+@click.option('--verbose', '-v', count=True, help='Print the requests that are not in the cache.')
+@click.option('--wikidata-ttl', default=86400, type=float, help='Seconds to keep the wikidata entities.')
+def daemoncommand(action, overpass_ttl, rate_limits, socket_path, verbose, wikidata_ttl):
+    """Local daemon that keeps the Overpass results and the wikidata entities in memory between runs. The commands use
+    it while it is running. "start" runs it in the foreground (stop it with Ctrl+c or "stop" from another terminal)."""
+    daemon.SOCKET = socket_path
+    if action == 'status':
+        stats = daemon.call('stats', timeout=5)
+        if stats is None:
+            print(f'The daemon is not running at {socket_path}.')
+            raise SystemExit(1)
+        print(json.dumps(stats, indent=1))
+    elif action == 'stop':
+        if daemon.call('shutdown', timeout=5) is None:
+            print(f'The daemon is not running at {socket_path}.')
+            raise SystemExit(1)
+        print('Daemon stopped.')
+    else:
+        if daemon.call('ping', timeout=5) is not None:
+            print(f'The daemon is already running at {socket_path}.')
+            raise SystemExit(1)
+        rate_limit.configure(rate_limits)
+        server = daemon.DaemonServer(socket_path, overpass_ttl=overpass_ttl, wikidata_ttl=wikidata_ttl, verbose=verbose)
+        print(f'LangToolsOSM daemon listening at {socket_path}. Press Ctrl+c to stop it.', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,7 +1,9 @@
 import click
 from colorama import Fore, Style
+import lib.metrics as lm
 import lib.osm_utils as lt
-from lib import __version__
+from lib import __version__, osc, profiling, rate_limit
+from lib.object_index import ObjectIndex
 from tqdm import tqdm
 
 
@@ -12,15 +14,26 @@ from tqdm import tqdm
 @click.option('--changeset-hashtags', type=str, help='#hashtags for the changeset. Semicolon delimited (e.g. "#toponimsCat;#Calle-Carrer").')
 @click.option('--changeset-source', default='name:{lang} tag', type=str, help='Source tag value for the changeset.')
 @click.option('--dry-run', default=False, is_flag=True, help='Run the program without saving any change to OSM. Useful for testing. No login required.')
+@click.option('--export-osc', type=click.Path(dir_okay=False, writable=True), help='Write the accepted edits to this osmChange file instead of uploading them, without login. Upload the file later with upload_osc. A custom --query must use "out meta". Ignored in --dry-run mode.')
 @click.option('--filters', type=str, help="""Overpass filters to search for objects. Default to "nwr['name:{lang}'][!'name']". Ignored if query is present.""")
 @click.option('--lang', prompt='Language to add a multilingual name key (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code. See https://wiki.openstreetmap.org/wiki/Multilingual_names .')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
 @click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
 @click.option('--query', type=str, help="""Overpass query to search for objects.""")
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
 @click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
 @click.option('--verbose', '-v', count=True, help='Print the changeset tags and all the tags of the features that you are currently editing.')
-def fill_empty_namecommand(area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, filters, lang, passwordfile, query, username, verbose):
+def fill_empty_namecommand(area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, export_osc, filters, lang, metrics, passwordfile, profile, profile_cpu, query, rate_limits, username, verbose):
     """Looks for features with «name:LANG» & without «name» tags and copy «name:LANG» value to «name»."""
-    if not dry_run:
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='fill_empty_name')
+    if export_osc and not dry_run:
+        api = osc.OscWriter(export_osc)
+        batch = None  # upload_osc splits the changesets
+    elif not dry_run:
         api = lt.login_osm(username=username, passwordfile=passwordfile)
     if not filters:
         filters = f"nwr['name:{lang}'][!'name']"
@@ -38,25 +51,26 @@ def fill_empty_namecommand(area, batch, changeset_comment, changeset_hashtags, c
     if not area and not query:
         print('Missing overpass "area" or "query" option. See "write_osm_objects_report --help" for details.')
         exit()
-    result = lt.get_overpass_result(area=area, filters=filters, query=query)
-    n_objects = len(result.nodes) + len(result.ways) + len(result.relations)
+    result = lt.get_overpass_result(area=area, filters=filters, query=query, meta=bool(export_osc))
+    index = ObjectIndex(result)
+    n_objects = len(index)
     print('######################################################')
-    print(f'{str(n_objects)} objects found ({str(len(result.nodes))} nodes, {str(len(result.ways))}'
-          f' ways and {str(len(result.relations))} relations).')
+    print(index.summary())
     print('######################################################')
     if n_objects > 200 and ((batch is not None and batch > 200) or batch is None):
         print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
                          'Reduce the area, add batch option < 200 or stop translating when you want by pressing Ctrl+c.' + Style.RESET_ALL)
-    start = input('Start editing [Y/n]: ').lower()
+    start = profiling.user_input('Start editing [Y/n]: ').lower()
     if start not in ['y', 'yes', '']:
         exit()
+    profiling.switch('review')
 
     changeset = None
     n_changeset = 0
     n_edits = 0
     total_edits = 0
     try:
-        for osm_object in tqdm(result.nodes + result.ways + result.relations):
+        for osm_object in tqdm(index.objects):
             if not dry_run:
                 lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
             lt.print_osm_object(osm_object, verbose=verbose)
@@ -83,7 +97,12 @@ def fill_empty_namecommand(area, batch, changeset_comment, changeset_hashtags, c
                 print(Fore.BLUE + f'SKIP: object without "name:{lang}" tag.' + Style.RESET_ALL)
 
     finally:
-        if changeset and not dry_run:
+        if changeset and export_osc and not dry_run:
+            total_edits = total_edits + n_edits
+            n_written = api.close()
+            print(f'DONE! {total_edits} objects modified. {n_written} objects written to {export_osc}.'
+                  f' Upload them with "upload_osc {export_osc}".')
+        elif changeset and not dry_run:
             total_edits = total_edits + n_edits
             print(f'DONE! {total_edits} objects modified https://www.osm.org/changeset/{changeset}')
             api.ChangesetClose()
@@ -91,3 +110,5 @@ def fill_empty_namecommand(area, batch, changeset_comment, changeset_hashtags, c
             print('DONE! No change send to OSM (--dry-run).')
         else:
             print('DONE! No change send to OSM.')
+        if verbose > 1:
+            rate_limit.print_stats()
@@ -0,0 +1,165 @@
+import click
+from colorama import Fore, Style
+from tqdm import tqdm
+
+import lib.api as la
+import lib.metrics as lm
+import lib.osm_utils as lt
+import lib.reconcile as reconcile
+from lib import __version__, osc, profiling, rate_limit
+from lib.object_index import ObjectIndex
+
+CLASS_MATCH = {True: Fore.GREEN + 'class ok', None: 'class ?', False: Fore.RED + 'other class'}
+
+
+@click.command()
+@click.option('--area', type=str, help='Search area (eg. "42.49,2.43,42.52,2.49", "[name_int=Kobane]" or "Le Canigou"). Ignored if query is present.')
+@click.option('--batch', type=int, default=None, help='Upload changes in groups of "batch" edits per changeset. Ignored in --dry-run mode.')
+@click.option('--cache', type=click.Path(dir_okay=False, writable=True), help='JSON file to keep the wikidata candidates of every name and area and reuse them in the next runs.')
+@click.option('--cache-max-age', type=float, help='Hours before the cached candidates are searched again. Default to never.')
+@click.option('--changeset-comment', type=str, help='Comment for the changeset.')
+@click.option('--changeset-hashtags', type=str, help='#hashtags for the changeset. Semicolon delimited (e.g. "#toponimsCat;#Calle-Carrer").')
+@click.option('--changeset-source', default='wikidata', type=str, help='Source tag value for the changeset.')
+@click.option('--dry-run', default=False, is_flag=True, help='Run the program without saving any change to OSM. Useful for testing. No login required.')
+@click.option('--export-osc', type=click.Path(dir_okay=False, writable=True), help='Write the accepted edits to this osmChange file instead of uploading them, without login. Upload the file later with upload_osc. A custom --query must use "out meta". Ignored in --dry-run mode.')
+@click.option('--filters', type=str, help="""Overpass filters to search for objects. Default to "nwr['name'][!'wikidata']". Ignored if query is present.""")
+@click.option('--lang', prompt='Language of the names to search in wikidata (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code of the labels and aliases matched with «name».')
+@click.option('--max-distance', default=reconcile.MAX_DISTANCE, type=float, help='Drop the candidates with coordinates (P625) farther than this number of km from the object.')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
+@click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
+@click.option('--query', type=str, help="""Overpass query to search for objects. It must return the center of the ways and relations (eg. "out tags center;").""")
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
+@click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
+@click.option('--verbose', '-v', count=True, help='Print all the tags of the features that you are currently editing.')
+@click.option('--workers', default=4, type=int, help='Number of wikidata searches at the same time. The requests still share the --rate-limits budget.')
+def fill_wikidata_from_namecommand(area, batch, cache, cache_max_age, changeset_comment, changeset_hashtags, changeset_source, dry_run, export_osc, filters, lang, max_distance, metrics, passwordfile, profile, profile_cpu, query, rate_limits, username, verbose, workers):
+    """Add «wikidata» to objects with «name» searching the name in Wikidata. The candidates are ranked by the
+    compatibility of their class (P31) with the OSM tags and by their distance (P625) to the object."""
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='fill_wikidata_from_name')
+    if export_osc and not dry_run:
+        api = osc.OscWriter(export_osc)
+        batch = None  # upload_osc splits the changesets
+    elif not dry_run:
+        api = lt.login_osm(username=username, passwordfile=passwordfile)
+    if not filters:
+        filters = "nwr['name'][!'wikidata']"
+    print('After the first object edition a changeset with the following tags will be created:')
+    changeset_tags = {u'comment': f'Fill empty wikidata tags searching the name in wikidata in {area} for {filters}',
+                      u'source': changeset_source, u'created_by': f'LangToolsOSM {__version__}'}
+    if changeset_comment:
+        changeset_tags.update({'comment': changeset_comment})
+    if changeset_hashtags:
+        changeset_tags.update({'hashtags': changeset_hashtags})
+    print(changeset_tags)
+
+    if not area and not query:
+        print('Missing overpass "area" or "query" option. See "write_osm_objects_report --help" for details.')
+        exit()
+    result = lt.get_overpass_result(area=area, filters=filters, query=query, coords=True, meta=bool(export_osc))
+    index = ObjectIndex(result)
+    n_objects = len(index)
+    print('######################################################')
+    print(index.summary())
+    print('######################################################')
+
+    cache = reconcile.SearchCache(cache, max_age=cache_max_age * 3600 if cache_max_age is not None else None)
+    with profiling.phase('wikidata'):
+        found = reconcile.search_candidates(list(index.by_name.keys()), lang=lang, area=area or query, cache=cache,
+                                            workers=workers)
+    cache.save()
+    db = {}
+    for osm_object in index.objects:
+        osm_data = la.object_data(osm_object)
+        ranked = reconcile.rank(found.get(osm_object.tags.get('name'), []), osm_data['tags'], osm_data['lat'],
+                                osm_data['lon'], max_distance=max_distance)
+        if ranked and not osm_object.tags.get('wikidata'):
+            db[(osm_object._type_value, osm_object.id)] = ranked
+    n_objects_with_candidates = len(db)
+    if n_objects_with_candidates == 0:
+        print(f'No wikidata candidates for {n_objects} objects ({cache.hits} names from the cache). Nothing to work on here.')
+        print('######################################################')
+        exit()
+    print(f'Wikidata candidates for {n_objects_with_candidates} OSM objects'
+          f' ({round(n_objects_with_candidates / n_objects * 100)}%). {cache.hits} names from the cache.')
+    print('######################################################')
+    if n_objects_with_candidates > 200 and ((batch is not None and batch > 200) or batch is None):
+        print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
+                         'Reduce the area, add batch option < 200 or stop when you want by pressing Ctrl+c.' + Style.RESET_ALL)
+    start = profiling.user_input('Start editing [Y/n]: ').lower()
+    if start not in ['y', 'yes', '']:
+        exit()
+    profiling.switch('review')
+
+    changeset = None
+    n_changeset = 0
+    n_edits = 0
+    total_edits = 0
+    try:
+        for osm_object in tqdm(index.objects):
+            candidates = db.get((osm_object._type_value, osm_object.id))
+            if not candidates:
+                continue
+            if not dry_run:
+                lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
+            lt.print_osm_object(osm_object, verbose=verbose)
+            for i, candidate in enumerate(candidates):
+                distance = f'{candidate["distance"]} km' if candidate['distance'] is not None else 'no coordinates'
+                print(Style.BRIGHT + f'{i} = {candidate["id"]} {candidate["label"] or ""}' + Style.RESET_ALL +
+                      (f' ({candidate["description"]})' if candidate['description'] else '') +
+                      f' [{CLASS_MATCH[candidate["class_match"]]}{Style.RESET_ALL}, {distance}]'
+                      f' https://wikidata.org/wiki/{candidate["id"]}')
+            options = [str(x) for x in range(len(candidates))]
+            select = profiling.user_input('Select wikidata ("-" to skip, "e" to edit): ') or '0'
+            while select not in options + ['-', 'e']:
+                print('Enter a number from 0 to ' + str(len(candidates) - 1))
+                select = profiling.user_input('Select wikidata ("-" to skip, "e" to edit): ') or '0'
+            lm.count('decisions_total', decision={'-': 'skip', 'e': 'edit'}.get(select, 'select'))
+            if select == '-':
+                print(Fore.BLUE + 'SKIP.' + Style.RESET_ALL)
+                continue
+            elif select == 'e':
+                tags = {'wikidata': profiling.user_input('Enter a value for tag "wikidata": ')}
+            else:
+                tags = {'wikidata': candidates[int(select)]['id']}
+
+            if not dry_run:
+                if changeset is None:
+                    n_changeset = n_changeset + 1
+                    if batch and n_objects_with_candidates > batch and changeset_comment:  # TODO predict if more than 1 changeset will be used
+                        changeset_tags.update({'comment': changeset_comment + f' (part {n_changeset})'})
+                    changeset = api.ChangesetCreate(changeset_tags)
+                committed = lt.update_osm_object(osm_object=osm_object, tags=tags, api=api)
+                if committed:
+                    n_edits = n_edits + 1
+                if batch and n_edits >= batch:
+                    print(f'{n_edits} edits DONE! https://www.osm.org/changeset/{changeset}. Opening a new changeset.')
+                    total_edits = total_edits + n_edits
+                    api.ChangesetClose()
+                    changeset = None
+                    n_edits = 0
+            else:
+                print(Fore.GREEN + Style.BRIGHT + '\n+ ' + str(tags) + Style.RESET_ALL)
+
+    finally:
+        print('######################################################')
+        if changeset and export_osc and not dry_run:
+            total_edits = total_edits + n_edits
+            n_written = api.close()
+            print(f'DONE! {total_edits} objects modified. {n_written} objects written to {export_osc}.'
+                  f' Upload them with "upload_osc {export_osc}".')
+        elif changeset and not dry_run:
+            total_edits = total_edits + n_edits
+            print(f'DONE! {total_edits} objects modified from {n_objects_with_candidates}'
+                  f' objects with wikidata candidates ({round(total_edits / n_objects_with_candidates * 100)}%)'
+                  f' https://www.osm.org/changeset/{changeset}')
+            api.ChangesetClose()
+        elif dry_run:
+            print('DONE! No change send to OSM (--dry-run).')
+        else:
+            print('DONE! No change send to OSM.')
+        if verbose > 1:
+            rate_limit.print_stats()
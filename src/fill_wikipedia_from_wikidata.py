@@ -1,10 +1,11 @@
 import click
-import requests
 from tqdm import tqdm
 from colorama import Fore, Style
 
+import lib.metrics as lm
 import lib.osm_utils as lt
-from lib import __version__, wikimedia
+from lib import __version__, osc, profiling, rate_limit, wikimedia
+from lib.object_index import ObjectIndex
 
 
 @click.command()
@@ -14,16 +15,27 @@ from lib import __version__, wikimedia
 @click.option('--changeset-hashtags', type=str, help='#hashtags for the changeset. Semicolon delimited (e.g. "#toponimsCat;#Calle-Carrer").')
 @click.option('--changeset-source', default='wikipedia', type=str, help='Source tag value for the changeset.')
 @click.option('--dry-run', default=False, is_flag=True, help='Run the program without saving any change to OSM. Useful for testing. No login required.')
+@click.option('--export-osc', type=click.Path(dir_okay=False, writable=True), help='Write the accepted edits to this osmChange file instead of uploading them, without login. Upload the file later with upload_osc. A custom --query must use "out meta". Ignored in --dry-run mode.')
 @click.option('--filters', type=str, help="""Overpass filters to search for objects. Default to "nwr[!wikipedia][wikidata]". Ignored if query is present.""")
 @click.option('--lang', prompt='Language of the wikipedia page to add (e.g. ca, en, ...)', type=str, help='A language code matching the prefix of a wikipedia site. (eg. "ca" for https://ca.wikipedia.org)')
 @click.option('--all-langs', default=False, is_flag=True, help='Add all available wikipedia pages for all languages. WARNING: this is not recommended. See https://wiki.openstreetmap.org/wiki/Key:wikipedia#Secondary_languages')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
 @click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
 @click.option('--query', type=str, help="""Overpass query to search for objects.""")
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
 @click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
 @click.option('--verbose', '-v', count=True, help='Print all the tags of the features that you are currently editing.')
-def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, filters, lang, all_langs, passwordfile, query, username, verbose):
+def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, export_osc, filters, lang, all_langs, metrics, passwordfile, profile, profile_cpu, query, rate_limits, username, verbose):
     """Add «wikipedia» from «wikidata» tag."""
-    if not dry_run:
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='fill_wikipedia_from_wikidata')
+    if export_osc and not dry_run:
+        api = osc.OscWriter(export_osc)
+        batch = None  # upload_osc splits the changesets
+    elif not dry_run:
         api = lt.login_osm(username=username, passwordfile=passwordfile)
     if not filters:
         filters = 'nwr[!wikipedia][wikidata]'
@@ -39,18 +51,14 @@ def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changese
     if not area and not query:
         print('Missing overpass "area" or "query" option. See "write_osm_objects_report --help" for details.')
         exit()
-    result = lt.get_overpass_result(area=area, filters=filters, query=query)
-    n_objects = len(result.nodes) + len(result.ways) + len(result.relations)
+    result = lt.get_overpass_result(area=area, filters=filters, query=query, meta=bool(export_osc))
+    index = ObjectIndex(result)
+    n_objects = len(index)
     print('######################################################')
-    print(f'{str(n_objects)} objects found ({str(len(result.nodes))} nodes, {str(len(result.ways))}'
-          f' ways and {str(len(result.relations))} relations).')
+    print(index.summary())
     print('######################################################')
 
-    wikidata = []
-    for osm_object in result.nodes + result.ways + result.relations:
-        if 'wikidata' in osm_object.tags.keys():
-            wikidata.append(osm_object.tags['wikidata'])
-    wikidata_unique = list(set(wikidata))
+    wikidata_unique = list(index.by_wikidata.keys())
 
     # Check wikidata type and remove humans. Eg. wikidata_unique = ['Q19367952', 'Q3054042']
     instance_type = wikimedia.get_instance_type_from_wikidata(wikidata_unique)
@@ -63,7 +71,7 @@ def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changese
     n_objects_with_wikipedia = 0
     for key in db.keys():
         if lang in db[key]['sitelinks'].keys() or all_langs:
-            n_objects_with_wikipedia = n_objects_with_wikipedia + wikidata.count(key)
+            n_objects_with_wikipedia = n_objects_with_wikipedia + index.wikidata_counts.get(key, 0)
             n_matches = n_matches + 1
     if n_objects_with_wikipedia > 0:
         percent_objects_with_wikipedia = round(n_objects_with_wikipedia / n_objects * 100)
@@ -78,16 +86,17 @@ def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changese
     if n_objects > 200 and ((batch is not None and batch > 200) or batch is None):
         print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
               'Reduce the area, add batch option < 200 or stop editing when you want by pressing Ctrl+c.' + Style.RESET_ALL)
-    start = input('Start editing [Y/n]: ').lower()
+    start = profiling.user_input('Start editing [Y/n]: ').lower()
     if start not in ['y', 'yes', '']:
         exit()
+    profiling.switch('review')
 
     changeset = None
     n_changeset = 0
     n_edits = 0
     total_edits = 0
     try:
-        for osm_object in tqdm(result.nodes + result.ways + result.relations):
+        for osm_object in tqdm(index.objects):
             if not dry_run:
                 lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
             lt.print_osm_object(osm_object, verbose=verbose)
@@ -125,7 +134,12 @@ def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changese
 
     finally:
         print('######################################################')
-        if changeset and not dry_run:
+        if changeset and export_osc and not dry_run:
+            total_edits = total_edits + n_edits
+            n_written = api.close()
+            print(f'DONE! {total_edits} objects modified. {n_written} objects written to {export_osc}.'
+                  f' Upload them with "upload_osc {export_osc}".')
+        elif changeset and not dry_run:
             total_edits = total_edits + n_edits
             print(f'DONE! {total_edits} objects modified from {n_objects_with_wikipedia}'
                   f' objects with available translations ({round(total_edits / n_objects_with_wikipedia * 100)}%)'
@@ -135,3 +149,5 @@ def fill_wikipedia_from_wikidatacommand(area, batch, changeset_comment, changese
             print('DONE! No change send to OSM (--dry-run).')
         else:
             print('DONE! No change send to OSM.')
+        if verbose > 1:
+            rate_limit.print_stats()
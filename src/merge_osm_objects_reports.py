@@ -0,0 +1,103 @@
+import click
+from colorama import Fore, Style
+from tqdm import tqdm
+
+from lib import __version__
+from lib.report import FORMATS, open_report, parse_shard_title, plain_row, prediff_chunk, read_report_chunks, \
+    report_columns, report_title, tag_columns
+
+
+@click.command()
+@click.argument('upload-tags', nargs=-1)
+@click.option('--input-file', type=click.Path(exists=True, dir_okay=False), multiple=True, help='Path of a report shard written by write_osm_objects_report --shards. Repeat the option for every shard.')
+@click.option('--input-format', type=click.Choice(FORMATS, case_sensitive=False), default='csv', help='Format of the input files.')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Path of the merged report. Without it, the shards are only verified.')
+@click.option('--output-format', type=click.Choice(FORMATS, case_sensitive=False), help='Format of the merged report. Default to the input format.')
+@click.option('--verbose', '-v', count=True, help='Print the objects edited in more than one shard.')
+def merge_osm_objects_reportscommand(input_file, input_format, output, output_format, upload_tags, verbose):
+    """Verify and merge the shards of a report edited in parallel. Checks that all the shards come from the same report
+    and detects the objects edited in more than one shard. UPLOAD_TAGS are the columns compared with all_tags to
+    detect the edits. Default to all the tag columns."""
+    if not input_file:
+        print('Missing "--input-file" option. See "merge_osm_objects_reports --help" for details.')
+        exit()
+    if not output_format:
+        output_format = input_format
+
+    titles = set()
+    shards = {}
+    for file in input_file:
+        title, shard, n_shards = parse_shard_title(report_title(file, file_format=input_format))
+        titles.add(title)
+        if shard is not None:
+            shards.setdefault(n_shards, []).append(shard)
+    print('######################################################')
+    if len(titles) > 1:
+        print(Fore.RED + 'WARNING: the files come from different reports:\n' + '\n'.join(str(x) for x in titles) + Style.RESET_ALL)
+    for n_shards, numbers in shards.items():
+        missing = sorted(set(range(n_shards)).difference(numbers))
+        if missing:
+            print(Fore.RED + f'WARNING: missing shards {[x + 1 for x in missing]} of {n_shards}.' + Style.RESET_ALL)
+    header = report_columns(input_file[0], file_format=input_format)
+    for file in input_file[1:]:
+        if report_columns(file, file_format=input_format) != header:
+            raise ValueError(f'{file} has different columns than {input_file[0]}.')
+    if not upload_tags:
+        upload_tags = tag_columns(header)
+    upload_tags = list(upload_tags)
+    if not set(upload_tags).issubset(header):
+        raise ValueError('tags must include column names present in the input files. Missing columns ' +
+                         str(set(upload_tags).difference(header)))
+    if 'all_tags' not in header:
+        raise ValueError('The input files must have the "all_tags" column written by write_osm_objects_report to detect the edits.')
+
+    # First pass: which shard keeps every object and which objects are edited in more than one shard
+    keep = {}
+    edits = {}
+    n_rows = 0
+    columns = list(dict.fromkeys(['typeOSM', 'idOSM', 'all_tags'] + upload_tags))
+    for i, file in enumerate(input_file):
+        for chunk in read_report_chunks(file, file_format=input_format, columns=columns):
+            n_rows = n_rows + len(chunk)
+            for key in zip(chunk['typeOSM'], chunk['idOSM'].map(int)):
+                keep.setdefault(key, i)
+            changes = prediff_chunk(chunk, upload_tags)[0]
+            for values in changes.itertuples(index=False, name=None):
+                row = dict(zip(changes.columns, values))
+                key = (row.pop('typeOSM'), int(row.pop('idOSM')))
+                row = {k: v for k, v in row.items() if isinstance(v, str)}
+                if key not in edits:
+                    keep[key] = i
+                edits.setdefault(key, []).append((i, row))
+    repeated = {key: values for key, values in edits.items() if len(values) > 1}
+    conflicts = {key: values for key, values in repeated.items() if any(x[1] != values[0][1] for x in values[1:])}
+    print(f'{len(input_file)} files with {n_rows} rows, {len(keep)} objects and {len(edits)} edited objects.')
+    if n_rows > len(keep):
+        print(f'{n_rows - len(keep)} rows are duplicated in several files.')
+    if len(repeated) > len(conflicts):
+        print(f'{len(repeated) - len(conflicts)} objects edited in more than one file with the same values.')
+    if conflicts:
+        print(Fore.RED + f'{len(conflicts)} objects edited differently in more than one file. The first edition is kept.'
+              + Style.RESET_ALL)
+        if verbose > 0:
+            for (osm_type, osm_id), values in conflicts.items():
+                print(f'{osm_type} {osm_id}: ' + ', '.join(f'{input_file[i]} {row}' for i, row in values))
+    print('######################################################')
+
+    if output:
+        # Second pass: write every object once, from the shard with its first edition
+        title = f'Merged by merge_osm_objects_reports from LangToolsOSM {__version__} from {len(input_file)} files'
+        if len(titles) == 1 and list(titles)[0]:
+            title = list(titles)[0] + f', merged from {len(input_file)} files'
+        with open_report(output, file_format=output_format, header=header, table_name=title) as writer:
+            for i, file in enumerate(tqdm(input_file)):
+                for chunk in read_report_chunks(file, file_format=input_format):
+                    for values in chunk.itertuples(index=False, name=None):
+                        row = dict(zip(header, values))
+                        key = (row['typeOSM'], int(row['idOSM']))
+                        if keep.get(key) == i:
+                            keep.pop(key)
+                            writer.writerow(plain_row(values, header=header, file_format=output_format))
+        print(f'DONE! Merged report written to {output}.')
+    if conflicts:
+        raise SystemExit(1)
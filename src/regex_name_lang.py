@@ -1,14 +1,18 @@
 import click
+import os
 from colorama import Fore, Style
+import lib.metrics as lm
 import lib.osm_utils as lt
-from lib import __version__
-import re
+from lib import __version__, profiling, rate_limit
+from lib.object_index import ObjectIndex
+from lib.regex_rules import Dispatcher, RegexRule, load_regex_rules
 from tqdm import tqdm
 
 
 @click.command()
-@click.option('--find', prompt='Regular expression to search at name tags', type=str, help='Regular expression to search at name tags.')
-@click.option('--replace', prompt='Regular expression to replace object name and fill name:{LANG}', type=str, help='Regular expression to replace object name and fill name:{LANG}.')
+@click.option('--find', type=str, help='Regular expression to search at name tags. Asked if no --rules.')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
+@click.option('--replace', type=str, help='Regular expression to replace object name and fill name:{LANG}. Asked if no --rules.')
 @click.option('--area', type=str, help='Search area (eg. "42.49,2.43,42.52,2.49", "[name_int=Kobane]" or "Le Canigou"). Ignored if query is present.')
 @click.option('--batch', type=int, default=None, help='Upload changes in groups of "batch" edits per changeset. Ignored in --dry-run mode.')
 @click.option('--changeset-comment', type=str, help='Comment for the changeset.')
@@ -18,19 +22,39 @@ from tqdm import tqdm
 @click.option('--filters', type=str, help="""Overpass filters to search for objects. Default to "nwr['name'~'{find}'][!'name:{lang}']". Ignored if query is present.""")
 @click.option('--lang', prompt='Language to add a multilingual name key (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code. See https://wiki.openstreetmap.org/wiki/Multilingual_names .')
 @click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
 @click.option('--query', type=str, help="""Overpass query to search for objects.""")
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
+@click.option('--rules', type=click.Path(exists=True, dir_okay=False), help='JSON file with ordered find/replace rules applied in one pass instead of --find and --replace. Every rule can fill a different name:LANG. See lib/regex_rules.py for the syntax.')
 @click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
 @click.option('--verbose', '-v', count=True, help='Print the changeset tags and all the tags of the features that you are currently editing.')
-def regex_name_langcommand(find, replace, area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, filters, lang, passwordfile, query, username, verbose):
+def regex_name_langcommand(find, metrics, replace, area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, filters, lang, passwordfile, profile, profile_cpu, query, rate_limits, rules, username, verbose):
     """Look for features with «name» matching a regular expression and fill «name:LANG» with a modified version of «name» by a regular expression."""
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='regex_name_lang')
+    if rules:
+        dispatcher = Dispatcher(load_regex_rules(rules, lang=lang))
+    else:
+        if find is None:
+            find = click.prompt('Regular expression to search at name tags', type=str)
+        if replace is None:
+            replace = click.prompt('Regular expression to replace object name and fill name:{LANG}', type=str)
+        dispatcher = Dispatcher([RegexRule({'name': find, 'find': find, 'replace': replace}, 0, lang=lang)])
     if not dry_run:
         api = lt.login_osm(username=username, passwordfile=passwordfile)
     if not filters:
-        filters = f"nwr['name'~'{find}'][!'name:{lang}']"
+        filters = f"nwr['name'~'{dispatcher.overpass_regex()}']"
+        if dispatcher.langs() == [lang]:
+            filters = filters + f"[!'name:{lang}']"
     print('After the first object edition a changeset with the following tags will be created:')
-    changeset_tags = {u'comment': f'Fill empty name:{lang} tags with regex name:«' +
-                                  find + f'» -> name:{lang}=«' + replace + f'»  in {area} for {filters}',
-                      u'source': changeset_source, u'created_by': f'LangToolsOSM {__version__}'}
+    if rules:
+        comment = f'Fill empty {", ".join("name:" + x for x in dispatcher.langs())} tags with {len(dispatcher.rules)}' \
+                  f' regex rules from {os.path.basename(rules)} in {area} for {filters}'
+    else:
+        comment = f'Fill empty name:{lang} tags with regex name:«' + find + f'» -> name:{lang}=«' + replace + f'»  in {area} for {filters}'
+    changeset_tags = {u'comment': comment, u'source': changeset_source, u'created_by': f'LangToolsOSM {__version__}'}
     if changeset_comment:
         changeset_tags.update({'comment': changeset_comment})
     if changeset_hashtags:
@@ -41,56 +65,83 @@ def regex_name_langcommand(find, replace, area, batch, changeset_comment, change
         print('Missing overpass "area" or "query" option. See "write_osm_objects_report --help" for details.')
         exit()
     result = lt.get_overpass_result(area=area, filters=filters, query=query)
-    n_objects = len(result.nodes) + len(result.ways) + len(result.relations)
+    index = ObjectIndex(result)
     print('######################################################')
-    print(str(len(result.nodes)) + ' nodes, ' + str(len(result.ways)) + ' ways and ' + str(len(result.relations)) + ' relations found.')
+    print(f'{index.n_nodes} nodes, {index.n_ways} ways and {index.n_relations} relations found.')
+
+    # One pass over the objects for all the rules
+    matches = []
+    n_filled = 0
+    for osm_object in index.objects:
+        name = osm_object.tags.get('name')
+        if not name:
+            continue
+        rule, value = dispatcher.match(name)
+        if rule is None:
+            continue
+        if rule.key in osm_object.tags.keys():
+            n_filled = n_filled + 1
+            continue
+        rule.hits = rule.hits + 1
+        matches.append((osm_object, rule, {rule.key: value}))
+    n_objects = len(matches)
+    print(f'{n_objects} objects matching the rules ({dispatcher.stats()}).')
+    if n_filled:
+        print(f'{n_filled} objects skipped because the tag of the matching rule is already filled.')
     print('######################################################')
+
+    if dry_run:
+        print(f'{"rule":<20}{"type":<10}{"id":>12}  name -> tag=value')
+        for osm_object, rule, tags in matches:
+            key, value = list(tags.items())[0]
+            print(f'{rule.name[:19]:<20}{osm_object._type_value:<10}{osm_object.id:>12}  {osm_object.tags["name"]} -> {key}={value}')
+        print('######################################################')
+        print('DONE! No change send to OSM (--dry-run).')
+        if verbose > 1:
+            rate_limit.print_stats()
+        return
+
     if n_objects > 200 and ((batch is not None and batch > 200) or batch is None):
         print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
               'Reduce the area, add batch option < 200 or stop translating when you want by pressing Ctrl+c.' + Style.RESET_ALL)
-    start = input('Start editing [Y/n]: ').lower()
+    start = profiling.user_input('Start editing [Y/n]: ').lower()
     if start not in ['y', 'yes', '']:
         exit()
+    profiling.switch('review')
 
-    regex = re.compile(find)
     changeset = None
     n_changeset = 0
     n_edits = 0
     total_edits = 0
     try:
-        for osm_object in tqdm(result.nodes + result.ways + result.relations):
-            if not dry_run:
-                lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
+        for osm_object, rule, tags in tqdm(matches):
+            lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
             lt.print_osm_object(osm_object, verbose=verbose)
-            if 'name' in osm_object.tags.keys():
-                tags = {'name:' + lang: regex.sub(replace, osm_object.tags['name'])}
-                if not dry_run:
-                    if changeset is None:
-                        n_changeset = n_changeset + 1
-                        if batch and n_objects > batch and changeset_comment:  # TODO predict if more than 1 changeset will be used
-                            changeset_tags.update({'comment': changeset_comment + f' (part {n_changeset})'})
-                        changeset = api.ChangesetCreate(changeset_tags)
-                    committed = lt.update_osm_object(osm_object=osm_object, tags=tags, api=api)
-                    if committed:
-                        n_edits = n_edits + 1
-                    if batch and n_edits >= batch:
-                        print(f'{n_edits} edits DONE! https://www.osm.org/changeset/{changeset}. Opening a new changeset.')
-                        total_edits = total_edits + n_edits
-                        api.ChangesetClose()
-                        changeset = None
-                        n_edits = 0
-                else:
-                    print(Fore.GREEN + Style.BRIGHT + '\n+ ' + str(tags) + Style.RESET_ALL)
-            else:
-                print(Fore.BLUE + 'SKIP: object without "name" tag.' + Style.RESET_ALL)
-
+            if len(dispatcher.rules) > 1:
+                print(Fore.BLUE + f'Rule "{rule.name}": «{rule.find}» -> {rule.key}=«{rule.replace}»' + Style.RESET_ALL)
+            if changeset is None:
+                n_changeset = n_changeset + 1
+                if batch and n_objects > batch and changeset_comment:  # TODO predict if more than 1 changeset will be used
+                    changeset_tags.update({'comment': changeset_comment + f' (part {n_changeset})'})
+                changeset = api.ChangesetCreate(changeset_tags)
+            committed = lt.update_osm_object(osm_object=osm_object, tags=tags, api=api)
+            if committed:
+                n_edits = n_edits + 1
+            if batch and n_edits >= batch:
+                print(f'{n_edits} edits DONE! https://www.osm.org/changeset/{changeset}. Opening a new changeset.')
+                total_edits = total_edits + n_edits
+                api.ChangesetClose()
+                changeset = None
+                n_edits = 0
 
     finally:
-        if changeset and not dry_run:
+        if changeset:
             total_edits = total_edits + n_edits
             print(f'DONE! {total_edits} objects modified https://www.osm.org/changeset/{changeset}')
             api.ChangesetClose()
-        elif dry_run:
-            print('DONE! No change send to OSM (--dry-run).')
         else:
             print('DONE! No change send to OSM.')
+        if len(dispatcher.rules) > 1:
+            print(f'Rules: {dispatcher.stats()}')
+        if verbose > 1:
+            rate_limit.print_stats()
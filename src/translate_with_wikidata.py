@@ -1,43 +1,32 @@
 import click
-import csv
 import re
-import pytablewriter
 from colorama import Fore, Style
 from tqdm import tqdm
 
 import lib.osm_utils as lt
+import lib.rules as lr
+import lib.api as la
+import lib.metrics as lm
 import lib.wikimedia as wikimedia
-from lib import __version__
+from lib import __version__, osc, pipeline, profiling, rate_limit
+from lib.memory import TranslationMemory
+from lib.object_index import ObjectIndex
+from lib.report import open_report
+
+CANDIDATE_STYLES = {'wikipedia': Style.BRIGHT + Fore.CYAN, 'name': Fore.YELLOW, 'label': Style.BRIGHT}
 
 
 def write_db(db, file, file_format='csv', table_name=None):
     headers = ['wikidata', 'nameOSM', 'answer', 'committed', 'translations', 'objects']
+    pattern = re.compile(r'((node|way|relation)\|[0-9]+),*')
     try:
-        with open(file, 'w', newline='') as f:
-            if file_format in 'csv':
-                writer = csv.writer(f, dialect='unix', delimiter='\t')
-                if table_name:
-                    writer.writerow([table_name])
-                writer.writerow(headers)
-                for wikidata, values in db.items():
-                    row = db_item_row(wikidata, values)
-                    writer.writerow(row)
-            elif file_format in 'mediawiki':
-                writer = pytablewriter.MediaWikiTableWriter()
-                writer.stream = f
-                writer.headers = headers
-                writer.table_name = table_name
-                matrix = []
-                pattern = re.compile(r'((node|way|relation)\|[0-9]+),*')
-                for wikidata, values in db.items():
-                    row = db_item_row(wikidata, values)
+        with open_report(file, file_format=file_format, header=headers, table_name=table_name) as writer:
+            for wikidata, values in db.items():
+                row = db_item_row(wikidata, values)
+                if file_format == 'mediawiki':
                     row[0] = f'[https://www.wikidata.org/wiki/{row[0]} {row[0]}]'
                     row[5] = pattern.sub(repl=r'{{\1}}', string=row[5])
-                    matrix.append(row)
-                writer.value_matrix = matrix
-                writer.write_table()
-            else:
-                raise ValueError('File format must be "csv" or "mediawiki".')
+                writer.writerow(row)
     except IOError:
         print('I/O error')
 
@@ -60,19 +49,35 @@ def db_item_row(db_key, db_item) -> list:
 @click.option('--changeset-hashtags', type=str, help='#hashtags for the changeset. Semicolon delimited (e.g. "#toponimsCat;#Calle-Carrer").')
 @click.option('--changeset-source', default='wikidata', type=str, help='Source tag value for the changeset.')
 @click.option('--dry-run', default=False, is_flag=True, help='Run the program without saving any change to OSM. Useful for testing. No login required.')
+@click.option('--export-osc', type=click.Path(dir_okay=False, writable=True), help='Write the accepted edits to this osmChange file instead of uploading them, without login. Upload the file later with upload_osc. A custom --query must use "out meta". Ignored in --dry-run mode.')
 @click.option('--filters', type=str, help="""Overpass filters to search for objects. Default to "nwr['name'][~'name:[a-z]+'~'.']['wikidata'][!'name:{lang}']". Ignored if query is present.""")
+@click.option('--group-by-wikidata', default=False, is_flag=True, help='Ask once for every wikidata value and apply the answer to all the objects with that wikidata in a bulk upload.')
 @click.option('--lang', prompt='Language to add a multilingual name key (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code. See https://wiki.openstreetmap.org/wiki/Multilingual_names .')
+@click.option('--memory', type=click.Path(dir_okay=False, writable=True), help='SQLite file of the translation memory. The answers are saved by wikidata and name and offered as the default option in the next runs, or applied with --remember-answers.')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
 @click.option('--name-as-option', default=False, is_flag=True, help='Offer "name" value as an option to fill "name:lang". Useful for areas where "name" is in the language you want to fill "name:lang". See also fill_empty_name_lang program.')
 @click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Path of the file to write the db of wikidata translations and user answers.')
 @click.option('--output-format', type=click.Choice(['csv', 'mediawiki'], case_sensitive=False), default='csv', help='Format of the output file.')
 @click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
 @click.option('--query', type=str, help="""Overpass query to search for objects.""")
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
 @click.option('--remember-answers', default=False, is_flag=True, help='Remember the answers for objects with the same wikidata value. Still asks for confirmation.')
+@click.option('--rules', type=click.Path(exists=True, dir_okay=False), help='JSON file with rules to accept or skip translations without asking. Only the objects without a matching rule are prompted. See lib/rules.py for the syntax.')
+@click.option('--streaming', default=False, is_flag=True, help='Start the review with the first objects while the rest of the tiles and wikidata translations are downloaded in background. Not compatible with --group-by-wikidata.')
+@click.option('--tiles', default=1, type=int, help='With --streaming and a bounding box area, query Overpass in this number of tiles to start the review sooner.')
 @click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
 @click.option('--verbose', '-v', count=True, help='Print all the tags of the features that you are currently editing.')
-def translate_with_wikidatacommand(area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, remember_answers, filters, lang, name_as_option, output, output_format, passwordfile, query, username, verbose):
+def translate_with_wikidatacommand(area, batch, changeset_comment, changeset_hashtags, changeset_source, dry_run, export_osc, metrics, remember_answers, filters, group_by_wikidata, lang, memory, name_as_option, output, output_format, passwordfile, profile, profile_cpu, query, rate_limits, rules, streaming, tiles, username, verbose):
     """Add «name:LANG» selecting the label or alias from «wikidata»."""
-    if not dry_run:
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='translate_with_wikidata')
+    if export_osc and not dry_run:
+        api = osc.OscWriter(export_osc)
+        batch = None  # upload_osc splits the changesets
+    elif not dry_run:
         api = lt.login_osm(username=username, passwordfile=passwordfile)
     if not filters:
         filters = f"nwr['name'][~'name:[a-z]+'~'.']['wikidata'][!'name:{lang}']"
@@ -88,60 +93,98 @@ def translate_with_wikidatacommand(area, batch, changeset_comment, changeset_has
     if not area and not query:
         print('Missing overpass "area" or "query" option. See "write_osm_objects_report --help" for details.')
         exit()
-    result = lt.get_overpass_result(area=area, filters=filters, query=query)
-    n_objects = len(result.nodes) + len(result.ways) + len(result.relations)
-    print('######################################################')
-    print(f'{str(n_objects)} objects found ({str(len(result.nodes))} nodes, {str(len(result.ways))}'
-          f' ways and {str(len(result.relations))} relations).')
-    print('######################################################')
-
-    wikidata_ids = []
-    for osm_object in result.nodes + result.ways + result.relations:
-        if osm_object.tags['wikidata']:
-            wikidata_ids.append(osm_object.tags['wikidata'])
-    wikidata_unique_ids = list(dict.fromkeys(wikidata_ids))  # dict keys -> unique in the same order
-    db = wikimedia.get_translations(ids=wikidata_unique_ids, lang=lang)
+    compiled_rules = lr.load_rules(rules) if rules else []
+    memory = TranslationMemory(memory) if memory else None
+    db = {}
+    db_P31 = {}
     n_translations = 0
     n_objects_with_translations = 0
-    for key in db.keys():
-        db[key].update({'objects': [], 'answer': {'value': None, 'committed': False}})
-        if db[key]['translations']:
-            n_translations = n_translations + 1
-            n_objects_with_translations = n_objects_with_translations + wikidata_ids.count(key)
-    if n_objects_with_translations > 0:
-        percent_objects_with_translations = round(n_objects_with_translations / n_objects * 100)
+    if streaming:
+        if group_by_wikidata:
+            print('"--group-by-wikidata" needs all the objects before the review. Remove "--streaming".')
+            exit()
+
+        def fetch(ids):
+            translations = wikimedia.get_translations(ids=ids, lang=lang)
+            if lr.uses_P31(compiled_rules):
+                db_P31.update(wikimedia.get_instance_type_from_wikidata(ids))
+            for key in translations.keys():
+                translations[key].update({'objects': [], 'answer': {'value': None, 'committed': False}})
+            db.update(translations)
+
+        # The objects are reviewed while the next tiles and wikidata batches are downloaded in background
+        stream = pipeline.background(pipeline.enrich(pipeline.background(pipeline.source(
+            area=area, filters=filters, query=query, meta=bool(export_osc), tiles=tiles), maxsize=2), fetch=fetch), maxsize=100)
+        n_objects = None
+        print('Streaming the objects: the review starts when the first tile and wikidata batch arrive.')
+        print('######################################################')
+        review_units = ([osm_object] for osm_object in stream)
     else:
-        percent_objects_with_translations = 0
-        print(f'{n_translations} translations available from wikidata. Nothing to work on here.')
+        result = lt.get_overpass_result(area=area, filters=filters, query=query, meta=bool(export_osc))
+        index = ObjectIndex(result)
+        n_objects = len(index)
         print('######################################################')
-        exit()
-    print(f'{n_translations} translations available from wikidata for {n_objects_with_translations}'
-          f' OSM objects ({percent_objects_with_translations}%).')
-    print('######################################################')
-    if n_objects_with_translations > 200 and ((batch is not None and batch > 200) or batch is None:
-        print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
-                         'Reduce the area, add batch option < 200 or stop translating when you want by pressing Ctrl+c.' + Style.RESET_ALL)
-    start = input('Start translating [Y/n]: ').lower()
+        print(index.summary())
+        print('######################################################')
+
+        wikidata_unique_ids = list(index.by_wikidata.keys())
+        db = wikimedia.get_translations(ids=wikidata_unique_ids, lang=lang)
+        if lr.uses_P31(compiled_rules):
+            db_P31 = wikimedia.get_instance_type_from_wikidata(wikidata_unique_ids)
+        for key in db.keys():
+            db[key].update({'objects': [], 'answer': {'value': None, 'committed': False}})
+            if db[key]['translations']:
+                n_translations = n_translations + 1
+                n_objects_with_translations = n_objects_with_translations + index.wikidata_counts.get(key, 0)
+        if n_objects_with_translations > 0:
+            percent_objects_with_translations = round(n_objects_with_translations / n_objects * 100)
+        else:
+            percent_objects_with_translations = 0
+            print(f'{n_translations} translations available from wikidata. Nothing to work on here.')
+            print('######################################################')
+            exit()
+        print(f'{n_translations} translations available from wikidata for {n_objects_with_translations}'
+              f' OSM objects ({percent_objects_with_translations}%).')
+        print('######################################################')
+        if n_objects_with_translations > 200 and ((batch is not None and batch > 200) or batch is None):
+            print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
+                             'Reduce the area, add batch option < 200 or stop translating when you want by pressing Ctrl+c.' + Style.RESET_ALL)
+        if group_by_wikidata:  # review every wikidata once and apply the answer to all its objects
+            review_units = list(index.by_wikidata.values())
+            review_units.extend([osm_object] for osm_object in index.objects if not osm_object.tags.get('wikidata'))
+        else:
+            review_units = [[osm_object] for osm_object in index.objects]
+    start = profiling.user_input('Start translating [Y/n]: ').lower()
     if start not in ['y', 'yes', '']:
         exit()
+    profiling.switch('review')
 
     changeset = None
     n_changeset = 0
     n_edits = 0
+    n_prompts = 0
     total_edits = 0
     try:
-        for osm_object in tqdm(result.nodes + result.ways + result.relations):
+        for osm_objects in tqdm(review_units):
+            osm_object = osm_objects[0]
+            auto = False  # accepted by a rule, uploaded without confirmation
             if not dry_run:
                 lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
             lt.print_osm_object(osm_object, verbose=verbose)
+            if len(osm_objects) > 1:
+                names = list(dict.fromkeys(x.tags.get('name', '') for x in osm_objects))
+                print(Fore.BLUE + Style.BRIGHT + f'{len(osm_objects)} objects with the same wikidata. Names: '
+                      + ', '.join(names) + Style.RESET_ALL)
             if 'wikidata' in osm_object.tags.keys() and osm_object.tags['wikidata'] in db.keys():
+                if streaming and db[osm_object.tags['wikidata']]['translations']:
+                    n_objects_with_translations = n_objects_with_translations + 1
                 translations = {'id': osm_object.tags['wikidata'],
                                 'translations': db[osm_object.tags['wikidata']]['translations']}
                 tags = {}
                 if output:
-                    db[translations['id']]['objects'].append({'name': osm_object.tags['name'],
-                                                              'type': osm_object._type_value,
-                                                              'id': osm_object.id, 'modified': False})
+                    for x in osm_objects:
+                        db[translations['id']]['objects'].append({'name': x.tags['name'], 'type': x._type_value,
+                                                                  'id': x.id, 'modified': False})
             else:
                 print('wikidata id: ' + osm_object.tags['wikidata'])
                 # import json
@@ -153,6 +196,7 @@ def translate_with_wikidatacommand(area, batch, changeset_comment, changeset_has
 
             if remember_answers and db[translations['id']]['answer']['committed']:
                 print(Fore.BLUE + 'Remembering your answer...' + Style.RESET_ALL)
+                lm.count('decisions_total', decision='remembered')
                 tags['name:' + lang] = db[translations['id']]['answer']['value']
             else:
                 select_translation = '-'
@@ -162,74 +206,123 @@ def translate_with_wikidatacommand(area, batch, changeset_comment, changeset_has
                             db[translations['id']]['answer']['value'] == '-'
                     ):
                         print(Fore.BLUE + 'Remembering your answer... SKIP.' + Style.RESET_ALL)
+                        lm.count('decisions_total', decision='remembered_skip')
                         continue
 
-                    translation_options = []
-                    i = 0
-                    if translations['translations']['wikipedia'] and translations['translations']['wikipedia']['title']:
-                        print(Style.BRIGHT + Fore.CYAN + str(i) + ' = ' + translations['translations']['wikipedia']['title'] + Style.RESET_ALL)
-                        translation_options.append(translations['translations']['wikipedia']['title'])
-                        i = i + 1
-
-                    if name_as_option and osm_object.tags['name']:
-                        print(Fore.YELLOW + str(i) + ' = ' + osm_object.tags['name'] + Style.RESET_ALL)
-                        translation_options.append(osm_object.tags['name'])
-                        i = i + 1
-
-                    if translations['translations']['extra']:
-                        for alias in translations['translations']['extra']:
-                            print(str(i) + ' = ' + alias['value'])
-                            translation_options.append(alias['value'])
-                            i = i + 1
+                    candidates = la.translation_candidates(translations['translations'], name=osm_object.tags.get('name'),
+                                                            name_as_option=name_as_option)
+                    for i, candidate in enumerate(candidates):
+                        print(CANDIDATE_STYLES.get(candidate['source'], '') + str(i) + ' = ' + candidate['value'] + Style.RESET_ALL)
+                    translation_options = [x['value'] for x in candidates]
+                    i = len(translation_options)
 
-                    if translations['translations']['label'] and translations['translations']['label']['value']:
-                        print(Style.BRIGHT + str(i) + ' = ' + translations['translations']['label']['value'] + Style.RESET_ALL)
-                        translation_options.append(translations['translations']['label']['value'])
-                        i = i + 1
-
-                    if translations['translations']['aliases']:
-                        for alias in translations['translations']['aliases']:
-                            print(str(i) + ' = ' + alias['value'])
-                            translation_options.append(alias['value'])
+                    default = '0'
+                    known = None
+                    if memory:
+                        known = memory.lookup(lang, wikidata=translations['id'], name=osm_object.tags.get('name'))
+                    if known and known['skipped'] and remember_answers:
+                        print(Fore.BLUE + 'Remembering your answer from the translation memory... SKIP.' + Style.RESET_ALL)
+                        lm.count('decisions_total', decision='memory_skip')
+                        continue
+                    if known and not known['skipped']:
+                        if known['value'] not in translation_options:
+                            print(Fore.MAGENTA + str(i) + ' = ' + known['value'] + Style.RESET_ALL)
+                            translation_options.append(known['value'])
                             i = i + 1
+                        default = str(translation_options.index(known['value']))
+                        print(Fore.MAGENTA + f'Translation memory ({known["source"]}): {default} = {known["value"]}' +
+                              (' (committed)' if known['committed'] else '') + Style.RESET_ALL)
 
                     if verbose > 2:
                         print(Fore.LIGHTBLACK_EX + 'translation_options: ' + str(translation_options) + Style.RESET_ALL)
 
-                    if translation_options:
-                        select_translation = input('Select translation ("-" to skip, "e" to edit): ') or '0'
+                    decision = 'ask'
+                    if known and not known['skipped'] and remember_answers:
+                        decision = 'memory'
+                    elif compiled_rules and translation_options:
+                        decision, auto_value, rule = lr.decide(compiled_rules, translations['translations'], translation_options,
+                                                               name=osm_object.tags.get('name'), P31=db_P31.get(translations['id']))
+                    if decision == 'memory':
+                        print(Fore.BLUE + 'Remembering your answer from the translation memory...' + Style.RESET_ALL)
+                        select_translation = default
+                    elif decision == 'accept':
+                        print(Fore.BLUE + f'AUTO ({rule.name}): ' + auto_value + Style.RESET_ALL)
+                        select_translation = 'auto'
+                        auto = True
+                    elif decision == 'skip':
+                        print(Fore.BLUE + f'AUTO ({rule.name}):' + Style.RESET_ALL, end=' ')
+                    elif translation_options:
+                        n_prompts = n_prompts + 1
+                        select_translation = profiling.user_input('Select translation ("-" to skip, "e" to edit): ') or default
                         while select_translation not in [str(x) for x in range(len(translation_options))] + ['-'] + ['e']:
                             print('Enter a number from 0 to ' + str(len(translation_options) - 1))
-                            select_translation = input('Select translation ("-" to skip, "e" to edit): ') or '0'
+                            select_translation = profiling.user_input('Select translation ("-" to skip, "e" to edit): ') or default
+                    if decision in ['accept', 'skip']:
+                        decision = 'rule_' + decision
+                    elif decision == 'ask':
+                        decision = {'-': 'skip', 'e': 'edit'}.get(select_translation, 'select') if translation_options else 'skip'
+                    lm.count('decisions_total', decision=decision)
 
-                if select_translation in '-':
+                if select_translation == 'auto':
+                    tags['name:' + lang] = auto_value
+                elif select_translation in '-':
                     db[translations['id']]['answer']['value'] = '-'
                     db[translations['id']]['answer']['committed'] = None
                     if translations['translations']:
+                        if memory:
+                            memory.record(lang, wikidata=translations['id'], name=osm_object.tags.get('name'), skipped=True)
                         print(Fore.BLUE + 'SKIP.' + Style.RESET_ALL)
                     else:
                         print(Fore.BLUE + 'SKIP: No translations from wikidata.' + Style.RESET_ALL)
                     continue
                 elif select_translation in 'e':
-                    tags['name:' + lang] = input(f'Enter a value for tag "name:{lang}": ')
+                    tags['name:' + lang] = profiling.user_input(f'Enter a value for tag "name:{lang}": ')
                 else:
                     select_translation = int(select_translation)
                     tags['name:' + lang] = translation_options[select_translation]
                 db[translations['id']]['answer']['value'] = tags['name:' + lang]
+                if memory:
+                    memory.record(lang, tags['name:' + lang], wikidata=translations['id'], name=osm_object.tags.get('name'))
 
             if not dry_run:
                 if changeset is None:
                     n_changeset = n_changeset + 1
-                    if batch and n_objects > batch and changeset_comment:  # TODO predict if more than 1 changeset will be used
+                    if batch and (n_objects is None or n_objects > batch) and changeset_comment:  # TODO predict if more than 1 changeset will be used
                         changeset_tags.update({'comment': changeset_comment + f' (part {n_changeset})'})
                     changeset = api.ChangesetCreate(changeset_tags)
-                committed = lt.update_osm_object(osm_object=osm_object, tags=tags, api=api)
+                if len(osm_objects) > 1:
+                    updates = lt.confirm_osm_objects(osm_objects=osm_objects, tags=tags, confirm=not auto)
+                    committed = []
+                    while updates:  # a group larger than the rest of the batch continues in the next changesets
+                        if changeset is None:
+                            n_changeset = n_changeset + 1
+                            if changeset_comment:
+                                changeset_tags.update({'comment': changeset_comment + f' (part {n_changeset})'})
+                            changeset = api.ChangesetCreate(changeset_tags)
+                        size = batch - n_edits if batch else len(updates)
+                        result = lt.commit_osm_objects(updates[:size], api=api)
+                        updates = updates[size:]
+                        done = [(x['type'], element['id']) for x in result for element in x['data']]
+                        committed.extend(done)
+                        n_edits = n_edits + len(done)
+                        if batch and n_edits >= batch and updates:
+                            print(f'{n_edits} edits DONE! https://www.osm.org/changeset/{changeset}. Opening a new changeset.')
+                            total_edits = total_edits + n_edits
+                            api.ChangesetClose()
+                            changeset = None
+                            n_edits = 0
+                else:
+                    committed = lt.update_osm_object(osm_object=osm_object, tags=tags, api=api, confirm=not auto)
+                    committed = [(osm_object._type_value, osm_object.id)] if committed else []
+                    n_edits = n_edits + len(committed)
                 if committed:
-                    n_edits = n_edits + 1
-                    db[translations['id']]['answer']['committed'] = True
-                    object_db = db[translations['id']]['objects'].pop()
-                    object_db['modified'] = True
-                    db[translations['id']]['objects'].append(object_db)
+                    # an exported edit is remembered in this run but only committed by upload_osc
+                    db[translations['id']]['answer']['committed'] = 'exported' if export_osc else True
+                    if memory and not export_osc:
+                        memory.mark_committed(lang, wikidata=translations['id'], name=osm_object.tags.get('name'))
+                    if output:
+                        for object_db in db[translations['id']]['objects'][-len(osm_objects):]:
+                            object_db['modified'] = (object_db['type'], object_db['id']) in committed
                 if batch and n_edits >= batch:
                     print(f'{n_edits} edits DONE! https://www.osm.org/changeset/{changeset}. Opening a new changeset.')
                     total_edits = total_edits + n_edits
@@ -241,16 +334,29 @@ def translate_with_wikidatacommand(area, batch, changeset_comment, changeset_has
 
     finally:
         print('######################################################')
-        if changeset and not dry_run:
+        if changeset and export_osc and not dry_run:
+            total_edits = total_edits + n_edits
+            n_written = api.close()
+            print(f'DONE! {total_edits} objects modified. {n_written} objects written to {export_osc}.'
+                  f' Upload them with "upload_osc {export_osc}".')
+        elif changeset and not dry_run:
             total_edits = total_edits + n_edits
             print(f'DONE! {total_edits} objects modified from {n_objects_with_translations}'
-                  f' objects with available translations ({round(total_edits / n_objects_with_translations * 100)}%)'
+                  f' objects with available translations ({round(total_edits / max(n_objects_with_translations, 1) * 100)}%)'
                   f' https://www.osm.org/changeset/{changeset}')
             api.ChangesetClose()
         elif dry_run:
             print('DONE! No change send to OSM (--dry-run).')
         else:
             print('DONE! No change send to OSM.')
+        if compiled_rules:
+            print(f'Rules: {n_prompts} objects prompted. ' +
+                  ', '.join(f'"{rule.name}" {rule.action} {rule.hits}' for rule in compiled_rules))
+        if memory:
+            print(f'Translation memory: {memory.hits} known answers, {memory.count()} answers in {memory.path}.')
+            memory.close()
+        if verbose > 1:
+            rate_limit.print_stats()
 
         if output:
             table_name = f'# Generated by translate_with_wikidata from LangToolsOSM {__version__} with parameters: lang={lang}, area={area}, ' \
@@ -1,12 +1,12 @@
 import click
-import osmapi
-import pandas as pd
-import pytablereader
 from colorama import Fore, Style
 from tqdm import tqdm
 
+import lib.metrics as lm
 import lib.osm_utils as lt
-from lib import __version__
+from lib import __version__, daemon, osc, profiling, rate_limit
+from lib.report import FORMATS, count_report_rows, iter_report_rows, prediff_report, report_columns
+
 
 @click.command()
 @click.argument('upload-tags', nargs=-1)
@@ -17,22 +17,33 @@ from lib import __version__
 @click.option('--confirmed-edits', default=False, is_flag=True, help='Do not ask for confirmation for every object edition. Review carefully the input-file before using this option.')
 @click.option('--confirm-overwrites', default=False, is_flag=True, help='Ask for confirmation for updates that overwrite any tag value.')
 @click.option('--dry-run', default=False, is_flag=True, help='Run the program without saving any change to OSM. Useful for testing. No login required.')
-@click.option('--input-file', type=click.Path(dir_okay=False), help='Path of the file with the tags to update. You can generate a template with write_osm_objects_report.')
-@click.option('--input-format', type=click.Choice(['csv', 'mediawiki'], case_sensitive=False), default='csv', help='Format of the input file.')
+@click.option('--export-osc', type=click.Path(dir_okay=False, writable=True), help='Write the accepted edits to this osmChange file instead of uploading them, without login. Upload the file later with upload_osc. Ignored in --dry-run mode.')
+@click.option('--input-file', type=click.Path(dir_okay=False), multiple=True, help='Path of the file with the tags to update. You can generate a template with write_osm_objects_report. Repeat the option to process several files (eg. shards) as one report.')
+@click.option('--input-format', type=click.Choice(FORMATS, case_sensitive=False), default='csv', help='Format of the input file. "parquet" requires pyarrow.')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
 @click.option('--no-interaction', default=False, is_flag=True, help='Do not ask any interactive question.')
 @click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
 @click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
 @click.option('--verbose', '-v', count=True, help='Print all the tags of the features that you are currently editing.')
-def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_hashtags, changeset_source, confirmed_edits, confirm_overwrites, dry_run, input_file, input_format, no_interaction, passwordfile, username, upload_tags, verbose):
+def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_hashtags, changeset_source, confirmed_edits, confirm_overwrites, dry_run, export_osc, input_file, input_format, metrics, no_interaction, passwordfile, profile, profile_cpu, rate_limits, username, upload_tags, verbose):
     """Upload changed tags from an edited report file to OSM. UPLOAD_TAGS must match column names in the input file.
     You can generate a report file with write_osm_objects_report."""
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='update_osm_objects_from_report')
     if upload_tags is None:
         print('DONE! No change send to OSM because no UPLOAD_TAGS selected.')
         print('See "update_osm_objects_from_report --help" for details.')
         exit()
     upload_tags = list(upload_tags)
     if dry_run:
-        api = osmapi.OsmApi()
+        api = lt.new_osm_api()
+    elif export_osc:
+        api = osc.OscWriter(export_osc)
+        batch = None  # upload_osc splits the changesets
     else:
         api = lt.login_osm(username=username, passwordfile=passwordfile)
 
@@ -46,49 +57,74 @@ def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_ha
         changeset_tags.update({'source': changeset_source})
     print(changeset_tags)
 
-    if input_format == 'csv':
-        data = pd.read_table(input_file, skiprows=1)
-    elif input_format == 'mediawiki':
-        loader = pytablereader.MediaWikiTableFileLoader(file_path=input_file)
-        for table_data in loader.load():
-            data = table_data.as_dataframe()
-    else:
-        raise ValueError('File format must be "csv" or "mediawiki".')
-
-    n_objects = data.shape[0]
-    print('######################################################')
-    print(f'{n_objects} objects to edit.')
-    print('######################################################')
-    if not set(upload_tags).issubset(data.columns):
+    if not input_file:
+        print('Missing "--input-file" option. See "update_osm_objects_from_report --help" for details.')
+        exit()
+    input_file = list(input_file)
+    columns = set.intersection(*[set(report_columns(file, file_format=input_format)) for file in input_file])
+    if not set(upload_tags).issubset(columns):
         print('File columns:')
-        print(data.columns)
+        print(sorted(columns))
         print('Tags to upload:')
         print(upload_tags)
         raise ValueError('tags must include column names present in the input_file. Missing columns ' +
-                         str(set(upload_tags).difference(data.columns)))
-    if n_objects > 200 and ((batch is not None and batch > 200) or batch is None):  # TODO: count tags with value
+                         str(set(upload_tags).difference(columns)))
+    print('######################################################')
+    if 'all_tags' in columns:  # drop the rows without changes before querying the API
+        with profiling.phase('prediff'):
+            rows, summary = prediff_report(input_file, file_format=input_format, upload_tags=upload_tags)
+        n_objects = summary['changed']
+        print(f"{n_objects} of {summary['rows']} objects changed in the report: {sum(summary['added'].values())} tags"
+              f" added and {sum(summary['overwritten'].values())} tags overwritten.")
+        if verbose > 0:
+            for key in upload_tags:
+                print(f"  {key}: {summary['added'][key]} added, {summary['overwritten'][key]} overwritten")
+    else:
+        n_objects = count_report_rows(input_file, file_format=input_format)
+        rows = iter_report_rows(input_file, file_format=input_format, columns=list(dict.fromkeys(['typeOSM', 'idOSM'] + upload_tags)))
+        print(f'{n_objects} objects to edit.')
+    print('######################################################')
+    if n_objects == 0:
+        print('DONE! No change send to OSM because the report has no changes.')
+        exit()
+    current = None
+    if export_osc and not dry_run:  # the versions to export, with bulk downloads instead of one request per row
+        rows = list(rows)
+        reader = lt.new_osm_api()
+        current = {}
+        with profiling.phase('query'):
+            for osm_type in osc.TYPES:
+                ids = list(dict.fromkeys(int(row['idOSM']) for row in rows if row['typeOSM'] == osm_type))
+                current.update({(osm_type, osm_id): data for osm_id, data in lt.get_elements(reader, osm_type, ids).items()})
+    if n_objects > 200 and ((batch is not None and batch > 200) or batch is None):
         print(Fore.RED + 'Changesets with more than 200 modifications are considered mass modifications in OSMCha.\n'
                          'Reduce the number of objects in the input file, add batch option < 200 or stop when you want by pressing Ctrl+c.' + Style.RESET_ALL)
     if no_interaction:
         start = 'yes'
     else:
-        start = input('Start editing [Y/n]: ').lower()
+        start = profiling.user_input('Start editing [Y/n]: ').lower()
     if start not in ['y', 'yes', '']:
         exit()
+    profiling.switch('review')
 
     changeset = None
     n_changeset = 0
     n_edits = 0
     total_edits = 0
     try:
-        for row in tqdm(data.iterrows()):
+        for row in tqdm(rows, total=n_objects):
             if not dry_run:
                 lt.print_changeset_status(changeset=changeset, n_edits=n_edits, n_changeset=n_changeset, verbose=verbose)
-            tags = row[1][upload_tags]
-            tags = dict(tags.dropna())
+            tags = {key: row[key] for key in upload_tags if key in row}
 
-            if row[1]['typeOSM'] == 'node':
-                osm_object = api.NodeGet(row[1]['idOSM'])
+            if current is not None:
+                osm_object = current.get((row['typeOSM'], int(row['idOSM'])))
+                if osm_object is None:
+                    print(Fore.BLUE + f"SKIP: {row['typeOSM']} {row['idOSM']} not found in OSM." + Style.RESET_ALL)
+                    continue
+                osm_object_data = osm_object
+            elif row['typeOSM'] == 'node':
+                osm_object = api.NodeGet(int(row['idOSM']))
                 osm_object_data = {
                     'id': osm_object['id'],
                     'lat': osm_object['lat'],
@@ -96,16 +132,16 @@ def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_ha
                     'tag': osm_object['tag'],
                     'version': osm_object['version'],
                 }
-            elif row[1]['typeOSM'] == 'way':
-                osm_object = api.WayGet(row[1]['idOSM'])
+            elif row['typeOSM'] == 'way':
+                osm_object = api.WayGet(int(row['idOSM']))
                 osm_object_data = {
                     'id': osm_object['id'],
                     'nd': osm_object['nd'],
                     'tag': osm_object['tag'],
                     'version': osm_object['version'],
                 }
-            elif row[1]['typeOSM'] == 'relation':
-                osm_object = api.RelationGet(row[1]['idOSM'])
+            elif row['typeOSM'] == 'relation':
+                osm_object = api.RelationGet(int(row['idOSM']))
                 osm_object_data = {
                     'id': osm_object['id'],
                     'member': osm_object['member'],
@@ -138,7 +174,8 @@ def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_ha
                 continue
 
             if not confirmed_edits or (confirm_overwrites and len(overwrite_tags) > 0):
-                allow_update = input('Update tags [Y/n]: ').lower()
+                allow_update = profiling.user_input('Update tags [Y/n]: ').lower()
+                lm.count('decisions_total', decision='confirm' if allow_update in ['y', 'yes', ''] else 'reject')
                 if allow_update not in ['y', 'yes', '']:
                     print(Fore.BLUE + 'SKIP.' + Style.RESET_ALL)
                     continue
@@ -151,12 +188,15 @@ def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_ha
                     if batch and n_objects > batch and changeset_comment:  # TODO predict if more than 1 changeset will be used
                         changeset_tags.update({'comment': changeset_comment + f' (part {n_changeset})'})
                     changeset = api.ChangesetCreate(changeset_tags)
-                if row[1]['typeOSM'] == "node":
-                    committed = api.NodeUpdate(osm_object_data)
-                elif row[1]['typeOSM'] == "way":
-                    committed = api.WayUpdate(osm_object_data)
-                elif row[1]['typeOSM'] == "relation":
-                    committed = api.RelationUpdate(osm_object_data)
+                with profiling.phase('commit'):
+                    if not export_osc:  # the exported edits don't change OSM
+                        daemon.notify_edit()
+                    if row['typeOSM'] == "node":
+                        committed = api.NodeUpdate(osm_object_data)
+                    elif row['typeOSM'] == "way":
+                        committed = api.WayUpdate(osm_object_data)
+                    elif row['typeOSM'] == "relation":
+                        committed = api.RelationUpdate(osm_object_data)
                 if committed:
                     n_edits = n_edits + 1
                 if batch and n_edits >= batch:
@@ -168,7 +208,12 @@ def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_ha
 
     finally:
         print('######################################################')
-        if changeset and not dry_run:
+        if changeset and export_osc and not dry_run:
+            total_edits = total_edits + n_edits
+            n_written = api.close()
+            print(f'DONE! {total_edits} objects modified from {n_objects} objects ({round(total_edits / n_objects * 100)}%).'
+                  f' {n_written} objects written to {export_osc}. Upload them with "upload_osc {export_osc}".')
+        elif changeset and not dry_run:
             total_edits = total_edits + n_edits
             print(f'DONE! {total_edits} objects modified from {n_objects} objects ({round(total_edits / n_objects * 100)}%)'
                   f' https://www.osm.org/changeset/{changeset}')
@@ -177,3 +222,5 @@ def update_osm_objects_from_reportcommand(batch, changeset_comment, changeset_ha
             print('DONE! No change send to OSM (--dry-run).')
         else:
             print('DONE! No change send to OSM.')
+        if verbose > 1:
+            rate_limit.print_stats()
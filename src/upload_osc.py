@@ -0,0 +1,102 @@
+import click
+from colorama import Fore, Style
+
+import lib.metrics as lm
+import lib.osm_utils as lt
+from lib import __version__, daemon, osc, profiling, rate_limit
+
+
+@click.command()
+@click.argument('input-file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch', type=int, default=200, help='Maximum number of edits per changeset.')
+@click.option('--changeset-comment', type=str, help='Comment for the changesets. Default to the comment of the command that exported the file.')
+@click.option('--changeset-hashtags', type=str, help='#hashtags for the changesets. Semicolon delimited (e.g. "#toponimsCat;#Calle-Carrer").')
+@click.option('--changeset-source', type=str, help='Source tag value for the changesets.')
+@click.option('--chunk-size', type=int, default=100, help='Number of objects per diff upload.')
+@click.option('--dry-run', default=False, is_flag=True, help='Check the versions of the objects without saving any change to OSM. No login required.')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
+@click.option('--no-interaction', default=False, is_flag=True, help='Do not ask any interactive question.')
+@click.option('--passwordfile', default=None, type=str, help='Path to a passwordfile, where on the first line username and password must be colon-separated (:). If provided, username option is ignored.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
+@click.option('--username', type=str, help='OSM user name to login and commit changes. Ignored in --dry-run mode.')
+@click.option('--verbose', '-v', count=True, help='Print the objects skipped because they were modified in OSM after the export (-v) and the statistics of the requests (-vv).')
+def upload_osccommand(batch, changeset_comment, changeset_hashtags, changeset_source, chunk_size, dry_run, input_file, metrics, no_interaction, passwordfile, profile, profile_cpu, rate_limits, username, verbose):
+    """Upload the edits of an osmChange file exported with --export-osc. The objects modified in OSM after the export
+    are skipped."""
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='upload_osc')
+    changeset_tags, elements = osc.read_osc(input_file)
+    changeset_tags.update({'created_by': f'LangToolsOSM {__version__}'})
+    if changeset_comment:
+        changeset_tags.update({'comment': changeset_comment})
+    if changeset_hashtags:
+        changeset_tags.update({'hashtags': changeset_hashtags})
+    if changeset_source:
+        changeset_tags.update({'source': changeset_source})
+    if dry_run:
+        api = lt.new_osm_api()
+    else:
+        api = lt.login_osm(username=username, passwordfile=passwordfile)
+
+    with profiling.phase('validate'):
+        conflicts = osc.conflicts(api, elements)
+    print('######################################################')
+    for osm_type, data, version in conflicts:
+        if verbose > 0:
+            print(Fore.RED + f'SKIP: https://osm.org/{osm_type}/{data["id"]} has version {version}, the edit is based on'
+                             f' version {data["version"]}.' + Style.RESET_ALL)
+    skip = set((osm_type, data['id']) for osm_type, data, _ in conflicts)
+    elements = [(osm_type, data) for osm_type, data in elements if (osm_type, data['id']) not in skip]
+    n_changesets = -(-len(elements) // batch) if batch else 1
+    print(f'{len(elements) + len(conflicts)} objects in {input_file}: {len(conflicts)} modified in OSM after the export'
+          f' and {len(elements)} to upload in {n_changesets} changesets.')
+    print(changeset_tags)
+    print('######################################################')
+    if not elements:
+        print('DONE! No change send to OSM.')
+        exit()
+    if dry_run:
+        print('DONE! No change send to OSM (--dry-run).')
+        exit()
+    if no_interaction:
+        start = 'yes'
+    else:
+        start = profiling.user_input('Start uploading [Y/n]: ').lower()
+    if start not in ['y', 'yes', '']:
+        exit()
+    profiling.switch('commit')
+
+    comment = changeset_tags.get('comment')
+    changesets = []
+    total_edits = 0
+    changeset = None
+    try:
+        daemon.notify_edit()
+        for ndx in range(0, len(elements), batch or len(elements)):
+            if n_changesets > 1 and comment:
+                changeset_tags.update({'comment': comment + f' (part {len(changesets) + 1})'})
+            changeset = api.ChangesetCreate(changeset_tags)
+            changesets.append(changeset)
+            part = elements[ndx:ndx + batch] if batch else elements
+            for osm_type in osc.TYPES:
+                data = [x for t, x in part if t == osm_type]
+                # One change per upload: osmapi matches the diff result with the elements of each change from the start
+                for chunk in range(0, len(data), chunk_size):
+                    result = api.ChangesetUpload([{'type': osm_type, 'action': 'modify', 'data': data[chunk:chunk + chunk_size]}])
+                    n_edits = sum(len(x['data']) for x in result)
+                    lm.count('edits_total', n_edits, type=osm_type)
+                    total_edits = total_edits + n_edits
+            print(f'{len(part)} edits DONE! https://www.osm.org/changeset/{changeset}')
+            api.ChangesetClose()
+            changeset = None
+    finally:
+        if changeset:
+            api.ChangesetClose()
+        print('######################################################')
+        print(f'DONE! {total_edits} objects modified in {len(changesets)} changesets ' +
+              ' '.join(f'https://www.osm.org/changeset/{x}' for x in changesets))
+        if verbose > 1:
+            rate_limit.print_stats()
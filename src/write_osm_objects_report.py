@@ -1,61 +1,176 @@
 import click
-import csv
+import collections
+import contextlib
 from colorama import Fore, Style
+import lib.metrics as lm
 import lib.osm_utils as lt
 import lib.wikimedia as wt
-import pytablewriter
 from tqdm import tqdm
-from lib import __version__
+from lib import __version__, profiling, rate_limit
+from lib.object_index import ObjectIndex
+from lib.report import FORMATS, SHARD_MODES, TYPED_FORMATS, open_report, shard_by_grid, shard_by_group, shard_by_rows, shard_path, shard_title
+
+
+def lang_columns(osm_object, lang: str, output_format: str, db_wikidata_translations: dict, wikimedia_urls=False) -> tuple:
+    """Return the values of «name:lang», the wikidata translations and the wikipedia page in «lang»."""
+    wikipedia_page = ''
+    translations = ''
+    if 'wikidata' in osm_object.tags.keys() and osm_object.tags['wikidata'] in db_wikidata_translations.keys():
+        translations = db_wikidata_translations[osm_object.tags['wikidata']]
+        if translations['translations']:
+            if translations['translations']['wikipedia']:
+                wikipedia_page = translations['translations']['wikipedia']['title']
+            translations['translations']['extra'] = None
+            translations = wt.list_translations(translations['translations'])
+            translations = list(dict.fromkeys(translations))  # unique keeping order
+            translations = ', '.join(translations)
+        else:
+            translations = ''
+    name_lang = ''
+    if 'name:' + lang in osm_object.tags.keys():
+        name_lang = osm_object.tags['name:' + lang]
+    if wikipedia_page != '':
+        if output_format == 'mediawiki':
+            wikipedia_page = f'[https://{lang}.wikipedia.com/wiki/{wikipedia_page} {wikipedia_page}]'
+        elif wikimedia_urls:
+            wikipedia_page = f'https://{lang}.wikipedia.com/wiki/{wikipedia_page}'
+    return name_lang, translations, wikipedia_page
+
+
+def report_row(osm_object, langs: list, output_format: str, extra_tags, db_wikidata_translations: dict,
+               db_wikidata_type: dict = None, wikimedia_urls=False, coords=False) -> list:
+    """Values of the report columns for «osm_object». «db_wikidata_translations» has the translations of every language
+    in «langs» (eg. {'ca': get_translations(ids, 'ca')})."""
+    wikidata_type = db_wikidata_type is not None
+    wikidata_id = ''
+    if 'wikidata' in osm_object.tags.keys() and osm_object.tags['wikidata'] in db_wikidata_translations[langs[0]].keys():
+        wikidata_id = osm_object.tags['wikidata']
+    name = ''
+    if 'name' in osm_object.tags.keys():
+        name = osm_object.tags['name']
+    names_lang = []
+    translations = []
+    for lang in langs:
+        name_lang, lang_translations, wikipedia_page = lang_columns(osm_object, lang, output_format=output_format,
+                                                                   db_wikidata_translations=db_wikidata_translations[lang],
+                                                                   wikimedia_urls=wikimedia_urls)
+        names_lang.append(name_lang)
+        translations = translations + [lang_translations, wikipedia_page]
+    names_tags = []
+    for key, value in osm_object.tags.items():
+        if key.startswith('name:') or key in ['int_name', 'loc_name', 'short_name', 'official_name']:
+            names_tags.append(key + '=' + value)
+    names_tags = ', '.join(names_tags)
+    extra_tags_values = dict()
+    if extra_tags:
+        for key in extra_tags:
+            tag_value = ''
+            if key in osm_object.tags.keys():
+                tag_value = osm_object.tags[key]
+            extra_tags_values.update({key: tag_value})
+    wikidata_P31 = ''
+    if wikidata_type and 'wikidata' in osm_object.tags.keys():
+        if osm_object.tags['wikidata'] in db_wikidata_type.keys():
+            wikidata_P31 = db_wikidata_type[osm_object.tags['wikidata']]
+            wikidata_P31 = ', '.join(wikidata_P31)
+
+    if output_format in ['csv'] + TYPED_FORMATS:
+        if wikimedia_urls and wikidata_id != '':
+            wikidata_id = 'https://www.wikidata.org/wiki/' + wikidata_id
+        object_data = [osm_object._type_value, osm_object.id]
+    elif output_format == 'mediawiki':
+        if wikidata_id != '':
+            wikidata_id = f'[https://www.wikidata.org/wiki/{wikidata_id} {wikidata_id}]'
+        osm_object_str = '{{' + osm_object._type_value + '|' + str(osm_object.id) + '}}'
+        object_data = [osm_object_str, osm_object._type_value, osm_object.id]
+    else:
+        raise ValueError(f'File format must be one of {FORMATS}.')
+
+    object_data = object_data + [name] + names_lang + list(extra_tags_values.values()) + translations
+    if wikidata_type:
+        object_data = object_data + [wikidata_P31]
+    if output_format in TYPED_FORMATS:
+        object_data = object_data + [wikidata_id, names_tags, dict(osm_object.tags)]
+    else:
+        object_data = object_data + [wikidata_id, names_tags, str(osm_object.tags)]
+
+    if coords:
+        if osm_object._type_value == 'node':
+            lat, lon = osm_object.lat, osm_object.lon
+        else:
+            lat, lon = osm_object.center_lat, osm_object.center_lon
+        if output_format in TYPED_FORMATS:
+            object_data = object_data + [float(lat) if lat is not None else None, float(lon) if lon is not None else None]
+        else:
+            object_data = object_data + [str(lat), str(lon)]
+
+    return object_data
+
 
 @click.command()
 @click.argument('extra-tags', nargs=-1)
 @click.option('--area', type=str, help='Search area (eg. "42.49,2.43,42.52,2.49", "[name_int=Kobane]" or "Le Canigou"). Ignored if query is present.')
 @click.option('--coords', default=False, is_flag=True, help='Add columns for the latitude and longitude of the center of the objects. Custom queries must include a out center mode.')
 @click.option('--filters', type=str, help="""Overpass filters to search for objects. Default to "nwr['name']['name:{lang}']". Ignored if query is present.""")
-@click.option('--lang', prompt='Language to add a multilingual name key (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code. See https://wiki.openstreetmap.org/wiki/Multilingual_names .')
+@click.option('--lang', prompt='Language to add a multilingual name key (e.g. ca, en, ...)', type=str, help='A language ISO 639-1 Code or several comma separated (e.g. "ca,oc,es") for a column group per language. See https://wiki.openstreetmap.org/wiki/Multilingual_names .')
+@click.option('--metrics', type=click.Path(dir_okay=False, writable=True), help='Write counters and latency histograms of the HTTP requests, phases, decisions and edits to this file every 30 s and at exit: a Prometheus textfile if it ends with ".prom", a JSON summary otherwise.')
 @click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Path of the file to write the db of wikidata translations and user answers.')
-@click.option('--output-format', type=click.Choice(['csv', 'mediawiki'], case_sensitive=False), default='csv', help='Format of the output file.')
+@click.option('--output-format', type=click.Choice(FORMATS, case_sensitive=False), default='csv', help='Format of the output file. "jsonl" and "parquet" keep the column types and write all_tags as a mapping. "parquet" requires pyarrow.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a JSON trace with the time per phase, every HTTP request and the time waiting for the user to this file and print a summary at exit.')
+@click.option('--profile-cpu', default=False, is_flag=True, help='With --profile, also capture a cProfile of the non-interactive parts to PROFILE.pstats.')
 @click.option('--query', type=str, help="""Overpass query to search for objects.""")
+@click.option('--rate-limits', type=str, help='Maximum requests per second per host as "host=rate[/burst],..." (e.g. "overpass-api.de=0.5/2,www.wikidata.org=5") or path to an INI file with a [rate_limits] section.')
+@click.option('--shard-by', type=click.Choice(SHARD_MODES, case_sensitive=False), default='rows', help='How to split the objects in shards: consecutive rows, cells of a grid with the same number of objects (requires --coords) or keeping the objects with the same wikidata together.')
+@click.option('--shards', default=1, type=int, help='Write the report in this number of files (OUTPUT.shardKofN.EXT) to edit them in parallel. Merge them with merge_osm_objects_reports.')
 @click.option('--verbose', '-v', count=True, help='Print all the tags of the features that you are currently editing.')
 @click.option('--wikidata-type', default=False, is_flag=True, help='Query the object type (P31) according to the wikitada tag.')
 @click.option('--wikimedia-urls', default=False, is_flag=True, help='Write wikimedia URLs instead of the plain wikidata Id or wikipedia page title.')
-def write_osm_objects_reportcommand(area, coords, extra_tags, filters, lang, output, output_format, query, verbose, wikidata_type, wikimedia_urls):
+def write_osm_objects_reportcommand(area, coords, extra_tags, filters, lang, metrics, output, output_format, profile, profile_cpu, query, rate_limits, shard_by, shards, verbose, wikidata_type, wikimedia_urls):
     """Generates a file with names, OSM Id, wikidata translations and EXTRA_TAGS in columns. EXTRA_TAGS Should include
      at least the tags you will want to edit. You can edit and upload the changed tags with upload_osm_objects_from_report."""
+    rate_limit.configure(rate_limits)
+    profiling.start(profile, cpu=profile_cpu)
+    lm.start(metrics, command='write_osm_objects_report')
     if verbose > 1:
         print(extra_tags)
+    langs = [x.strip() for x in lang.split(',') if x.strip()]
     if not filters:
-        filters = f"nwr['name']['name:{lang}']"
+        if len(langs) > 1:
+            filters = f"nwr['name'][~'^name:({'|'.join(langs)})$'~'.']"
+        else:
+            filters = f"nwr['name']['name:{lang}']"
     if not area and not query:
         print('Missing overpass "area" or "query" option. See "write_osm_objects_report --help" for details.')
         exit()
+    if shards > 1 and shard_by == 'grid' and not coords:
+        print('Sharding by grid requires the "--coords" option. See "write_osm_objects_report --help" for details.')
+        exit()
     result = lt.get_overpass_result(area=area, filters=filters, coords=coords, query=query)
-    n_objects = len(result.nodes) + len(result.ways) + len(result.relations)
+    index = ObjectIndex(result)
+    n_objects = len(index)
     print('######################################################')
-    print(f'{str(n_objects)} objects found ({str(len(result.nodes))} nodes, {str(len(result.ways))}'
-          f' ways and {str(len(result.relations))} relations).')
+    print(index.summary())
     print('######################################################')
 
-    wikidata_ids = []
-    for osm_object in result.nodes + result.ways + result.relations:
-        if 'wikidata' in osm_object.tags.keys():
-            wikidata_ids.append(osm_object.tags['wikidata'])
-    wikidata_ids = list(dict.fromkeys(wikidata_ids))  # dict keys -> unique in the same order
-    db_wikidata_translations = wt.get_translations(ids=wikidata_ids, lang=lang)
+    wikidata_ids = list(index.by_wikidata.keys())
+    db_wikidata_translations = wt.get_translations_multilang(ids=wikidata_ids, langs=langs)
 
+    db_wikidata_type = None
     if wikidata_type:
         db_wikidata_type = wt.get_instance_type_from_wikidata(wikidata=wikidata_ids)
 
-    if output_format == 'csv':
-        header = ['typeOSM', 'idOSM', 'name', 'name:' + lang]
-    elif output_format == 'mediawiki':
-        header = ['OSMobject', 'typeOSM', 'idOSM', 'name', 'name:' + lang]
+    if output_format == 'mediawiki':
+        header = ['OSMobject', 'typeOSM', 'idOSM', 'name']
+    elif output_format in FORMATS:
+        header = ['typeOSM', 'idOSM', 'name']
     else:
-        raise ValueError('File format must be "csv" or "mediawiki".')
+        raise ValueError(f'File format must be one of {FORMATS}.')
+    header = header + ['name:' + x for x in langs]
 
     if extra_tags is not None:
         header = header + list(extra_tags)
-    header = header + ['translations', f'{lang}.wikipedia_page']
+    for x in langs:
+        header = header + ['translations' if len(langs) == 1 else f'{x}.translations', f'{x}.wikipedia_page']
     if wikidata_type:
         header = header + ['wikidata_type']
     header = header + ['wikidata_id', 'multilang_names', 'all_tags']
@@ -73,105 +188,42 @@ def write_osm_objects_reportcommand(area, coords, extra_tags, filters, lang, out
 
     if verbose > 0:
         print('HEADER: ', str(header))
-    db_osm = []
-    for osm_object in tqdm(result.nodes + result.ways + result.relations):
-        wikidata_id = ''
-        wikipedia_page = ''
-        translations = ''
-        if 'wikidata' in osm_object.tags.keys() and osm_object.tags['wikidata'] in db_wikidata_translations.keys():
-            wikidata_id = osm_object.tags['wikidata']
-            translations = db_wikidata_translations[osm_object.tags['wikidata']]
-            if translations['translations']:
-                if translations['translations']['wikipedia']:
-                    wikipedia_page = translations['translations']['wikipedia']['title']
-                translations['translations']['extra'] = None
-                translations = wt.list_translations(translations['translations'])
-                translations = list(dict.fromkeys(translations))  # unique keeping order
-                translations = ', '.join(translations)
-            else:
-                translations = ''
-        name = ''
-        if 'name' in osm_object.tags.keys():
-            name = osm_object.tags['name']
-        name_lang = ''
-        if 'name:' + lang in osm_object.tags.keys():
-            name_lang = osm_object.tags['name:' + lang]
-        names_tags = []
-        for key, value in osm_object.tags.items():
-            if key.startswith('name:') or key in ['int_name', 'loc_name', 'short_name', 'official_name']:
-                names_tags.append(key + '=' + value)
-        names_tags = ', '.join(names_tags)
-        extra_tags_values = dict()
-        if extra_tags:
-            for key in extra_tags:
-                tag_value = ''
-                if key in osm_object.tags.keys():
-                    tag_value = osm_object.tags[key]
-                extra_tags_values.update({key: tag_value})
-        wikidata_P31 = ''
-        if wikidata_type and 'wikidata' in osm_object.tags.keys():
-            if osm_object.tags['wikidata'] in db_wikidata_type.keys():
-                wikidata_P31 = db_wikidata_type[osm_object.tags['wikidata']]
-                wikidata_P31 = ', '.join(wikidata_P31)
-
-        if output_format == 'csv':
-            if wikimedia_urls:
-                if wikidata_id != '':
-                    wikidata_id = 'https://www.wikidata.org/wiki/' + wikidata_id
-                if wikipedia_page != '':
-                    wikipedia_page = f'https://{lang}.wikipedia.com/wiki/{wikipedia_page}'
-            object_data = [osm_object._type_value, osm_object.id]
-        elif output_format == 'mediawiki':
-            if wikidata_id != '':
-                wikidata_id = f'[https://www.wikidata.org/wiki/{wikidata_id} {wikidata_id}]'
-            if wikipedia_page != '':
-                wikipedia_page = f'[https://{lang}.wikipedia.com/wiki/{wikipedia_page} {wikipedia_page}]'
-            osm_object_str = '{{' + osm_object._type_value + '|' + str(osm_object.id) + '}}'
-            object_data = [osm_object_str, osm_object._type_value, osm_object.id]
-        else:
-            raise ValueError('File format must be "csv" or "mediawiki".')
-
-        object_data = object_data + [name, name_lang] + list(extra_tags_values.values()) + [translations, wikipedia_page]
-        if wikidata_type:
-            object_data = object_data + [wikidata_P31]
-        object_data = object_data + [wikidata_id, names_tags, str(osm_object.tags)]
-
-        if coords:
-            if osm_object._type_value == 'node':
-                object_data = object_data + [str(osm_object.lat), str(osm_object.lon)]
-            else:
-                object_data = object_data + [str(osm_object.center_lat), str(osm_object.center_lon)]
-
-        if verbose > 1:
-            print(object_data)
-
-        db_osm.append(object_data)
-
     table_name = f'Generated by write_osm_objects_report from LangToolsOSM {__version__} with parameters: lang={lang}, extra_tag={extra_tags_ori}, '
     if query:
         table_name = table_name + f'query={query}'
     else:
         table_name = table_name + f'area={area}, filters={filters}'
+    profiling.switch('report')
+    if shards > 1:
+        if shard_by == 'rows':
+            shard_of = shard_by_rows(n_objects, shards)
+        elif shard_by == 'grid':
+            shard_of = shard_by_grid([(x.lat, x.lon) if x._type_value == 'node' else (x.center_lat, x.center_lon)
+                                      for x in index.objects], shards)
+        else:
+            shard_of = shard_by_group([x.tags.get('wikidata') for x in index.objects], shards)
+        files = [shard_path(output, shard, shards) for shard in range(shards)]
+        table_names = [shard_title(table_name, shard, shards, shard_by) for shard in range(shards)]
+    else:
+        shard_of = [0] * n_objects
+        files = [output]
+        table_names = [table_name]
     try:
-        with open(output, mode='w', newline='') as f:
-            if output_format in 'csv':
-                writer = csv.writer(f, dialect='unix', delimiter='\t')
-                if table_name:
-                    writer.writerow(['# ' + table_name] + [''] * (len(header) - 1))
-                writer.writerow(header)
-                for row in db_osm:
-                    writer.writerow(row)
-            elif output_format in 'mediawiki':
-                writer = pytablewriter.MediaWikiTableWriter()
-                writer.stream = f
-                writer.headers = header
-                writer.table_name = table_name
-                matrix = []
-                for row in db_osm:
-                    matrix.append(row)
-                writer.value_matrix = matrix
-                writer.write_table()
-            else:
-                raise ValueError('File format must be "csv" or "mediawiki".')
+        with contextlib.ExitStack() as stack:
+            writers = [stack.enter_context(open_report(file, file_format=output_format, header=header, table_name=name))
+                       for file, name in zip(files, table_names)]
+            for osm_object, shard in zip(tqdm(index.objects), shard_of):
+                object_data = report_row(osm_object, langs=langs, output_format=output_format, extra_tags=extra_tags,
+                                         db_wikidata_translations=db_wikidata_translations, db_wikidata_type=db_wikidata_type,
+                                         wikimedia_urls=wikimedia_urls, coords=coords)
+                if verbose > 1:
+                    print(object_data)
+                writers[shard].writerow(object_data)
     except IOError:
         print('I/O error')
+    if shards > 1:
+        counts = collections.Counter(shard_of)
+        for shard, file in enumerate(files):
+            print(f'{file}: {counts[shard]} objects.')
+    if verbose > 1:
+        rate_limit.print_stats()